@@ -0,0 +1,268 @@
+"""
+Deviation alerts evaluated by the loader over the site x day rollups.
+
+Each rule watches one per-site daily measure (SITE_DAY_MEASURES) and
+fires on a site-day either when the value crosses a fixed threshold or
+when its z-score against the same site's previous ALERT_WINDOW_DAYS days
+does. Every site has one row per day from its first day in the rollups
+to the last day of any site (generate_series, the rollups LEFT JOINed
+on), so a day without rows counts: missed visits are 0 on it, and the
+averaged measures are NULL and left out of the baseline.
+
+    threshold   value <op> limit
+    zscore      (value - mean) / stddev of the window <op> limit,
+                once the window holds ALERT_MIN_HISTORY days
+
+and, if the rule has a minimum value, only when value >= minimum (so a
+single missed visit at a quiet site is not a "spike").
+
+Fired alerts are kept in the `alerts` table, one row per
+(rule, siteid, day), and served by /api/alerts.
+
+Evaluation is incremental. A delta load records the exact site-days of
+the rows it adds or replaces (touch), plus the days it adds to or drops
+from a site's day series, and only those site-days and the
+ALERT_WINDOW_DAYS after each, whose baselines they feed, are re-evaluated
+in the load's transaction. An alert that no longer holds is cleared and
+one that still holds keeps its raised_at. A full load re-evaluates
+everything. Backfill an existing database with:
+
+    python alerts.py --evaluate
+"""
+import argparse
+import os
+
+ALERT_WINDOW_DAYS = int(os.getenv("ALERT_WINDOW_DAYS", "28"))
+ALERT_MIN_HISTORY = int(os.getenv("ALERT_MIN_HISTORY", "7"))
+
+# measure -> (rollup table, value per site-day)
+SITE_DAY_MEASURES = {
+    "missed_visits": ("rollup_visits_site_day",
+                      "coalesce(sum(visits) FILTER (WHERE visitstatus = 'Missed'), 0)"),
+    "open_queries": ("rollup_quality_site_day", "sum(queries_open)"),
+    "completeness_pct": ("rollup_quality_site_day", "sum(completeness_sum) / nullif(sum(completeness_n), 0)"),
+    "timeliness": ("rollup_quality_site_day", "sum(timeliness_sum) / nullif(sum(timeliness_n), 0)"),
+}
+
+# rule -> (measure, kind, comparison, limit, severity, minimum value or None)
+RULES = {
+    "missed_visits_high": ("missed_visits", "threshold", ">=", 4, "critical", None),
+    "missed_visits_spike": ("missed_visits", "zscore", ">=", 3, "warning", 2),
+    "open_queries_high": ("open_queries", "threshold", ">", 8, "critical", None),
+    "open_queries_spike": ("open_queries", "zscore", ">=", 3, "warning", 4),
+    "completeness_low": ("completeness_pct", "threshold", "<", 70, "warning", None),
+    "timeliness_drop": ("timeliness", "zscore", "<=", -3, "warning", None),
+}
+
+# fact table -> its date column (the rollups are keyed by siteid, day)
+SOURCE_DAYS = {
+    "factvisits": "visitdate",
+    "factdataquality": "date",
+}
+
+ALERTS_DDL = """
+    CREATE TABLE IF NOT EXISTS alerts (
+        rule            text NOT NULL,
+        siteid          text NOT NULL,
+        day             date NOT NULL,
+        measure         text NOT NULL,
+        value           numeric,
+        limit_value     numeric NOT NULL,
+        baseline_mean   numeric,
+        baseline_stddev numeric,
+        zscore          numeric,
+        severity        text NOT NULL,
+        generation      bigint,
+        raised_at       timestamptz NOT NULL DEFAULT now(),
+        updated_at      timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY (rule, siteid, day)
+    );
+"""
+
+SCOPE_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS alert_scope (
+        siteid text NOT NULL,
+        day    date NOT NULL
+    ) ON COMMIT DROP;
+"""
+
+# each site's day series: its first day in the rollups .. the last day of any site
+SERIES_SQL = """
+    WITH days AS (SELECT siteid, day FROM rollup_visits_site_day
+                  UNION ALL SELECT siteid, day FROM rollup_quality_site_day)
+    SELECT siteid, min(day) AS first_day, (SELECT max(day) FROM days) AS last_day
+    FROM days GROUP BY siteid
+"""
+
+# the series as it was before the load's first touch
+BOUNDS_DDL = f"CREATE TEMP TABLE IF NOT EXISTS alert_bounds ON COMMIT DROP AS {SERIES_SQL};"
+
+# site-days that enter or leave a series between alert_bounds and alert_series
+SERIES_CHANGES_SQL = """
+    SELECT siteid, day FROM (
+        SELECT coalesce(n.siteid, o.siteid) AS siteid, n.first_day AS new_first, n.last_day AS new_last,
+               o.first_day AS old_first, o.last_day AS old_last,
+               least(n.first_day, o.first_day)
+                   + generate_series(0, greatest(n.last_day, o.last_day) - least(n.first_day, o.first_day)) AS day
+        FROM alert_series n
+        FULL JOIN alert_bounds o ON o.siteid = n.siteid
+        WHERE (n.first_day, n.last_day) IS DISTINCT FROM (o.first_day, o.last_day)
+    ) t
+    WHERE coalesce(day BETWEEN new_first AND new_last, false)
+          <> coalesce(day BETWEEN old_first AND old_last, false)
+"""
+
+
+def ensure_alerts(cur):
+    cur.execute(ALERTS_DDL)
+    cur.execute("CREATE INDEX IF NOT EXISTS alerts_day_idx ON alerts (day);")
+
+
+def touch(cur, fact, *relations):
+    """
+    Record the site-days of the rows in `relations` (copies of `fact`) for
+    evaluate(). Call it before the rows reach the rollups.
+    """
+    day = SOURCE_DAYS.get(fact)
+    if day is None:
+        return
+    rows = " UNION ALL ".join(f"SELECT siteid, {day} AS day FROM {r}" for r in relations)
+    cur.execute(SCOPE_DDL)
+    cur.execute(BOUNDS_DDL)
+    cur.execute(f"""
+        INSERT INTO alert_scope (siteid, day)
+        SELECT DISTINCT siteid, day FROM ({rows}) t
+        WHERE siteid IS NOT NULL AND day IS NOT NULL;
+    """)
+
+
+def _rule_sql(rule, measure, kind, op, limit, severity, minimum):
+    if kind == "zscore":
+        condition = f"z.history >= {ALERT_MIN_HISTORY} AND z.zscore {op} {limit}"
+    else:
+        condition = f"z.value {op} {limit}"
+    if minimum is not None:
+        condition += f" AND z.value >= {minimum}"
+    return f"""
+        SELECT '{rule}' AS rule, z.siteid, z.day, z.measure, round(z.value, 3) AS value,
+               {limit} AS limit_value, round(z.baseline_mean, 3) AS baseline_mean,
+               round(z.baseline_stddev, 3) AS baseline_stddev, round(z.zscore, 2) AS zscore,
+               '{severity}' AS severity
+        FROM zscored z
+        WHERE z.target AND z.measure = '{measure}' AND {condition}
+    """
+
+
+def evaluation_sql():
+    """SELECT of every firing (rule, siteid, day) for the target days in alert_days."""
+    daily = "\nUNION ALL\n".join(f"""
+        SELECT '{measure}' AS measure, d.siteid, d.day, d.target, CAST({expr} AS numeric) AS value
+        FROM alert_days d
+        LEFT JOIN {table} r ON r.siteid = d.siteid AND r.day = d.day
+        GROUP BY d.siteid, d.day, d.target
+    """ for measure, (table, expr) in SITE_DAY_MEASURES.items())
+    rules = "\nUNION ALL\n".join(_rule_sql(rule, *spec) for rule, spec in RULES.items())
+    return f"""
+        WITH daily AS ({daily}),
+        scored AS (
+            SELECT d.*,
+                   avg(value) OVER w AS baseline_mean,
+                   stddev_samp(value) OVER w AS baseline_stddev,
+                   count(value) OVER w AS history
+            FROM daily d
+            WINDOW w AS (PARTITION BY measure, siteid ORDER BY day
+                         RANGE BETWEEN interval '{ALERT_WINDOW_DAYS} days' PRECEDING AND interval '1 day' PRECEDING)
+        ),
+        zscored AS (
+            SELECT *, (value - baseline_mean) / nullif(baseline_stddev, 0) AS zscore FROM scored
+        )
+        {rules}
+    """
+
+
+def evaluate(cur, generation=None, full=False):
+    """
+    Re-evaluate the touched site-days (every site-day when full) and write
+    the outcome to `alerts`. Returns {"sites", "days", "firing", "raised",
+    "cleared"}: sites and site-days evaluated, alerts holding on them, new
+    ones, cleared ones.
+    """
+    cur.execute(SCOPE_DDL)
+    cur.execute(BOUNDS_DDL)
+    cur.execute(f"CREATE TEMP TABLE alert_series ON COMMIT DROP AS {SERIES_SQL};")
+    if full:
+        # every day of every series, all of them targets
+        cur.execute("""
+            CREATE TEMP TABLE alert_days ON COMMIT DROP AS
+            SELECT siteid, first_day + generate_series(0, last_day - first_day) AS day, true AS target
+            FROM alert_series;
+        """)
+        cur.execute("CREATE TEMP TABLE alert_targets ON COMMIT DROP AS SELECT siteid, day FROM alert_days;")
+    else:
+        # the changed days and the window after each (targets), in or out of the series now
+        cur.execute(f"""
+            CREATE TEMP TABLE alert_targets ON COMMIT DROP AS
+            SELECT DISTINCT c.siteid, c.day + k AS day
+            FROM (SELECT siteid, day FROM alert_scope UNION {SERIES_CHANGES_SQL}) c
+            CROSS JOIN generate_series(0, {ALERT_WINDOW_DAYS}) k;
+        """)
+        # the targets in the series and the baseline window before each
+        cur.execute(f"""
+            CREATE TEMP TABLE alert_days ON COMMIT DROP AS
+            SELECT t.siteid, t.day - k AS day, bool_or(k = 0) AS target
+            FROM alert_targets t
+            CROSS JOIN generate_series(0, {ALERT_WINDOW_DAYS}) k
+            JOIN alert_series s ON s.siteid = t.siteid AND t.day - k BETWEEN s.first_day AND s.last_day
+            GROUP BY t.siteid, t.day - k;
+        """)
+    cur.execute("SELECT count(DISTINCT siteid), count(*) FILTER (WHERE target) FROM alert_days;")
+    sites, days = cur.fetchone()
+    cur.execute(f"CREATE TEMP TABLE alert_eval ON COMMIT DROP AS {evaluation_sql()};")
+
+    if full:
+        cur.execute("DELETE FROM alerts a WHERE NOT EXISTS "
+                    "(SELECT 1 FROM alert_eval e WHERE (e.rule, e.siteid, e.day) = (a.rule, a.siteid, a.day));")
+    else:
+        cur.execute("""
+            DELETE FROM alerts a USING alert_targets t
+            WHERE a.siteid = t.siteid AND a.day = t.day
+              AND NOT EXISTS (SELECT 1 FROM alert_eval e
+                              WHERE (e.rule, e.siteid, e.day) = (a.rule, a.siteid, a.day));
+        """)
+    cleared = cur.rowcount
+    cur.execute("""
+        INSERT INTO alerts (rule, siteid, day, measure, value, limit_value,
+                            baseline_mean, baseline_stddev, zscore, severity, generation)
+        SELECT rule, siteid, day, measure, value, limit_value,
+               baseline_mean, baseline_stddev, zscore, severity, %s
+        FROM alert_eval
+        ON CONFLICT (rule, siteid, day) DO UPDATE SET
+            measure = EXCLUDED.measure, value = EXCLUDED.value, limit_value = EXCLUDED.limit_value,
+            baseline_mean = EXCLUDED.baseline_mean, baseline_stddev = EXCLUDED.baseline_stddev,
+            zscore = EXCLUDED.zscore, severity = EXCLUDED.severity,
+            generation = EXCLUDED.generation, updated_at = now()
+        RETURNING (xmax = 0) AS inserted;
+    """, (generation,))
+    outcome = [r[0] for r in cur.fetchall()]
+    cur.execute("DROP TABLE alert_eval, alert_days, alert_targets, alert_series, alert_bounds;")
+    cur.execute("TRUNCATE alert_scope;")
+    return {"sites": sites, "days": days, "firing": len(outcome), "raised": sum(outcome), "cleared": cleared}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the deviation alert rules")
+    parser.add_argument("--evaluate", action="store_true", help="re-evaluate every site-day from the rollups")
+    args = parser.parse_args()
+
+    if args.evaluate:
+        from database import get_connection
+
+        conn = get_connection()
+        try:
+            with conn.cursor() as cur:
+                ensure_alerts(cur)
+                report = evaluate(cur, full=True)
+            conn.commit()
+        finally:
+            conn.close()
+        print("alerts:", report)
@@ -0,0 +1,187 @@
+"""
+Batch KPI resolution: many named metrics in one request and one SQL statement.
+
+METRICS is the registry of metric ids ("<page>.<name>", the keys the
+combined endpoints use) covering every dashboard view except the patient
+detail table, which is only read a page at a time (/api/adherence/patient-details)
+or streamed (/api/export/patient-details). A batch request is deduplicated
+by view, then every view that misses the result cache is read by a single
+statement:
+
+    SELECT 'v_exec_kpis' AS metric, (SELECT json_agg(t) FROM (<view query>) t)::text AS data
+    UNION ALL
+    SELECT 'v_site_patients_bar', (SELECT json_agg(t) FROM (<view query>) t)::text
+    ...
+
+Each <view query> comes from filters.view_query, so snapshots, rollups
+and dashboard filters apply exactly as on the individual endpoints. The
+per-view results are cached under their own keys, so a later batch with
+a different mix of metrics reuses them.
+
+Values are the raw view rows (numbers as JSON numbers, dates as ISO
+strings): "row" metrics return the first row (or null), "rows" metrics
+the list.
+"""
+import asyncio
+import json
+import time
+
+from fastapi import HTTPException
+
+import database
+from cache import result_cache
+from filters import view_query
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+# metric id -> (view, shape, ORDER BY or None)
+METRICS = {
+    "exec.kpis": ("v_exec_kpis", "row", None),
+    "exec.enrollment_gauge": ("v_exec_enrollment_gauge", "row", None),
+    "exec.visit_status": ("v_exec_visitstatus_donut", "row", None),
+    "exec.enrollment_trend": ("v_exec_enrollment_trend", "rows", None),
+
+    "siteanalysis.total_active_sites": ("v_site_total_active", "row", None),
+    "siteanalysis.avg_patients_per_site": ("v_site_avg_patients", "row", None),
+    "siteanalysis.top_performer": ("v_site_top_performer", "row", None),
+    "siteanalysis.least_performer": ("v_site_least_performer", "row", None),
+    "siteanalysis.patients_bar": ("v_site_patients_bar", "rows", None),
+    "siteanalysis.missed_visits": ("v_site_missed_visits", "rows", None),
+    "siteanalysis.rescheduled_visits": ("v_site_rescheduled_visits", "rows", None),
+    "siteanalysis.gender_distribution": ("pa_site_gender_distribution", "rows", None),
+    "siteanalysis.age_distribution": ("v_pa_bucket_active_patients", "rows", None),
+    "siteanalysis.adherence_distribution": ("v_pa_site_adherence_distribution", "rows", None),
+
+    "adherence.active": ("v_pa_active_patient", "row", None),
+    "adherence.dropout_rate": ("v_pa_dropout_rate", "row", None),
+    "adherence.adherence_rate": ("v_pa_adherence_rate", "row", None),
+    "adherence.non_adherence_rate": ("v_pa_non_adherence_rate", "row", None),
+    "adherence.pending_rate": ("v_pa_pending_rate", "row", None),
+    "adherence.categories": ("v_pa_adherence_category", "rows", None),
+    "adherence.dropout_trend": ("v_pa_dropout_trend", "rows", "month_name"),
+
+    "trialjourney.kpis": ("v_kpi1", "row", None),
+    "trialjourney.screening_results": ("tj_screenresult", "rows", None),
+    "trialjourney.screening_failure_reasons": ("tj_screenfailurreason", "rows", None),
+    "trialjourney.screening_sources": ("tj_screensource", "rows", None),
+    "trialjourney.ediary_submission": ("tj_ediary_submission", "rows", None),
+    "trialjourney.weekly_visits": ("tj_weekly_site_visits", "rows", None),
+    "trialjourney.ae_category_distribution": ("tj_category_distribution_site", "rows", None),
+    "trialjourney.ae_count_summary": ("tj_ae_count", "rows", None),
+
+    "operationalmetrics.main_kpis": ("om_kpi2", "row", None),
+    "operationalmetrics.query_completeness": ("om_querycompleteness", "rows", None),
+    "operationalmetrics.medication_take_percent": ("om_medicationtakepercent", "rows", None),
+    "operationalmetrics.timeliness": ("tj_timeliness", "rows", None),
+    "operationalmetrics.randomized_stats": ("tj_randomizedflag", "rows", None),
+    "operationalmetrics.comprehensive_table": ("tj_table", "rows", None),
+}
+
+
+def _loads(text):
+    if text is None:
+        return []
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def _json_rows(relation: str):
+    """Aggregate expression turning every row of `relation` into one JSON array."""
+    if database.DB_MODE == "embedded":
+        return f"to_json(list({relation}))"  # DuckDB has no json_agg
+    return f"json_agg({relation})"
+
+
+def combined_sql(queries: dict):
+    """One UNION ALL statement for {view: (sql, params)}; returns (sql, params)."""
+    parts, params = [], []
+    for view, (sql, view_params) in queries.items():
+        inner = sql.strip().rstrip(";")
+        parts.append(f"SELECT '{view}' AS metric, (SELECT {_json_rows('t')} FROM ({inner}) t)::text AS data")
+        params.extend(view_params or ())
+    return "\nUNION ALL\n".join(parts) + ";", tuple(params)
+
+
+class _Batch:
+    """
+    Collects the cache misses of one request and reads them with as few
+    statements as possible. Each miss registers from its own result_cache
+    loader, so single-flight and invalidation work per view as for any
+    other query.
+
+    A run reads every miss registered when it starts. A miss that
+    registers after that (its loader ran late) is not in that run's
+    result; it starts the next run instead, together with any other late
+    misses, so every registered view is read exactly once.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self._task = None
+        self.statements = 0
+
+    async def load(self, view, sql, params):
+        self.pending[view] = (sql, params)
+        while True:
+            if self._task is None:
+                self._task = asyncio.ensure_future(self._run())
+            task = self._task
+            result = await asyncio.shield(task)
+            if view in result:
+                return result[view]
+            if self._task is task:
+                self._task = None  # registered after this run started: the next run reads it
+
+    async def _run(self):
+        await asyncio.sleep(0)  # let the other misses of this batch register first
+        queries, self.pending = self.pending, {}
+        sql, params = combined_sql(queries)
+        self.statements += 1
+        rows = await database.fetch_all(sql, params, cached=False)
+        return {r["metric"]: _loads(r["data"]) for r in rows}
+
+
+def resolve_ids(metric_ids):
+    """Deduplicated metric ids in request order; 400 on an unknown id."""
+    ids = list(dict.fromkeys(metric_ids))
+    unknown = [m for m in ids if m not in METRICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metric(s): {', '.join(unknown)}")
+    return ids
+
+
+async def fetch_metrics(metric_ids, filters=None):
+    """
+    ({metric id: value}, stats) for the given metric ids. stats has the
+    number of views read, SQL statements run and elapsed milliseconds.
+    """
+    started = time.perf_counter()
+    ids = resolve_ids(metric_ids)
+    views = {}
+    for metric in ids:
+        view, _, order = METRICS[metric]
+        if view not in views:
+            sql, params = await view_query(view, filters)
+            if order:
+                sql = f"SELECT * FROM ({sql.strip().rstrip(';')}) o ORDER BY {order};"
+            views[view] = (sql, params)
+
+    batch = _Batch()
+
+    async def cached(view, sql, params):
+        key = result_cache.make_key(sql, params, view) + ("json",)
+        return await result_cache.get_or_load_async(key, lambda: batch.load(view, sql, params))
+
+    names = list(views)
+    loaded = await asyncio.gather(*(cached(view, *views[view]) for view in names))
+    rows = dict(zip(names, loaded))
+
+    results = {}
+    for metric in ids:
+        view, shape, _ = METRICS[metric]
+        results[metric] = (rows[view][0] if rows[view] else None) if shape == "row" else rows[view]
+    stats = {"views": len(views), "statements": batch.statements,
+             "ms": round((time.perf_counter() - started) * 1000, 1)}
+    return results, stats
@@ -0,0 +1,84 @@
+"""
+Encode-time benchmark for the /api/operationalmetrics/complete_data payload.
+
+Compares FastAPI's default path (jsonable_encoder + stdlib json, what
+JSONResponse does) with responses.FastJSONResponse on a synthetic payload
+shaped like the real one: RealDictRow rows full of Decimal and date values.
+
+    python benchmarks/bench_serialization.py [--sites 50] [--repeat 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from psycopg2.extras import RealDictRow  # noqa: E402
+
+from responses import FastJSONResponse, orjson  # noqa: E402
+
+
+def row(**values):
+    r = RealDictRow()
+    r.update(values)
+    return r
+
+
+def complete_data_payload(sites: int, days: int):
+    rnd = random.Random(42)
+    dec = lambda: Decimal(f"{rnd.uniform(0, 100):.2f}")  # noqa: E731
+    names = [f"Site {i:03d}" for i in range(sites)]
+    start = date(2025, 1, 1)
+    return {
+        "main_kpis": row(total_queries=rnd.randint(1000, 9000), closed_queries=812, open_queries=96,
+                         avg_query_completeness=dec(), avg_resolutontime=dec()),
+        "query_completeness": [row(s_sitename=n, day=start + timedelta(d), avg_querycompleteness=dec())
+                               for n in names for d in range(days)],
+        "medication_take_percent": [row(s_sitename=n, avg_medication_take_percent=dec()) for n in names],
+        "timeliness": [row(s_sitename=n, day=start + timedelta(d), avg_timeliness=dec())
+                       for n in names for d in range(days)],
+        "randomized_stats": [row(s_sitename=n, randomized=rnd.randint(0, 900), no_randomized=rnd.randint(0, 90))
+                             for n in names],
+        "comprehensive_table": [row(s_sitename=n, randomized=10, no_randomized=2, avg_medication_take_percent=dec(),
+                                    avg_querycompleteness=dec(), avg_timeliness=dec()) for n in names],
+    }
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=50)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    payload = complete_data_payload(args.sites, args.days)
+    baseline = lambda: JSONResponse(jsonable_encoder(payload)).body  # noqa: E731
+    fast = lambda: FastJSONResponse(payload).body  # noqa: E731
+
+    size = len(fast())
+    base_ms, _ = timed(baseline, args.repeat)
+    fast_ms, _ = timed(fast, args.repeat)
+    print(f"payload: {args.sites} sites x {args.days} days, {size / 1024:.1f} KiB")
+    print(f"jsonable_encoder + json : {base_ms:8.2f} ms (median of {args.repeat})")
+    print(f"FastJSONResponse ({'orjson' if orjson else 'stdlib'}): {fast_ms:8.2f} ms")
+    print(f"speed-up                : {base_ms / fast_ms:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Synthetic, scaled copy of the Dataset/ star schema for load testing.
+
+Writes the same CSV files (names, columns, date formats) as Dataset/ with
+value distributions taken from the real extract, so ingest.py loads them
+unchanged and every view sees realistic data. The real extract is about
+4 sites, 2.8k patients, 5k visits and one data-quality row per site-day.
+
+    python benchmarks/generate_dataset.py --scale 25 --out /tmp/bench-data --load
+    python benchmarks/generate_dataset.py --sites 100 --visits 5000000 --out /tmp/bench-data
+
+--load bulk-loads the result into the database configured in .env /
+DB_* (see ingest.py), replacing what is there.
+"""
+import argparse
+import csv
+import os
+import random
+import shutil
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import DEFAULT_DATASET, TABLES  # noqa: E402
+
+BASE_SITES = 4
+BASE_PATIENTS_PER_SITE = 708
+VISITS_PER_PATIENT = 1.77
+STUDY_START = date(2025, 1, 1)
+ENROLLMENT_DAYS = 243  # enrollment / screening / data quality run Jan..Aug
+
+REGIONS = ["North India", "South India", "East India", "West India", "Central India", "North-East India"]
+AGE_BUCKETS = [("0-5", 21), ("20-Jun", 135), ("21-35", 1290), ("36-50", 849), ("51-65", 409), ("66+", 126)]
+SEXES = [("Female", 1367), ("Male", 1351), ("Other", 112)]
+SCREEN_FAILURES = ["Consent Withdrawn", "Medical History Exclusion", "Inclusion Criteria Not Met", "Lab Abnormality"]
+ADVERSE_EVENTS = ["Fatigue", "Nausea", "Headache", "Dizziness", "Rash"]
+
+
+def _weighted(rnd, choices):
+    values, weights = zip(*choices)
+    return rnd.choices(values, weights)[0]
+
+
+def _mdy(d):
+    return f"{d.month}/{d.day}/{d.year}" if d else ""
+
+
+def _iso(d):
+    return d.isoformat() if d else ""
+
+
+def _writer(out_dir, table):
+    f = open(os.path.join(out_dir, TABLES[table][0]), "w", newline="", encoding="utf-8")
+    return f, csv.writer(f)
+
+
+def generate(out_dir, sites, patients, visits, seed=42, log=print):
+    """Write every CSV into out_dir. Returns {table: rows written}."""
+    rnd = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {}
+    site_ids = [f"S{i:03d}" for i in range(1, sites + 1)]
+
+    f, w = _writer(out_dir, "dimsite")
+    w.writerow(["SiteID", "S_SiteName", "S_Region", "Site_TargetEnrollment", "S_PI_Name", "S_Site_Manager_Email"])
+    target = max(round(patients / sites * 2.8), 1)
+    for i, site in enumerate(site_ids):
+        w.writerow([site, f"Site {site}", REGIONS[i % len(REGIONS)], target, f"Dr. PI {site}",
+                    f"site.manager@{site.lower()}.example.org"])
+    f.close()
+    counts["dimsite"] = sites
+
+    # DimVisitType is a fixed lookup: copy it byte for byte (it is Windows-1252)
+    shutil.copyfile(os.path.join(DEFAULT_DATASET, TABLES["dimvisittype"][0]),
+                    os.path.join(out_dir, TABLES["dimvisittype"][0]))
+    counts["dimvisittype"] = 5
+
+    enrollment = {}  # patientpk -> (site, enrollment date)
+    files = {t: _writer(out_dir, t) for t in ("dimpatient", "factenrollment", "factscreeningenrollment")}
+    files["dimpatient"][1].writerow(["PatientPK", "PseudonymID", "Sex", "DOB", "AgeBucket", "EnrollmentDate",
+                                     "RandomizationDate", "SiteID"])
+    files["factenrollment"][1].writerow(["PatientPK", "SiteID", "EnrollmentDate", "RandomizedFlag",
+                                         "RandomizationDate"])
+    files["factscreeningenrollment"][1].writerow(["PatientPK", "SiteID", "ScreeningDate", "ScreenResult",
+                                                  "ReasonForFailure", "SourceCRF"])
+    for pk in range(1, patients + 1):
+        site = site_ids[(pk - 1) % sites]
+        enrolled = STUDY_START + timedelta(days=rnd.randrange(ENROLLMENT_DAYS))
+        randomized = enrolled + timedelta(days=rnd.randint(1, 10)) if rnd.random() < 0.6 else None
+        dob = date(rnd.randint(1950, 2005), rnd.randint(1, 12), rnd.randint(1, 28))
+        files["dimpatient"][1].writerow([pk, f"PAT{pk:04d}", _weighted(rnd, SEXES), _mdy(dob),
+                                         _weighted(rnd, AGE_BUCKETS), _mdy(enrolled), _mdy(randomized), site])
+        files["factenrollment"][1].writerow([pk, site, _iso(enrolled), int(randomized is not None),
+                                             _iso(randomized)])
+        failed = rnd.random() < 0.143
+        files["factscreeningenrollment"][1].writerow([
+            pk, site, _iso(STUDY_START + timedelta(days=rnd.randrange(ENROLLMENT_DAYS))),
+            "Failed" if failed else "Passed", rnd.choice(SCREEN_FAILURES) if failed else "Eligible",
+            f"CRF_SCREEN_V{rnd.randint(1, 3)}",
+        ])
+        enrollment[pk] = (site, enrolled)
+    for f, _ in files.values():
+        f.close()
+    counts.update(dimpatient=patients, factenrollment=patients, factscreeningenrollment=patients)
+    log(f"wrote {sites:,} sites, {patients:,} patients")
+
+    f, w = _writer(out_dir, "factvisits")
+    w.writerow(["VisitID", "PatientPK", "SiteID", "VisitDate", "VisitStatus", "eDiarySubmitted",
+                "MedicationTakenPercent", "AE_Reported"])
+    width = max(len(str(visits)), 5)
+    for n in range(1, visits + 1):
+        pk = rnd.randint(1, patients)
+        site, enrolled = enrollment[pk]
+        visit_date = enrolled + timedelta(days=rnd.randint(3, 130))
+        status = rnd.random()
+        if status < 0.861:
+            status, diary, medication = "Completed", "Y" if rnd.random() < 0.774 else "N", rnd.randint(18, 100)
+        elif status < 0.928:
+            status, diary, medication = "Missed", "N", rnd.choice((0, 0, 0, 10))
+        else:
+            status, diary, medication = "Rescheduled", "N", 0
+        ae = rnd.choice(ADVERSE_EVENTS) if rnd.random() < 0.068 else "None"
+        w.writerow([f"V{n:0{width}d}", pk, site, _iso(visit_date), status, diary, medication, ae])
+        if n % 1_000_000 == 0:
+            log(f"  {n:,} visits")
+    f.close()
+    counts["factvisits"] = visits
+
+    f, w = _writer(out_dir, "factdataquality")
+    w.writerow(["SiteID", "Date", "QueryCount", "QueriesOpen", "DataCompletenessPct", "TimelinessScore"])
+    for day in range(ENROLLMENT_DAYS):
+        d = _iso(STUDY_START + timedelta(days=day))
+        for site in site_ids:
+            queries = rnd.randint(0, 10)
+            w.writerow([site, d, queries, rnd.randint(0, queries), f"{rnd.uniform(85, 100):.2f}",
+                        f"{rnd.uniform(5, 10):.2f}"])
+    f.close()
+    counts["factdataquality"] = ENROLLMENT_DAYS * sites
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier on sites, patients and visits")
+    parser.add_argument("--sites", type=int, help=f"number of sites (default {BASE_SITES} x scale)")
+    parser.add_argument("--patients", type=int, help="number of patients (default 708 per site)")
+    parser.add_argument("--visits", type=int, help=f"number of visits (default {VISITS_PER_PATIENT} per patient)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", required=True, help="directory to write the CSVs to")
+    parser.add_argument("--load", action="store_true", help="bulk-load the generated files into Postgres")
+    parser.add_argument("--refresh-snapshots", action="store_true", help="refresh materialized snapshots after --load")
+    args = parser.parse_args()
+
+    sites = args.sites or max(round(BASE_SITES * args.scale), 1)
+    patients = args.patients or sites * BASE_PATIENTS_PER_SITE
+    visits = args.visits or round(patients * VISITS_PER_PATIENT)
+
+    started = time.perf_counter()
+    counts = generate(args.out, sites, patients, visits, args.seed)
+    total = sum(counts.values())
+    print(f"generated {total:,} rows in {time.perf_counter() - started:.1f}s -> {args.out}")
+
+    if args.load:
+        import ingest
+
+        ingest.load_dataset(args.out)
+        if args.refresh_snapshots:
+            import snapshots
+            print("refreshed snapshots (ms):", snapshots.refresh_snapshots())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Load test: drive every dashboard endpoint at a fixed concurrency and report
+throughput and p50/p95/p99 latency per endpoint.
+
+Endpoints are discovered from the app's OpenAPI schema (every GET without
+path parameters; exports, the live stream and admin routes are skipped).
+Each endpoint gets --requests requests from --concurrency concurrent
+clients, one endpoint after another.
+
+By default the run is cold: the result cache, ETags and static snapshot
+serving are switched off, so every request runs its handler and queries.
+In-process runs set CACHE_ENABLED=0 ETAGS_ENABLED=0 STATIC_SERVE=0
+themselves; start a server the same way for --url runs. --warm leaves
+the layers as configured. The layers actually seen (from /health and the
+response headers) are printed and saved with the results.
+
+    # against a running server
+    python benchmarks/load_test.py --url http://localhost:8000 --concurrency 32 --requests 500
+    # in-process (no server; the app talks to the DB configured in .env / DB_*)
+    python benchmarks/load_test.py --in-process --concurrency 16
+
+    # measure the layers too (result cache, ETags, static snapshots)
+    python benchmarks/load_test.py --in-process --warm
+
+    # record a baseline, then fail (exit 1) if any p95 regresses by more than 25%
+    python benchmarks/load_test.py --url ... --save baseline.json
+    python benchmarks/load_test.py --url ... --compare baseline.json --max-regression 0.25
+
+Use benchmarks/generate_dataset.py to load a scaled dataset first.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SKIP_PREFIXES = ("/api/export", "/api/live", "/api/admin")
+# environment that switches off every layer that answers without running the handler
+COLD_ENV = {"CACHE_ENABLED": "0", "ETAGS_ENABLED": "0", "STATIC_SERVE": "0"}
+
+
+def discover(schema, only=None):
+    """GET paths from an OpenAPI schema, minus path-parameter routes and SKIP_PREFIXES."""
+    paths = []
+    for path, ops in schema["paths"].items():
+        if "get" not in ops or "{" in path or not path.startswith("/api") or path.startswith(SKIP_PREFIXES):
+            continue
+        if only and not any(word in path for word in only):
+            continue
+        paths.append(path)
+    return paths
+
+
+def percentile(samples, p):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[p - 1]
+
+
+async def server_layers(client):
+    """The server's result_cache / etags / static_serve switches from /health ({} if not reported)."""
+    try:
+        return (await client.get("/health")).json().get("layers", {})
+    except (httpx.HTTPError, ValueError):
+        return {}
+
+
+def response_layers(response):
+    """Layers that shaped one response, from its headers."""
+    seen = set()
+    if "etag" in response.headers:
+        seen.add("etags")
+    if "x-static-snapshot" in response.headers:
+        seen.add("static_serve")
+    return seen
+
+
+async def run_endpoint(client, path, requests, concurrency, query=""):
+    latencies, errors, layers = [], 0, set()
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await client.get(path + query)
+                ok = response.status_code < 400
+                layers.update(response_layers(response))
+            except httpx.HTTPError:
+                ok = False
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "layers": sorted(layers),
+    }
+
+
+async def run(args):
+    if args.in_process:
+        if not args.warm:
+            os.environ.update(COLD_ENV)  # read when the app modules are imported
+        from main import app
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                   timeout=args.timeout)
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+    else:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits)
+        lifespan = None
+
+    try:
+        schema = (await client.get("/openapi.json")).json()
+        paths = discover(schema, args.only)
+        query = f"?{args.query}" if args.query else ""
+        switches = await server_layers(client)
+        enabled = [name for name, on in switches.items() if on]
+        print(f"{'warm' if args.warm else 'cold'} run, layers on: "
+              f"{', '.join(enabled) or ('none' if switches else 'unknown (no layers in /health)')}")
+        if enabled and not args.warm:
+            print("WARNING: the server has layers on; restart it with "
+                  + " ".join(f"{k}={v}" for k, v in COLD_ENV.items()) + " for a cold run")
+        print(f"{len(paths)} endpoints, {args.requests} requests each, concurrency {args.concurrency}"
+              f"{' (' + args.query + ')' if args.query else ''}\n")
+        print(f"{'endpoint':<52} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}  layers")
+        results = {}
+        for path in paths:
+            for _ in range(args.warmup):
+                await client.get(path + query)
+            r = results[path] = await run_endpoint(client, path, args.requests, args.concurrency, query)
+            print(f"{path:<52} {r['rps']:>8} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['errors']:>7}"
+                  f"  {','.join(r['layers']) or '-'}")
+        return results
+    finally:
+        await client.aclose()
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+
+def compare(results, baseline, max_regression):
+    """Endpoints whose p95 grew by more than max_regression (a fraction) over the baseline."""
+    regressions = []
+    for path, r in results.items():
+        before = baseline.get(path)
+        if before and before["p95_ms"] > 0 and r["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append((path, before["p95_ms"], r["p95_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="base URL of a running API")
+    target.add_argument("--in-process", action="store_true", help="drive main:app directly over ASGI")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests per endpoint first")
+    parser.add_argument("--query", default="", help="query string added to every request, e.g. site_id=S001")
+    parser.add_argument("--only", action="append", help="only endpoints whose path contains this (repeatable)")
+    parser.add_argument("--warm", action="store_true",
+                        help="keep the result cache, ETags and static serving on (in-process runs)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--save", help="write the results as JSON (a baseline for --compare)")
+    parser.add_argument("--compare", help="baseline JSON from an earlier --save")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="allowed p95 growth vs the baseline")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    errors = sum(r["errors"] for r in results.values())
+    total = sum(r["requests"] for r in results.values())
+    print(f"\n{total:,} requests, {errors:,} errors")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for path, before, after in regressions:
+            print(f"REGRESSION {path}: p95 {before} ms -> {after} ms")
+        if regressions:
+            sys.exit(1)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from result_store import make_store
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") not in ("0", "false", "False")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+# how often a worker checks the shared store for invalidations made by other workers (0 = every read)
+CACHE_SHARED_SYNC_SECONDS = float(os.getenv("CACHE_SHARED_SYNC_SECONDS", "1"))
+
+_FROM_RE = re.compile(r"\bfrom\s+(?:public\.)?\"?([a-z_][a-z0-9_]*)", re.IGNORECASE)
+
+
+class ViewSQL(str):
+    """
+    SQL text labelled with the dashboard view it answers (filters.view_query
+    sets it). The label keys cache entries and metrics whatever the SQL
+    looks like: snapshot, rollup or a filtered WITH ... definition.
+    """
+
+    view = ""
+
+    def __new__(cls, sql: str, view: str):
+        labelled = super().__new__(cls, sql)
+        labelled.view = view.lower()
+        return labelled
+
+
+def view_name(sql: str):
+    """The view a query answers: its ViewSQL label, else the first relation ad-hoc SQL reads from."""
+    label = getattr(sql, "view", "")
+    if label:
+        return label
+    match = _FROM_RE.search(sql)
+    return match.group(1).lower() if match else ""
+
+
+class _Flight:
+    """One in-progress load that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL and single-flight loading.
+
+    Keys are (view, sql, params) tuples so entries can be dropped per view.
+    When several requests miss the same key at once only the first runs the
+    loader; the others wait for its result instead of hitting the database.
+    With a `shared` store (result_store.py) a local miss is looked up there
+    before loading, and loaded values are written back for other workers.
+    The store's generation counter is checked on reads (at most every
+    CACHE_SHARED_SYNC_SECONDS); when another worker has invalidated, this
+    worker's entries are dropped too.
+    """
+
+    def __init__(self, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, enabled=CACHE_ENABLED, shared=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._flights = {}              # key -> _Flight
+        self._async_flights = {}        # key -> asyncio.Future (async driver mode)
+        self._generation = 0            # bumped on invalidation so stale loads aren't stored
+        self._shared_generation = None  # the shared store's generation these entries belong to
+        self._synced_at = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(sql: str, params=None, view: str = None):
+        return (view or view_name(sql), " ".join(sql.split()), tuple(params) if params else ())
+
+    def get_or_load(self, key, loader):
+        if not self.enabled:
+            return loader()
+
+        self._sync_shared()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+                generation = self._generation
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = self._shared_load(key, loader, generation)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                if flight.error is None and generation == self._generation:
+                    self._store(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    async def get_or_load_async(self, key, loader):
+        """get_or_load for coroutine loaders; concurrent misses await one shared future."""
+        if not self.enabled:
+            return await loader()
+
+        self._sync_shared()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+            future = self._async_flights.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                future = self._async_flights[key] = asyncio.get_running_loop().create_future()
+                generation = self._generation
+                leader = True
+
+        if not leader:
+            return await asyncio.shield(future)
+
+        try:
+            value = await self._shared_load_async(key, loader, generation)
+        except BaseException as e:
+            with self._lock:
+                self._async_flights.pop(key, None)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        with self._lock:
+            self._async_flights.pop(key, None)
+            if generation == self._generation:
+                self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def _sync_shared(self):
+        """Drop every local entry when another worker has invalidated the shared store."""
+        if self.shared is None or time.monotonic() - self._synced_at < CACHE_SHARED_SYNC_SECONDS:
+            return
+        self._synced_at = time.monotonic()
+        generation = self.shared.generation()
+        if generation is None:
+            return
+        with self._lock:
+            if self._shared_generation is not None and generation != self._shared_generation:
+                self._generation += 1
+                self._entries.clear()
+            self._shared_generation = generation
+
+    def _shared_load(self, key, loader, generation):
+        if self.shared is None:
+            return loader()
+        hit, value = self.shared.get(key)
+        if hit:
+            return value
+        value = loader()
+        if generation == self._generation:
+            self.shared.set(key, value, self.ttl)
+        return value
+
+    async def _shared_load_async(self, key, loader, generation):
+        if self.shared is None:
+            return await loader()
+        hit, value = self.shared.get(key)
+        if hit:
+            return value
+        value = await loader()
+        if generation == self._generation:
+            self.shared.set(key, value, self.ttl)
+        return value
+
+    def _store(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, views=None):
+        """Drop every entry, or only those reading from the given views. Returns the count."""
+        shared_generation = self.shared.invalidate(views) if self.shared is not None else None
+        with self._lock:
+            if (shared_generation is not None and self._shared_generation is not None
+                    and shared_generation == self._shared_generation + 1):
+                self._shared_generation = shared_generation  # our own bump: nothing else to drop
+            self._generation += 1
+            if not views:
+                dropped = len(self._entries)
+                self._entries.clear()
+                return dropped
+            wanted = {v.lower() for v in views}
+            stale = [key for key in self._entries if key[0] in wanted]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "views": sorted({key[0] for key in self._entries}),
+                "shared": self.shared.stats() if self.shared is not None else None,
+            }
+
+
+# Process-wide cache for view query results
+result_cache = TTLCache(shared=make_store() if CACHE_ENABLED else None)
@@ -0,0 +1,60 @@
+"""
+Opt-in column-oriented responses for the chart endpoints.
+
+Clients ask for them with an Accept header (or ?format=columnar):
+
+    Accept: application/x-columnar+json       -> {"columns": [...], "data": [[...], ...]}
+    Accept: application/vnd.apache.arrow.stream -> Arrow IPC stream (needs pyarrow)
+
+Everything else keeps getting the usual list-of-row-objects JSON. Every
+representation of a negotiated route, row JSON included, is sent with
+Vary: Accept so shared caches keep them apart.
+"""
+from fastapi import Response
+
+from responses import dumps
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional dependency
+    pa = None
+
+COLUMNAR_JSON = "application/x-columnar+json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+def negotiate(request, response=None):
+    """
+    Return "arrow", "columns" or None (row objects) for this request, and
+    mark `response` (the route's injected Response) as varying on Accept.
+    """
+    if response is not None:
+        response.headers["Vary"] = "Accept"
+    accept = request.headers.get("accept", "")
+    if ARROW_STREAM in accept and pa is not None:
+        return "arrow"
+    if COLUMNAR_JSON in accept or request.query_params.get("format") in ("columnar", "columns"):
+        return "columns"
+    return None
+
+
+def _arrow_bytes(table: dict):
+    arrays = {name: pa.array(values) for name, values in zip(table["columns"], table["data"])}
+    batch = pa.table(arrays) if arrays else pa.table({})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_table(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def columnar_response(payload, fmt: str, headers: dict = None):
+    """
+    Build the response for a run_query_columns() table, or for a dict of
+    such tables (combined endpoints). Arrow IPC carries a single table, so
+    combined payloads are always sent as columnar JSON.
+    """
+    headers = {k: v for k, v in dict(headers or {}).items() if k.lower() != "vary"}
+    headers["Vary"] = "Accept"
+    if fmt == "arrow" and "columns" in payload:
+        return Response(content=_arrow_bytes(payload), media_type=ARROW_STREAM, headers=headers)
+    return Response(content=dumps(payload), media_type=COLUMNAR_JSON, headers=headers)
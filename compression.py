@@ -0,0 +1,136 @@
+"""
+Negotiated response compression (brotli when available, else gzip).
+
+Bodies smaller than minimum_size are sent as-is. Streaming responses
+(exports) are compressed chunk by chunk; responses that already carry a
+Content-Encoding, and event streams, pass through untouched.
+"""
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+SKIP_CONTENT_TYPES = ("text/event-stream",)
+
+
+def accepted_encodings(accept_encoding: str):
+    """Accept-Encoding -> {coding: q}, without the codings refused with q=0."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted[coding.lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str, available=("br", "gzip")):
+    """The accepted coding with the highest q among `available` (earlier wins ties), or None."""
+    accepted = accepted_encodings(accept_encoding)
+    candidates = [c for c in available if c in accepted and (c != "br" or brotli is not None)]
+    return max(candidates, key=lambda c: accepted[c], default=None)
+
+
+class _Compressor:
+    def __init__(self, encoding, gzip_level, brotli_quality):
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=brotli_quality)
+            self._flush = self._c.flush
+            self._finish = self._c.finish
+            self._compress = self._c.process
+        else:
+            self._c = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._flush = lambda: self._c.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._c.flush
+            self._compress = self._c.compress
+
+    def chunk(self, data: bytes):
+        return self._compress(data) + self._flush()
+
+    def finish(self):
+        return self._finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            start = state["start"]
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start is not None:
+                # first body message decides how the whole response is sent
+                state["start"] = None
+                response_headers = {k.decode("latin-1").lower(): v for k, v in start["headers"]}
+                content_type = response_headers.get("content-type", b"").decode("latin-1")
+                if ("content-encoding" in response_headers
+                        or content_type.startswith(SKIP_CONTENT_TYPES)
+                        or (not more_body and len(body) < self.minimum_size)):
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                new_headers = [(k, v) for k, v in start["headers"] if k.lower() not in (b"content-length", b"vary")]
+                vary = response_headers.get("vary", b"").decode("latin-1")
+                vary = ", ".join(filter(None, [vary, "Accept-Encoding"]))
+                new_headers += [(b"content-encoding", encoding.encode()), (b"vary", vary.encode("latin-1"))]
+
+                if not more_body:
+                    if encoding == "br":
+                        compressed = brotli.compress(body, quality=self.brotli_quality)
+                    else:
+                        compressed = gzip.compress(body, self.gzip_level)
+                    new_headers.append((b"content-length", str(len(compressed)).encode()))
+                    await send({**start, "headers": new_headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+
+                state["compressor"] = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                await send({**start, "headers": new_headers})
+
+            if state["passthrough"]:
+                await send(message)
+                return
+
+            compressor = state["compressor"]
+            data = compressor.chunk(body) if body else b""
+            if not more_body:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,14 +1,691 @@
+import asyncio
+import hashlib
 import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import psycopg2
+import psycopg2.errors
+from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+from cache import result_cache
 
 load_dotenv()  # loads .env file
 
+# --- Pool settings (all overridable from .env) ---
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+POOL_HEALTH_CHECK_AFTER = float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30"))
+
+# Max number of view queries the combined endpoints run at the same time
+FANOUT_CONCURRENCY = int(os.getenv("DB_FANOUT_CONCURRENCY", str(POOL_MAX_SIZE)))
+
+# Max number of streaming exports at the same time; each holds its own
+# connection (outside the pool) for the whole download
+EXPORT_MAX_CONCURRENT = int(os.getenv("DB_EXPORT_MAX_CONCURRENT", "4"))
+
+# "sync": psycopg2 pool, queries run in Starlette's threadpool (default).
+# "async": psycopg 3 AsyncConnectionPool, queries run on the event loop.
+# "embedded": no Postgres; DuckDB over the Dataset/ CSVs (see embedded.py).
+DB_MODE = os.getenv("DB_MODE", "sync").lower()
+ASYNC_POOL_MAX_SIZE = int(os.getenv("DB_ASYNC_POOL_MAX_SIZE", str(POOL_MAX_SIZE)))
+
+# Server-side prepared statements: every query is PREPAREd once per pooled
+# connection (at most DB_PREPARED_PER_CONNECTION, least recently used
+# first out) and EXECUTEd after that, so Postgres parses and plans it once.
+PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "1") not in ("0", "false", "False")
+PREPARED_PER_CONNECTION = int(os.getenv("DB_PREPARED_PER_CONNECTION", "256"))
+
+
 def get_connection():
+    """Open a new, unpooled connection (used by the pool and by scripts)."""
     return psycopg2.connect(
         host=os.getenv("DB_HOST", "localhost"),
         port=os.getenv("DB_PORT", "5432"),
         dbname=os.getenv("DB_NAME"),
         user=os.getenv("DB_USER"),
         password=os.getenv("DB_PASSWORD")
-    )
\ No newline at end of file
+    )
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the acquire timeout."""
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe psycopg2 connection pool.
+
+    Connections are health-checked when they have been idle for a while,
+    recycled once they pass max_lifetime, and callers wait at most
+    acquire_timeout seconds for a free slot.
+    """
+
+    def __init__(self, connect=get_connection, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 acquire_timeout=POOL_ACQUIRE_TIMEOUT, max_lifetime=POOL_MAX_LIFETIME,
+                 health_check_after=POOL_HEALTH_CHECK_AFTER):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+
+        self._cond = threading.Condition()
+        self._idle = []          # list of (conn, created_at, last_used_at)
+        self._created = {}       # id(conn) -> created_at, for every open connection
+        self._closed = False
+
+        # metrics
+        self._waiting = 0
+        self._acquired_total = 0
+        self._timeouts_total = 0
+        self._wait_seconds_total = 0.0
+        self._wait_seconds_max = 0.0
+        self._recycled_total = 0
+        self._failed_checks_total = 0
+
+    # --- connection lifecycle ---
+    def _open(self):
+        conn = self._connect()
+        conn.autocommit = True  # dashboard reads never need an open transaction
+        return conn
+
+    def _forget(self, conn):
+        """Drop conn from the bookkeeping (caller holds the lock); close it outside the lock."""
+        self._created.pop(id(conn), None)
+        self._cond.notify()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, created_at, now):
+        return self.max_lifetime > 0 and now - created_at >= self.max_lifetime
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            return True
+        except Exception:
+            return False
+
+    def _take(self, deadline, timeout):
+        """
+        Under the lock: pop an idle connection, or reserve a slot for a new
+        one. Returns (idle entry or None, placeholder or None, connections to
+        close). Waits until one of the two is possible or the deadline passes.
+        """
+        expired = []
+        with self._cond:
+            if self._closed:
+                raise PoolTimeout("connection pool is closed")
+            self._waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    while self._idle:
+                        entry = self._idle.pop()
+                        if self._expired(entry[1], now):
+                            self._recycled_total += 1
+                            self._forget(entry[0])
+                            expired.append(entry[0])
+                            continue
+                        return entry, None, expired
+
+                    if len(self._created) < self.max_size:
+                        # reserve the slot before connecting outside the lock
+                        placeholder = object()
+                        self._created[id(placeholder)] = now
+                        return None, placeholder, expired
+
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._timeouts_total += 1
+                        break
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+        for conn in expired:
+            self._close(conn)
+        raise PoolTimeout(
+            f"timed out after {timeout:.1f}s waiting for a database connection "
+            f"(pool max_size={self.max_size})"
+        )
+
+    def acquire(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            entry, placeholder, expired = self._take(deadline, timeout)
+            # closing and health checks are network I/O: done without the lock,
+            # so other acquirers and releasers are never queued behind them
+            for conn in expired:
+                self._close(conn)
+            if placeholder is not None:
+                break
+            conn, _, last_used = entry
+            if not conn.closed and (time.monotonic() - last_used < self.health_check_after or self._healthy(conn)):
+                with self._cond:
+                    return self._checked_out(conn, started)
+            with self._cond:
+                self._failed_checks_total += 1
+                self._forget(conn)
+            self._close(conn)
+
+        try:
+            conn = self._open()
+        except Exception:
+            with self._cond:
+                self._created.pop(id(placeholder), None)
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created.pop(id(placeholder), None)
+            self._created[id(conn)] = time.monotonic()
+            return self._checked_out(conn, started)
+
+    def _checked_out(self, conn, started):
+        waited = time.monotonic() - started
+        self._acquired_total += 1
+        self._wait_seconds_total += waited
+        self._wait_seconds_max = max(self._wait_seconds_max, waited)
+        metrics.acquire_wait.observe(waited)
+        return conn
+
+    def release(self, conn, discard=False):
+        close = True
+        with self._cond:
+            created_at = self._created.get(id(conn))
+            now = time.monotonic()
+            if created_at is None:
+                pass  # not ours (or already discarded) - just close it
+            elif discard or self._closed or conn.closed or self._expired(created_at, now):
+                if not discard and not conn.closed and self._expired(created_at, now):
+                    self._recycled_total += 1
+                self._forget(conn)
+            else:
+                self._idle.append((conn, created_at, now))
+                close = False
+            self._cond.notify()
+        if close:
+            self._close(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.release(conn, discard=broken or conn.closed)
+
+    def fill(self):
+        """Open connections up to min_size (called at startup)."""
+        with self._cond:
+            missing = self.min_size - len(self._created)
+        conns = [self.acquire() for _ in range(max(missing, 0))]
+        for conn in conns:
+            self.release(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            for conn, _, _ in idle:
+                self._created.pop(id(conn), None)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            size = len(self._created)
+            idle = len(self._idle)
+            return {
+                "size": size,
+                "idle": idle,
+                "in_use": size - idle,
+                "max_size": self.max_size,
+                "waiting": self._waiting,
+                "acquired_total": self._acquired_total,
+                "timeouts_total": self._timeouts_total,
+                "recycled_total": self._recycled_total,
+                "failed_health_checks_total": self._failed_checks_total,
+                "wait_seconds_total": round(self._wait_seconds_total, 6),
+                "wait_seconds_max": round(self._wait_seconds_max, 6),
+            }
+
+
+# --- Process-wide pool (created lazily so forked workers each get their own) ---
+_pool = None
+_executor = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def close_pool():
+    global _pool, _executor
+    with _pool_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+def pool_stats():
+    if DB_MODE == "embedded":
+        import embedded
+        return embedded.stats()
+    stats = get_pool().stats() if _pool is not None else {"size": 0, "idle": 0, "in_use": 0, "max_size": POOL_MAX_SIZE}
+    if _async_pool is not None:
+        stats = {"sync": stats, "async": _async_pool.get_stats()}
+    return stats
+
+
+@contextmanager
+def connection(timeout=None):
+    """Borrow a pooled connection for the duration of a with-block."""
+    with get_pool().connection(timeout) as conn:
+        yield conn
+
+
+# connection -> OrderedDict(sql -> statement name, or None if it can't be prepared)
+_prepared = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+_PLACEHOLDER_RE = re.compile(r"%(s|%)")
+
+
+def _numbered(sql):
+    """psycopg2 placeholders (%s, %%) -> PREPARE syntax ($1, $2, ..., %)."""
+    counter = iter(range(1, 10000))
+    return _PLACEHOLDER_RE.sub(lambda m: f"${next(counter)}" if m.group(1) == "s" else "%", sql)
+
+
+def _prepare(cur, conn, sql, has_params):
+    """Statement name for `sql` on this connection, PREPAREd on first use (None if it can't be)."""
+    with _prepared_lock:
+        statements = _prepared.setdefault(conn, OrderedDict())
+    if sql in statements:
+        statements.move_to_end(sql)
+        return statements[sql]
+    name = "dash_" + hashlib.sha1(sql.encode()).hexdigest()[:20]
+    text = (_numbered(sql) if has_params else sql).strip().rstrip(";")
+    try:
+        cur.execute(f"PREPARE {name} AS {text}")
+    except (psycopg2.errors.IndeterminateDatatype, psycopg2.errors.AmbiguousParameter):
+        name = None  # a parameter type Postgres can't infer: always run it as plain text
+    except psycopg2.Error:
+        return None  # e.g. the relation doesn't exist yet: the plain query reports it
+    statements[sql] = name
+    while len(statements) > PREPARED_PER_CONNECTION:
+        _, evicted = statements.popitem(last=False)
+        if evicted:
+            cur.execute(f"DEALLOCATE {evicted};")
+    return name
+
+
+def _run(conn, cur, sql, params):
+    """cur.execute(sql, params), through a prepared statement when enabled."""
+    if not PREPARED_STATEMENTS or not conn.autocommit:
+        cur.execute(sql, params or ())
+        return
+    name = _prepare(cur, conn, sql, bool(params))
+    if name is None:
+        cur.execute(sql, params or ())
+        return
+    try:
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))});", params)
+        else:
+            cur.execute(f"EXECUTE {name};")
+    except (psycopg2.errors.FeatureNotSupported, psycopg2.errors.InvalidSqlStatementName):
+        # the view's shape changed under the plan ("cached plan must not change result type")
+        _prepared.get(conn, {}).pop(sql, None)
+        try:
+            cur.execute(f"DEALLOCATE {name};")
+        except psycopg2.Error:
+            pass
+        cur.execute(sql, params or ())
+
+
+def prepare_on_idle_connections(statements):
+    """PREPARE the given SQL texts on every open pooled connection (startup warm-up)."""
+    if DB_MODE != "sync" or not PREPARED_STATEMENTS:
+        return 0
+    pool = get_pool()
+    pool.fill()
+    conns = [pool.acquire() for _ in range(max(pool.stats()["idle"], 1))]
+    prepared = 0
+    try:
+        for conn in conns:
+            with conn.cursor() as cur:
+                for sql, params in statements:
+                    prepared += _prepare(cur, conn, sql, bool(params)) is not None
+    finally:
+        for conn in conns:
+            pool.release(conn)
+    return prepared
+
+
+def _execute(sql, params):
+    if DB_MODE == "embedded":
+        import embedded
+        started = time.perf_counter()
+        rows = embedded.execute(sql, params)
+        metrics.record_query(sql, params, time.perf_counter() - started, len(rows), DB_MODE)
+        return rows
+    with connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            started = time.perf_counter()
+            _run(conn, cur, sql, params)
+            rows = cur.fetchall()
+            metrics.record_query(sql, params, time.perf_counter() - started, len(rows), DB_MODE)
+            return rows
+
+
+def run_query(sql: str, params: tuple = None, cached: bool = True):
+    """
+    Helper to run a SQL query and return list[dict].
+    Results are memoized in cache.result_cache unless cached=False; treat
+    the returned rows as read-only since other requests share them.
+    """
+    if not cached:
+        return _execute(sql, params)
+    key = result_cache.make_key(sql, params)
+    return result_cache.get_or_load(key, lambda: _execute(sql, params))
+
+
+def _execute_columns(sql, params):
+    if DB_MODE == "embedded":
+        import embedded
+        started = time.perf_counter()
+        result = embedded.execute_columns(sql, params)
+        rows = len(result["data"][0]) if result["data"] else 0
+        metrics.record_query(sql, params, time.perf_counter() - started, rows, DB_MODE)
+        return result
+    with connection() as conn:
+        with conn.cursor() as cur:
+            started = time.perf_counter()
+            _run(conn, cur, sql, params)
+            rows = cur.fetchall()
+            metrics.record_query(sql, params, time.perf_counter() - started, len(rows), DB_MODE)
+            columns = [col.name for col in cur.description]
+    # transpose the row tuples directly; no per-row dicts are built
+    data = [list(values) for values in zip(*rows)] if rows else [[] for _ in columns]
+    return {"columns": columns, "data": data}
+
+
+def run_query_columns(sql: str, params: tuple = None):
+    """
+    Like run_query, but column-oriented: {"columns": [names], "data": [[values of column 0], ...]}.
+    Cached separately from the row-oriented results of the same query.
+    """
+    key = result_cache.make_key(sql, params) + ("columns",)
+    return result_cache.get_or_load(key, lambda: _execute_columns(sql, params))
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=FANOUT_CONCURRENCY, thread_name_prefix="db-fanout")
+    return _executor
+
+
+def _timed_query(sql, params, columnar=False):
+    started = time.perf_counter()
+    rows = run_query_columns(sql, params) if columnar else run_query(sql, params)
+    return rows, (time.perf_counter() - started) * 1000
+
+
+def run_queries(queries: dict, columnar: bool = False):
+    """
+    Run several independent queries in parallel over pooled connections.
+
+    `queries` maps a name to either a SQL string or a (sql, params) tuple.
+    Returns (results, timings) where both are keyed by name and timings are
+    in milliseconds. At most DB_FANOUT_CONCURRENCY queries run at once
+    across the whole process. With columnar=True each result is in the
+    run_query_columns() shape.
+    """
+    executor = _get_executor()
+    futures = {}
+    for name, query in queries.items():
+        sql, params = (query, None) if isinstance(query, str) else query
+        futures[name] = executor.submit(_timed_query, sql, params, columnar)
+
+    results, timings = {}, {}
+    for name, future in futures.items():
+        results[name], timings[name] = future.result()
+    return results, timings
+
+
+def server_timing(timings: dict):
+    """Format per-query timings (ms) as a Server-Timing header value."""
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in timings.items())
+
+
+class ExportsBusy(Exception):
+    """Raised when EXPORT_MAX_CONCURRENT exports are already streaming."""
+
+
+_export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+
+def stream_query(sql: str, params: tuple = None, batch_size: int = 5000):
+    """
+    Iterator over a server-side (named) cursor: yields the column names
+    first, then lists of row tuples of at most batch_size. Memory stays
+    constant however many rows the query returns.
+
+    The cursor runs on a dedicated connection, not a pooled one, so slow
+    downloads never starve the dashboard routes. At most
+    EXPORT_MAX_CONCURRENT streams run at once: this call waits up to
+    DB_POOL_ACQUIRE_TIMEOUT for a slot, then raises ExportsBusy. The slot
+    and connection are released when the iterator is exhausted or closed.
+    """
+    if DB_MODE == "embedded":
+        import embedded
+        return embedded.stream(sql, params, batch_size)
+    if not _export_slots.acquire(timeout=POOL_ACQUIRE_TIMEOUT):
+        raise ExportsBusy(f"{EXPORT_MAX_CONCURRENT} exports already running")
+    return _ExportStream(_stream_rows(sql, params, batch_size))
+
+
+class _ExportStream:
+    """stream_query() iterator holding an export slot until it is closed (or collected unstarted)."""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._slot = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._rows)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        self._rows.close()
+        if self._slot:
+            self._slot = False
+            _export_slots.release()
+
+    __del__ = close
+
+
+def _stream_rows(sql, params, batch_size):
+    conn = get_connection()  # autocommit off: named cursors need a transaction
+    try:
+        with conn.cursor(name=f"stream_{threading.get_ident()}_{time.monotonic_ns()}") as cur:
+            cur.itersize = batch_size
+            cur.execute(sql, params or ())
+            batch = cur.fetchmany(batch_size)
+            yield [col.name for col in cur.description]
+            while batch:
+                yield batch
+                batch = cur.fetchmany(batch_size)
+    finally:
+        conn.close()
+
+
+# --- Async driver mode (DB_MODE=async) ---
+# Routers await fetch_all / fetch_columns / fetch_many. In sync mode those
+# hand the psycopg2 helpers above to the threadpool; in async mode they use
+# a psycopg 3 AsyncConnectionPool so one worker can keep hundreds of
+# queries in flight.
+_async_pool = None
+_fanout_semaphore = None
+
+
+def _conninfo():
+    from psycopg.conninfo import make_conninfo
+    return make_conninfo(
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+    )
+
+
+async def open_async_pool():
+    """Open the async pool (startup hook; no-op in sync mode)."""
+    global _async_pool
+    if DB_MODE != "async" or _async_pool is not None:
+        return
+    try:
+        from psycopg.rows import dict_row
+        from psycopg_pool import AsyncConnectionPool
+    except ImportError as e:
+        raise RuntimeError("DB_MODE=async needs psycopg 3 and its pool "
+                           "(pip install 'psycopg[binary]' psycopg_pool)") from e
+
+    pool = AsyncConnectionPool(
+        _conninfo(),
+        min_size=POOL_MIN_SIZE,
+        max_size=ASYNC_POOL_MAX_SIZE,
+        timeout=POOL_ACQUIRE_TIMEOUT,
+        max_lifetime=POOL_MAX_LIFETIME,
+        # psycopg 3 prepares server-side by itself after prepare_threshold executions
+        kwargs={"autocommit": True, "row_factory": dict_row,
+                "prepare_threshold": 0 if PREPARED_STATEMENTS else None},
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
+    await pool.open()
+    _async_pool = pool
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+
+async def _execute_async(sql, params):
+    waiting = time.perf_counter()
+    async with _async_pool.connection() as conn:
+        metrics.acquire_wait.observe(time.perf_counter() - waiting)
+        async with conn.cursor() as cur:
+            started = time.perf_counter()
+            await cur.execute(sql, params or ())
+            rows = await cur.fetchall()
+            metrics.record_query(sql, params, time.perf_counter() - started, len(rows), DB_MODE)
+            return rows
+
+
+async def _execute_columns_async(sql, params):
+    from psycopg.rows import tuple_row
+
+    waiting = time.perf_counter()
+    async with _async_pool.connection() as conn:
+        metrics.acquire_wait.observe(time.perf_counter() - waiting)
+        async with conn.cursor(row_factory=tuple_row) as cur:
+            started = time.perf_counter()
+            await cur.execute(sql, params or ())
+            rows = await cur.fetchall()
+            metrics.record_query(sql, params, time.perf_counter() - started, len(rows), DB_MODE)
+            columns = [col.name for col in cur.description]
+    data = [list(values) for values in zip(*rows)] if rows else [[] for _ in columns]
+    return {"columns": columns, "data": data}
+
+
+async def fetch_all(sql: str, params: tuple = None, cached: bool = True):
+    """Async counterpart of run_query (same cache, same row shape)."""
+    if _async_pool is None:
+        return await run_in_threadpool(run_query, sql, params, cached)
+    if not cached:
+        return await _execute_async(sql, params)
+    key = result_cache.make_key(sql, params)
+    return await result_cache.get_or_load_async(key, lambda: _execute_async(sql, params))
+
+
+async def fetch_columns(sql: str, params: tuple = None):
+    """Async counterpart of run_query_columns."""
+    if _async_pool is None:
+        return await run_in_threadpool(run_query_columns, sql, params)
+    key = result_cache.make_key(sql, params) + ("columns",)
+    return await result_cache.get_or_load_async(key, lambda: _execute_columns_async(sql, params))
+
+
+async def fetch_many(queries: dict, columnar: bool = False):
+    """Async counterpart of run_queries: same arguments, same (results, timings)."""
+    if _async_pool is None:
+        return await run_in_threadpool(run_queries, queries, columnar)
+
+    global _fanout_semaphore
+    if _fanout_semaphore is None:
+        _fanout_semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+    fetch = fetch_columns if columnar else fetch_all
+
+    async def timed(query):
+        sql, params = (query, None) if isinstance(query, str) else query
+        async with _fanout_semaphore:
+            started = time.perf_counter()
+            rows = await fetch(sql, params)
+            return rows, (time.perf_counter() - started) * 1000
+
+    names = list(queries)
+    outcomes = await asyncio.gather(*(timed(queries[name]) for name in names))
+    results = {name: rows for name, (rows, _) in zip(names, outcomes)}
+    timings = {name: ms for name, (_, ms) in zip(names, outcomes)}
+    return results, timings
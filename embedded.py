@@ -0,0 +1,230 @@
+"""
+Embedded query engine (DB_MODE=embedded): the whole API without Postgres.
+
+The Dataset/ CSVs are loaded into an in-process DuckDB database, and the
+dashboard views (v_*, tj_*, om_*, pa_*) are recreated there from
+kpis.VIEW_SQL, so the routers run their usual SQL unchanged. Each table is
+also cached as Parquet next to the CSVs; later starts read the Parquet
+copy unless the CSV is newer.
+
+The view definitions are reconstructed from the routers and the dashboard.
+Check them against a Postgres that has the real views with:
+
+    python embedded.py --parity          # compare every view, exit 1 on a mismatch
+    python embedded.py --view v_kpi1     # print one view from the embedded engine
+
+tests/test_endpoints.py compares every endpoint's payload across the two modes.
+duckdb is not in requirements.txt; install it (and pytest) for the demo
+mode and the test suite with:
+
+    pip install -r requirements-dev.txt
+"""
+import argparse
+import hashlib
+import os
+import sys
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+import summaries
+from ingest import DEFAULT_DATASET, TABLES
+from kpis import ROLLUP_SQL, VIEW_SQL
+
+try:
+    import duckdb
+except ImportError:  # optional dependency, only needed in embedded mode
+    duckdb = None
+
+EMBEDDED_DATASET = os.getenv("EMBEDDED_DATASET", DEFAULT_DATASET)
+EMBEDDED_CACHE_DIR = os.getenv("EMBEDDED_CACHE_DIR", os.path.join(EMBEDDED_DATASET, ".parquet"))
+EMBEDDED_THREADS = int(os.getenv("EMBEDDED_THREADS", "4"))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+_version = None
+
+
+def _source_files(dataset_dir):
+    return {table: os.path.join(dataset_dir, spec[0]) for table, spec in TABLES.items()}
+
+
+def _load_table(con, table, csv_path, cache_dir):
+    """Fill `table` from its Parquet cache, or from the CSV (refreshing the cache)."""
+    _, columns, date_columns = TABLES[table]
+    con.execute(f"CREATE TABLE {table} ({columns});")
+    parquet = os.path.join(cache_dir, table + ".parquet")
+    if os.path.exists(parquet) and os.path.getmtime(parquet) >= os.path.getmtime(csv_path):
+        con.execute(f"INSERT INTO {table} SELECT * FROM read_parquet(?);", [parquet])
+        return
+
+    names = [row[0] for row in con.execute(f"DESCRIBE {table};").fetchall()]
+    exprs = []
+    for name in names:
+        if name in date_columns:
+            # DimPatient dates are M/D/YYYY, the fact files are ISO
+            exprs.append(f"""CASE WHEN "{name}" LIKE '%/%' THEN strptime("{name}", '%m/%d/%Y')::date
+                             ELSE "{name}"::date END""")
+        else:
+            exprs.append(f'"{name}"')
+    select = f"SELECT {', '.join(exprs)} FROM read_csv(?, header = true, all_varchar = true, encoding = ?)"
+    try:
+        con.execute(f"INSERT INTO {table} {select};", [csv_path, "utf-8"])
+    except duckdb.Error:
+        # DimVisitType is Windows-1252 ("±"); latin-1 decodes it the same way
+        con.execute(f"INSERT INTO {table} {select};", [csv_path, "latin-1"])
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        con.execute(f"COPY {table} TO '{parquet}' (FORMAT parquet);")
+    except (OSError, duckdb.Error):
+        pass  # read-only checkout: just load from CSV next time too
+
+
+def build_engine(dataset_dir=EMBEDDED_DATASET, cache_dir=EMBEDDED_CACHE_DIR):
+    """New in-memory DuckDB database holding the star schema and the dashboard views."""
+    if duckdb is None:
+        raise RuntimeError("DB_MODE=embedded needs the duckdb package (pip install duckdb)")
+    con = duckdb.connect(":memory:", config={"threads": EMBEDDED_THREADS})
+    for table, path in _source_files(dataset_dir).items():
+        _load_table(con, table, path, cache_dir)
+    summaries.ensure_summaries(con)
+    summaries.rebuild(con, list(summaries.SUMMARIES))
+    con.execute("CREATE SCHEMA public;")  # the SQL we run says public.<name> in places
+    for table in [*TABLES, *(t for specs in summaries.SUMMARIES.values() for t, *_ in specs)]:
+        con.execute(f"CREATE VIEW public.{table} AS SELECT * FROM main.{table};")
+    for view, select in VIEW_SQL.items():
+        con.execute(f"CREATE VIEW {view} AS {select};")
+        con.execute(f"CREATE VIEW public.{view} AS SELECT * FROM main.{view};")
+    return con
+
+
+def get_engine():
+    """Process-wide engine, built on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = build_engine()
+    return _engine
+
+
+def version():
+    """Data version for ETags: changes when any source CSV changes."""
+    global _version
+    if _version is None:
+        h = hashlib.sha1()
+        for path in _source_files(EMBEDDED_DATASET).values():
+            st = os.stat(path)
+            h.update(f"{path}:{st.st_mtime_ns}:{st.st_size}".encode())
+        _version = h.hexdigest()[:16]
+    return _version
+
+
+def _cursor(sql, params):
+    # DuckDB connections aren't shared across threads; each call gets its own cursor
+    cur = get_engine().cursor()
+    cur.execute(sql.replace("%s", "?"), list(params or ()))
+    return cur
+
+
+def execute(sql, params=None):
+    """Rows as dicts, like RealDictCursor."""
+    cur = _cursor(sql, params)
+    try:
+        columns = [d[0] for d in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+
+def execute_columns(sql, params=None):
+    cur = _cursor(sql, params)
+    try:
+        columns = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+    data = [list(values) for values in zip(*rows)] if rows else [[] for _ in columns]
+    return {"columns": columns, "data": data}
+
+
+def stream(sql, params=None, batch_size=5000):
+    """Same contract as database.stream_query: column names, then row batches."""
+    cur = _cursor(sql, params)
+    try:
+        yield [d[0] for d in cur.description]
+        batch = cur.fetchmany(batch_size)
+        while batch:
+            yield batch
+            batch = cur.fetchmany(batch_size)
+    finally:
+        cur.close()
+
+
+def stats():
+    return {"mode": "embedded", "engine": "duckdb", "dataset": EMBEDDED_DATASET, "loaded": _engine is not None}
+
+
+# --- Parity check against the Postgres views ---
+
+def _comparable(value):
+    if isinstance(value, (Decimal, float)):
+        return round(float(value), 2)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _normalized(rows):
+    return sorted((tuple((k.lower(), _comparable(v)) for k, v in row.items()) for row in rows), key=repr)
+
+
+def _compare(label, expected, actual, mismatched, log):
+    if _normalized(expected) == _normalized(actual):
+        log(f"ok   {label} ({len(actual)} rows)")
+        return
+    mismatched.append(label)
+    exp_cols = list(expected[0]) if expected else []
+    act_cols = list(actual[0]) if actual else []
+    log(f"DIFF {label}: postgres {len(expected)} rows {exp_cols}; other {len(actual)} rows {act_cols}")
+
+
+def parity(views=None, log=print):
+    """
+    Run each view on Postgres and on the embedded engine, and the rollup
+    query (kpis.ROLLUP_SQL) against the Postgres view. Returns the labels
+    that differ.
+    """
+    from database import run_query
+
+    mismatched = []
+    for view in views or VIEW_SQL:
+        sql = f"SELECT * FROM {view};"
+        try:
+            expected = run_query(sql, cached=False)
+        except Exception as e:
+            log(f"SKIP {view}: not available in Postgres ({str(e).splitlines()[0]})")
+            continue
+        _compare(view, expected, execute(sql), mismatched, log)
+        if view in ROLLUP_SQL:
+            rollup = run_query(f"SELECT * FROM ({ROLLUP_SQL[view]}) r;", cached=False)
+            _compare(f"{view} (rollup)", expected, rollup, mismatched, log)
+    return mismatched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedded DuckDB engine over the Dataset/ CSVs")
+    parser.add_argument("--parity", action="store_true", help="compare every view with the Postgres views")
+    parser.add_argument("--view", action="append", help="limit to this view (repeatable)")
+    args = parser.parse_args()
+
+    if args.parity:
+        sys.exit(1 if parity(args.view) else 0)
+    for view in args.view or VIEW_SQL:
+        print(view)
+        for row in execute(f"SELECT * FROM {view};"):
+            print("   ", row)
@@ -0,0 +1,195 @@
+"""
+Dashboard filters (site, region, date range) pushed down into the SQL.
+
+Every dashboard endpoint accepts the same query parameters:
+
+    ?site_id=S001&site_id=S002   one or more sites
+    ?region=North India          DimSite.S_Region
+    ?date_from=2025-01-01        inclusive, on each fact table's own date column
+    ?date_to=2025-03-31          inclusive
+
+A date range always means the same thing: each fact table keeps the rows
+whose own date (FILTER_COLUMNS) is in it, so visit-based figures count
+the visits in the range and enrollment-based figures the enrollments.
+The patient detail table and its export therefore both count the visits
+in the range. Endpoints that select patients by enrollment instead
+(visit-window compliance) say so.
+
+Unfiltered requests read the views (or their snapshots) as before. A
+filtered request runs the view's definition from kpis.VIEW_SQL behind a
+WITH clause that shadows each base table it reads with a filtered copy:
+
+    WITH factvisits AS (SELECT * FROM public.factvisits
+                        WHERE siteid IN (%s) AND visitdate >= %s ...)
+    SELECT ... FROM factvisits ...
+
+The predicates are plain parameterized comparisons on (siteid, <date>),
+so Postgres can use the composite indexes created by ingest.py. The
+definitions are rebuilt from the dashboard, so before a view's first
+filtered query in Postgres mode its definition must return the live
+view's columns; a mismatch is a 500 rather than a silently different
+payload.
+
+With ROLLUPS_ENABLED=1, views with an entry in kpis.ROLLUP_SQL are
+answered from the site x day rollups instead (when no snapshot serves
+them), filtered the same way. Rollups are opt-in: every ROLLUP_SQL entry
+must return the view's rows and columns exactly (tests/test_views.py
+checks them), and without the flag requests never leave the snapshots
+and views.
+"""
+import os
+import re
+import time
+from datetime import date
+from typing import List, Optional
+
+from fastapi import HTTPException, Query
+
+import snapshots
+from cache import ViewSQL
+from database import DB_MODE, fetch_all, fetch_columns
+from kpis import ROLLUP_SQL, VIEW_SQL
+
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "0") in ("1", "true", "True")
+
+# base table -> (site column, date column or None). Dimensions are filtered by site only.
+FILTER_COLUMNS = {
+    "factvisits": ("siteid", "visitdate"),
+    "factenrollment": ("siteid", "enrollmentdate"),
+    "factscreeningenrollment": ("siteid", "screeningdate"),
+    "factdataquality": ("siteid", "date"),
+    "dimpatient": ("siteid", None),
+    "dimsite": ("siteid", None),
+    "rollup_visits_site_day": ("siteid", "day"),
+    "rollup_quality_site_day": ("siteid", "day"),
+}
+
+_TABLE_RE = re.compile(r"\b(" + "|".join(FILTER_COLUMNS) + r")\b")
+
+
+class DashboardFilter:
+    """Query parameters shared by every dashboard endpoint (use with Depends())."""
+
+    def __init__(
+        self,
+        site_id: Optional[List[str]] = Query(None, description="Limit to these sites (repeatable)"),
+        region: Optional[str] = Query(None, description="Limit to sites in this S_Region"),
+        date_from: Optional[date] = Query(None, description="First day to include"),
+        date_to: Optional[date] = Query(None, description="Last day to include"),
+    ):
+        if date_from and date_to and date_from > date_to:
+            raise HTTPException(status_code=400, detail="date_from is after date_to")
+        self.site_id = site_id or []
+        self.region = region
+        self.date_from = date_from
+        self.date_to = date_to
+
+    def __bool__(self):
+        return bool(self.site_id or self.region or self.date_from or self.date_to)
+
+
+def predicates(filters, site_col: str = "siteid", date_col: Optional[str] = None):
+    """(WHERE clause or "", params) for one relation."""
+    clauses, params = [], []
+    if filters.site_id:
+        clauses.append(f"{site_col} IN ({', '.join(['%s'] * len(filters.site_id))})")
+        params.extend(filters.site_id)
+    if filters.region:
+        clauses.append(f"{site_col} IN (SELECT siteid FROM public.dimsite WHERE s_region = %s)")
+        params.append(filters.region)
+    if date_col and filters.date_from:
+        clauses.append(f"{date_col} >= %s")
+        params.append(filters.date_from)
+    if date_col and filters.date_to:
+        clauses.append(f"{date_col} <= %s")
+        params.append(filters.date_to)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", tuple(params)
+
+
+def _key(view: str):
+    view = view.lower()
+    return view[len("public."):] if view.startswith("public.") else view
+
+
+_rollups_ready = False
+_rollups_checked_until = 0.0
+
+
+async def rollups_ready():
+    """True with ROLLUPS_ENABLED once the site x day rollups have been filled (re-checked every minute)."""
+    global _rollups_ready, _rollups_checked_until
+    if not ROLLUPS_ENABLED:
+        return False
+    if time.monotonic() < _rollups_checked_until:
+        return _rollups_ready
+    try:
+        rows = await fetch_all("SELECT EXISTS (SELECT 1 FROM rollup_visits_site_day) AS visits, "
+                               "EXISTS (SELECT 1 FROM rollup_quality_site_day) AS quality;", cached=False)
+        _rollups_ready = bool(rows[0]["visits"] and rows[0]["quality"])
+    except Exception:
+        _rollups_ready = False
+    _rollups_checked_until = time.monotonic() + 60
+    return _rollups_ready
+
+
+def with_clause(view: str, filters, rollup: bool = False):
+    """
+    ("WITH ... ", params) defining filtered copies of the base tables the
+    view reads, followed by the view itself under its own name (from the
+    rollups when `rollup`); ("", ()) when there is nothing to change.
+    """
+    if not filters and not rollup:
+        return "", ()
+    key = _key(view)
+    definition = (ROLLUP_SQL if rollup else VIEW_SQL).get(key)
+    if definition is None:
+        raise HTTPException(status_code=400, detail=f"{view} does not support filtering")
+
+    ctes, params = [], []
+    for table in dict.fromkeys(_TABLE_RE.findall(definition)):
+        where, table_params = predicates(filters, *FILTER_COLUMNS[table]) if filters else ("", ())
+        if where:
+            ctes.append(f"{table} AS (SELECT * FROM public.{table}{where})")
+            params.extend(table_params)
+    ctes.append(f"{key} AS ({definition.strip()})")
+    return "WITH " + ",\n     ".join(ctes) + "\n", tuple(params)
+
+
+_matching_definitions = set()
+
+
+async def check_definition(view: str):
+    """Raise a 500 if kpis.VIEW_SQL's definition of `view` no longer returns the live view's columns."""
+    key = _key(view)
+    if DB_MODE == "embedded" or key in _matching_definitions:
+        return  # embedded mode builds its views from VIEW_SQL
+    live = await fetch_columns(f"SELECT * FROM {key} LIMIT 0;")
+    rebuilt = await fetch_columns(f"SELECT * FROM ({VIEW_SQL[key].strip()}) t LIMIT 0;")
+    if live["columns"] != rebuilt["columns"]:
+        raise HTTPException(status_code=500, detail=(
+            f"the filtered definition of {key} returns {rebuilt['columns']}, "
+            f"the live view {live['columns']}; update kpis.VIEW_SQL"))
+    _matching_definitions.add(key)
+
+
+async def view_query(view: str, filters=None, columns: str = "*"):
+    """
+    (sql, params) reading a dashboard view: its snapshot when unfiltered
+    and one exists, else the rollup query when enabled and the view has
+    one, else the live view (unfiltered) or its filtered definition.
+    """
+    rollup = _key(view) in ROLLUP_SQL and await rollups_ready()
+    if not filters:
+        relation, _ = await snapshots.snapshot_source(view, columns)
+        if relation != view or not rollup:
+            return ViewSQL(await snapshots.snapshot_sql(view, columns), _key(view)), None
+    prefix, params = with_clause(view, filters, rollup)
+    if filters and not rollup:
+        await check_definition(view)
+    return ViewSQL(f"{prefix}SELECT {columns} FROM {_key(view)};", _key(view)), params
+
+
+async def mark_as_of(response, filters, *views):
+    """snapshots.mark_as_of, skipped for filtered responses (they never read a snapshot)."""
+    if not filters:
+        await snapshots.mark_as_of(response, *views)
@@ -0,0 +1,103 @@
+"""
+Recruitment funnel: screening -> eligible -> enrolled -> randomized -> first visit.
+
+One statement joins FactScreeningEnrollment, FactEnrollment and FactVisits
+on PatientPK (one row per screened patient) and aggregates it by site
+and/or cohort month, the month of the patient's first screening. Stages
+are cumulative: a patient counts at a stage only if they reached every
+earlier one, so each conversion rate is a share of the previous stage.
+"First visit" is the first completed visit on or after randomization.
+
+Median stage-to-stage durations (days, percentile_cont) are taken over
+the patients that reached both stages. The SQL runs unchanged on
+Postgres and on the embedded engine; results go through the result
+cache, which is dropped whenever the data version changes.
+
+Filters: site_id / region apply to every table; date_from / date_to
+select cohorts by screening date, so later stages of an in-range cohort
+are always counted.
+"""
+from filters import predicates
+
+# grouping -> (select list, GROUP BY / ORDER BY list)
+GROUPINGS = {
+    "site_month": ("p.siteid, d.s_sitename, p.cohort_month", "p.siteid, d.s_sitename, p.cohort_month"),
+    "site": ("p.siteid, d.s_sitename", "p.siteid, d.s_sitename"),
+    "month": ("p.cohort_month", "p.cohort_month"),
+    "total": ("'all' AS cohort", None),
+}
+
+FUNNEL_SQL = """
+WITH screening AS (
+    SELECT patientpk,
+           min(siteid) AS siteid,
+           min(screeningdate) AS screened_on,
+           max(CASE WHEN screenresult = 'Passed' THEN 1 ELSE 0 END) AS passed
+    FROM factscreeningenrollment{screening_where}
+    GROUP BY patientpk
+),
+first_visits AS (
+    SELECT v.patientpk, min(v.visitdate) AS first_visit_on
+    FROM factvisits v
+    JOIN factenrollment e ON e.patientpk = v.patientpk
+    WHERE v.visitstatus = 'Completed'
+      AND v.visitdate >= coalesce(e.randomizationdate, e.enrollmentdate){visits_and}
+    GROUP BY v.patientpk
+),
+patients AS (
+    SELECT s.siteid,
+           substr(CAST(s.screened_on AS text), 1, 7) AS cohort_month,
+           s.screened_on,
+           CASE WHEN s.passed = 1 THEN 1 ELSE 0 END AS eligible,
+           CASE WHEN s.passed = 1 THEN e.enrollmentdate END AS enrolled_on,
+           CASE WHEN s.passed = 1 AND e.enrollmentdate IS NOT NULL AND e.randomizedflag = 1
+                THEN coalesce(e.randomizationdate, e.enrollmentdate) END AS randomized_on,
+           v.first_visit_on
+    FROM screening s
+    LEFT JOIN factenrollment e ON e.patientpk = s.patientpk
+    LEFT JOIN first_visits v ON v.patientpk = s.patientpk
+),
+stages AS (
+    SELECT siteid, cohort_month, screened_on, eligible, enrolled_on, randomized_on,
+           CASE WHEN randomized_on IS NOT NULL THEN first_visit_on END AS first_visit_on
+    FROM patients
+),
+counts AS (
+    SELECT {select},
+           count(*)::bigint AS screened,
+           count(*) FILTER (WHERE p.eligible = 1) AS eligible,
+           count(p.enrolled_on)::bigint AS enrolled,
+           count(p.randomized_on)::bigint AS randomized,
+           count(p.first_visit_on)::bigint AS first_visit,
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY p.enrolled_on - p.screened_on) AS median_days_screening_to_enrollment,
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY p.randomized_on - p.enrolled_on) AS median_days_enrollment_to_randomization,
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY p.first_visit_on - p.randomized_on) AS median_days_randomization_to_first_visit
+    FROM stages p
+    LEFT JOIN dimsite d ON d.siteid = p.siteid
+    {group_by}
+)
+SELECT *,
+       round(100.0 * eligible / nullif(screened, 0), 2) AS eligible_pct,
+       round(100.0 * enrolled / nullif(eligible, 0), 2) AS enrolled_pct,
+       round(100.0 * randomized / nullif(enrolled, 0), 2) AS randomized_pct,
+       round(100.0 * first_visit / nullif(randomized, 0), 2) AS first_visit_pct,
+       round(100.0 * first_visit / nullif(screened, 0), 2) AS overall_pct
+FROM counts
+{order_by};
+"""
+
+
+def funnel_query(filters=None, by: str = "site_month"):
+    """(sql, params) for the funnel grouped by `by` (a GROUPINGS key)."""
+    select, keys = GROUPINGS[by]
+    screening_where, screening_params = ("", ()) if not filters else predicates(filters, "siteid", "screeningdate")
+    visits_where, visits_params = ("", ()) if not filters else predicates(filters, "v.siteid")
+    sql = FUNNEL_SQL.format(
+        select=select,
+        screening_where=screening_where,
+        # WHERE ... -> AND ... after the visit status condition
+        visits_and=visits_where.replace(" WHERE ", " AND ", 1),
+        group_by=f"GROUP BY {keys}" if keys else "",
+        order_by=f"ORDER BY {', '.join(k.split('.')[-1] for k in keys.split(', '))}" if keys else "",
+    )
+    return sql, screening_params + visits_params
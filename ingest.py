@@ -0,0 +1,424 @@
+"""
+Bulk loader for the Dataset/ star schema.
+
+Each CSV is streamed into an unlogged <table>_staging copy with
+COPY FROM STDIN, chunk by chunk. Dates are normalized to ISO on the way
+in: DimPatient uses M/D/YYYY, the fact files use YYYY-MM-DD. Once every
+file is staged, one transaction truncates the live tables, fills them from
+staging and records a new row in data_load_generation. Readers see either
+the old data or the new data, never a mix, and the views on top keep
+working because the tables are never dropped or renamed.
+
+Delta mode upserts append-only batches of FactVisits (keyed by visitid)
+or FactDataQuality (keyed by siteid, date) and folds them into the
+per-site/per-month summary tables (summaries.py), so a nightly load costs
+in proportion to the batch rather than the history. The deviation alert
+rules (alerts.py) are re-evaluated for the site-days a load touches.
+
+Once a load has committed, the static payloads (static_export.py) are
+re-rendered for the new data version if an export exists, so a served
+export never goes stale.
+
+    python ingest.py                        # load every file in Dataset/
+    python ingest.py --dataset path/to/csvs --refresh-snapshots
+    python ingest.py --delta factvisits new_visits.csv
+    python ingest.py --export-static        # export even if no export exists yet
+    python ingest.py --no-export-static     # leave an existing export alone
+"""
+import argparse
+import csv
+import io
+import os
+import time
+
+import alerts
+import summaries
+from database import get_connection
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Dataset")
+CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "20000"))
+# bytes copy_expert asks the CSV stream for per read (its default is 8 KB)
+COPY_READ_SIZE = 1 << 20
+# pg_notify channel announcing each committed load (payload: the generation)
+NOTIFY_CHANNEL = "dashboard_data_changed"
+
+# table -> (csv file, column DDL, date columns). Load order = dependency order.
+TABLES = {
+    "dimsite": ("DimSite Final.csv", """
+        siteid text PRIMARY KEY,
+        s_sitename text,
+        s_region text,
+        site_targetenrollment integer,
+        s_pi_name text,
+        s_site_manager_email text
+    """, ()),
+    "dimvisittype": ("DimVisitType.csv", """
+        visittypeid text PRIMARY KEY,
+        visitname text,
+        "window" text,
+        expectedwindowdays integer
+    """, ()),
+    "dimpatient": ("DimPatient.csv", """
+        patientpk integer PRIMARY KEY,
+        pseudonymid text,
+        sex text,
+        dob date,
+        agebucket text,
+        enrollmentdate date,
+        randomizationdate date,
+        siteid text
+    """, ("dob", "enrollmentdate", "randomizationdate")),
+    "factenrollment": ("FactEnrollment.csv", """
+        patientpk integer PRIMARY KEY,
+        siteid text,
+        enrollmentdate date,
+        randomizedflag integer,
+        randomizationdate date
+    """, ("enrollmentdate", "randomizationdate")),
+    "factscreeningenrollment": ("FactScreeningEnrollment.csv", """
+        patientpk integer,
+        siteid text,
+        screeningdate date,
+        screenresult text,
+        reasonforfailure text,
+        sourcecrf text
+    """, ("screeningdate",)),
+    "factvisits": ("FactVisits.csv", """
+        visitid text PRIMARY KEY,
+        patientpk integer,
+        siteid text,
+        visitdate date,
+        visitstatus text,
+        ediarysubmitted text,
+        medicationtakenpercent numeric,
+        ae_reported text
+    """, ("visitdate",)),
+    "factdataquality": ("FactDataQuality.csv", """
+        siteid text,
+        date date,
+        querycount integer,
+        queriesopen integer,
+        datacompletenesspct numeric,
+        timelinessscore numeric,
+        PRIMARY KEY (siteid, date)
+    """, ("date",)),
+}
+
+# fact table -> natural key used by delta loads
+DELTA_KEYS = {
+    "factvisits": ("visitid",),
+    "factdataquality": ("siteid", "date"),
+}
+
+# composite indexes for the site / date filters (filters.py); factdataquality's
+# primary key already covers (siteid, date). factvisits_patient_date_idx feeds
+# the per-patient visit lookups of visit_windows.py.
+INDEX_DDL = [
+    "CREATE INDEX IF NOT EXISTS factvisits_site_date_idx ON factvisits (siteid, visitdate);",
+    "CREATE INDEX IF NOT EXISTS factvisits_patient_date_idx ON factvisits (patientpk, visitdate, visitid);",
+    "CREATE INDEX IF NOT EXISTS factenrollment_site_date_idx ON factenrollment (siteid, enrollmentdate);",
+    "CREATE INDEX IF NOT EXISTS factscreening_site_date_idx ON factscreeningenrollment (siteid, screeningdate);",
+    "CREATE INDEX IF NOT EXISTS dimpatient_site_idx ON dimpatient (siteid);",
+    "CREATE INDEX IF NOT EXISTS dimsite_region_idx ON dimsite (s_region);",
+]
+
+GENERATION_DDL = """
+    CREATE TABLE IF NOT EXISTS data_load_generation (
+        generation bigserial PRIMARY KEY,
+        loaded_at  timestamptz NOT NULL DEFAULT now(),
+        mode       text NOT NULL,
+        row_count  bigint NOT NULL
+    );
+"""
+
+
+def normalize_date(value: str):
+    """'9/3/1975' -> '1975-09-03'; ISO dates pass through; '' stays NULL."""
+    value = value.strip()
+    if not value or "/" not in value:
+        return value
+    month, day, year = value.split("/")
+    return f"{year}-{int(month):02d}-{int(day):02d}"
+
+
+class CsvChunkStream(io.RawIOBase):
+    """
+    File-like object for copy_expert: re-emits CSV rows CHUNK_ROWS at a
+    time with date columns normalized, so memory stays flat on big files.
+    """
+
+    def __init__(self, reader, date_indexes, chunk_rows=CHUNK_ROWS):
+        self._reader = reader
+        self._date_indexes = date_indexes
+        self._chunk_rows = chunk_rows
+        self._buffer = b""
+        self._pos = 0
+        self.rows = 0
+
+    def readable(self):
+        return True
+
+    def _next_chunk(self):
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        count = 0
+        for row in self._reader:
+            if not row:
+                continue
+            for i in self._date_indexes:
+                row[i] = normalize_date(row[i])
+            writer.writerow(row)
+            count += 1
+            if count >= self._chunk_rows:
+                break
+        self.rows += count
+        return out.getvalue().encode("utf-8")
+
+    def read(self, size=-1):
+        # _buffer[_pos:] is unread; it is compacted once per CSV chunk, never
+        # per read, so the copying stays linear in the file size
+        while size < 0 or len(self._buffer) - self._pos < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self._buffer = self._buffer[self._pos:] + chunk
+            self._pos = 0
+        end = len(self._buffer) if size < 0 else self._pos + size
+        data = self._buffer[self._pos:end]
+        self._pos += len(data)
+        return data
+
+
+def ensure_schema(cur):
+    for table, (_, columns, _) in TABLES.items():
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns});")
+    for ddl in INDEX_DDL:
+        cur.execute(ddl)
+    cur.execute(GENERATION_DDL)
+    summaries.ensure_summaries(cur)
+    alerts.ensure_alerts(cur)
+
+
+def _copy_file(cur, table, path, date_columns, encoding):
+    with open(path, newline="", encoding=encoding) as f:
+        reader = csv.reader(f)
+        header = [h.strip().lower() for h in next(reader)]
+        date_indexes = [header.index(c) for c in date_columns]
+        stream = CsvChunkStream(reader, date_indexes)
+        column_list = ", ".join(f'"{h}"' for h in header)
+        cur.execute(f"TRUNCATE {table}_staging;")
+        cur.copy_expert(f"COPY {table}_staging ({column_list}) FROM STDIN WITH (FORMAT csv)", stream,
+                        size=COPY_READ_SIZE)
+        return stream.rows
+
+
+def stage_table(cur, table, path):
+    """COPY one CSV into <table>_staging. Returns the row count."""
+    _, _, date_columns = TABLES[table]
+    cur.execute(f"CREATE UNLOGGED TABLE IF NOT EXISTS {table}_staging (LIKE {table} INCLUDING DEFAULTS);")
+    cur.execute("SAVEPOINT stage_table;")
+    try:
+        rows = _copy_file(cur, table, path, date_columns, "utf-8-sig")
+    except UnicodeDecodeError:
+        # some exports (DimVisitType's "±" windows) are Windows-1252
+        cur.execute("ROLLBACK TO SAVEPOINT stage_table;")
+        rows = _copy_file(cur, table, path, date_columns, "cp1252")
+    cur.execute("RELEASE SAVEPOINT stage_table;")
+    return rows
+
+
+def swap_in(cur, tables, mode="full", row_count=0):
+    """Replace the live tables with their staged copies in the current transaction."""
+    cur.execute(f"TRUNCATE {', '.join(tables)};")
+    for table in tables:
+        cur.execute(f"INSERT INTO {table} SELECT * FROM {table}_staging;")
+        cur.execute(f"TRUNCATE {table}_staging;")
+    summaries.rebuild(cur, tables)
+    generation = record_generation(cur, mode, row_count)
+    if any(t in alerts.SOURCE_DAYS for t in tables):
+        alerts.evaluate(cur, generation, full=True)
+    return generation
+
+
+def record_generation(cur, mode, row_count):
+    """Bump the data generation; listeners (live.py) get a NOTIFY when the load commits."""
+    cur.execute("INSERT INTO data_load_generation (mode, row_count) VALUES (%s, %s) RETURNING generation;",
+                (mode, row_count))
+    generation = cur.fetchone()[0]
+    cur.execute("SELECT pg_notify(%s, %s);", (NOTIFY_CHANNEL, str(generation)))
+    return generation
+
+
+def refresh_static_export(always=False, log=print):
+    """
+    Re-render the static payloads for the data version just committed,
+    when an export exists (or always). Returns the export's report, or None
+    when there is nothing to refresh. A failure is logged, not raised: the
+    load stands and the API answers from the handlers until the next export.
+    """
+    import asyncio
+    import static_export
+
+    if not (always or static_export.exported()):
+        return None
+    try:
+        report = asyncio.run(static_export.export())
+    except Exception as e:
+        report = {"error": f"{type(e).__name__}: {e}"}
+        log(f"Warning: static export failed, serving from the database until the next export: {report['error']}")
+    else:
+        log(f"static export: {report}")
+    return report
+
+
+def load_dataset(dataset_dir=DEFAULT_DATASET, tables=None, log=print, export_static=True):
+    """
+    Stage every CSV, then swap all tables in atomically. Returns a
+    per-table report. With export_static, an existing static export is
+    re-rendered once the load has committed.
+    """
+    tables = [t for t in TABLES if not tables or t in tables]
+    report = {}
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            ensure_schema(cur)
+            conn.commit()
+
+            started = time.perf_counter()
+            for table in tables:
+                path = os.path.join(dataset_dir, TABLES[table][0])
+                t0 = time.perf_counter()
+                rows = stage_table(cur, table, path)
+                elapsed = time.perf_counter() - t0
+                report[table] = {"rows": rows, "seconds": round(elapsed, 3),
+                                 "rows_per_sec": round(rows / elapsed) if elapsed else rows}
+                log(f"staged {table:<25} {rows:>10,} rows  {report[table]['rows_per_sec']:>12,} rows/s")
+            conn.commit()
+
+            t0 = time.perf_counter()
+            total = sum(r["rows"] for r in report.values())
+            generation = swap_in(cur, tables, "full", total)
+            conn.commit()
+            elapsed = time.perf_counter() - started
+            log(f"swapped in {len(tables)} tables in {time.perf_counter() - t0:.2f}s "
+                f"(generation {generation}); {total:,} rows in {elapsed:.2f}s = {total / elapsed:,.0f} rows/s")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if export_static:
+        report["static_export"] = refresh_static_export(log=log)
+    return report
+
+
+def _columns(cur, table):
+    cur.execute("SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = 'public' AND table_name = %s ORDER BY ordinal_position;", (table,))
+    return [r[0] for r in cur.fetchall()]
+
+
+def merge_delta(cur, table):
+    """
+    Upsert <table>_staging into <table> by its natural key and fold the
+    change into the summaries. Returns (rows upserted, groups touched).
+    """
+    key = ", ".join(DELTA_KEYS[table])
+    # the last occurrence of a key within one batch wins
+    cur.execute(f"""
+        CREATE TEMP TABLE delta_new ON COMMIT DROP AS
+        SELECT DISTINCT ON ({key}) * FROM {table}_staging ORDER BY {key}, ctid DESC;
+    """)
+    cur.execute(f"""
+        CREATE TEMP TABLE delta_old ON COMMIT DROP AS
+        SELECT t.* FROM {table} t JOIN delta_new d USING ({key});
+    """)
+    alerts.touch(cur, table, "delta_old", "delta_new")  # before the rollups change
+    touched = summaries.apply_delta(cur, table, "delta_old", "delta_new")
+
+    columns = _columns(cur, table)
+    updates = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in columns if c not in DELTA_KEYS[table])
+    cur.execute(f"""
+        INSERT INTO {table} SELECT * FROM delta_new
+        ON CONFLICT ({key}) DO UPDATE SET {updates};
+    """)
+    rows = cur.rowcount
+    cur.execute(f"TRUNCATE {table}_staging;")
+    cur.execute("DROP TABLE delta_new, delta_old;")
+    return rows, touched
+
+
+def load_delta(batches, log=print, export_static=True):
+    """
+    Apply {table: csv path} delta batches in one transaction. Only tables
+    in DELTA_KEYS accept deltas. Returns a per-table report. With
+    export_static, an existing static export is re-rendered once the
+    delta has committed.
+    """
+    unknown = set(batches) - set(DELTA_KEYS)
+    if unknown:
+        raise ValueError(f"delta loads are supported for {', '.join(DELTA_KEYS)}, not {', '.join(sorted(unknown))}")
+
+    report = {}
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            ensure_schema(cur)
+            conn.commit()
+
+            started = time.perf_counter()
+            for table, path in batches.items():
+                t0 = time.perf_counter()
+                staged = stage_table(cur, table, path)
+                rows, touched = merge_delta(cur, table)
+                elapsed = time.perf_counter() - t0
+                report[table] = {"rows": rows, "staged": staged, "summary_groups": touched,
+                                 "seconds": round(elapsed, 3)}
+                log(f"merged {table:<25} {rows:>10,} rows  {touched:>6,} summary groups  {elapsed:.2f}s")
+
+            generation = record_generation(cur, "delta", sum(r["rows"] for r in report.values()))
+            t0 = time.perf_counter()
+            report["alerts"] = alerts.evaluate(cur, generation)
+            log(f"alerts: {report['alerts']['days']} site-days at {report['alerts']['sites']} sites evaluated, "
+                f"{report['alerts']['raised']} raised, "
+                f"{report['alerts']['cleared']} cleared in {time.perf_counter() - t0:.2f}s")
+            conn.commit()
+            log(f"delta committed in {time.perf_counter() - started:.2f}s (generation {generation})")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if export_static:
+        report["static_export"] = refresh_static_export(log=log)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load the Dataset/ CSVs into Postgres")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="directory holding the CSV files")
+    parser.add_argument("--table", action="append", choices=list(TABLES), help="load only this table (repeatable)")
+    parser.add_argument("--delta", nargs=2, action="append", metavar=("TABLE", "CSV"),
+                        help="upsert a delta batch into a fact table instead of a full load (repeatable)")
+    parser.add_argument("--refresh-snapshots", action="store_true", help="refresh materialized snapshots afterwards")
+    export = parser.add_mutually_exclusive_group()
+    export.add_argument("--export-static", action="store_true",
+                        help="pre-render the static payloads afterwards even if no export exists yet")
+    export.add_argument("--no-export-static", action="store_true",
+                        help="do not re-render an existing static export (static_export.py)")
+    args = parser.parse_args()
+
+    # exported last, after any snapshot refresh, which moves the data version again
+    if args.delta:
+        load_delta(dict(args.delta), export_static=False)
+    else:
+        load_dataset(args.dataset, args.table, export_static=False)
+    if args.refresh_snapshots:
+        import snapshots
+        print("refreshed snapshots (ms):", snapshots.refresh_snapshots())
+
+    if not args.no_export_static:
+        report = refresh_static_export(always=args.export_static)
+        if report and "error" in report:
+            raise SystemExit(1)
@@ -0,0 +1,321 @@
+"""
+SQL definitions of the dashboard views (v_*, tj_*, om_*, pa_*).
+
+The production views live in the database. These are equivalent SELECTs
+written in the subset of SQL that Postgres and DuckDB share, so they can
+back the embedded engine (embedded.py) and run against filtered base
+tables (filters.py). `python embedded.py --parity` compares them with the
+real views, and tests/test_views.py checks the column names and labels
+(month names as the dashboard shows them, not ISO months) and, given a
+Postgres, the rows. In Postgres mode filters.view_query also checks each
+definition's columns against the live view before its first filtered
+query.
+"""
+
+_MONTHS = ("ARRAY['January', 'February', 'March', 'April', 'May', 'June', 'July', "
+           "'August', 'September', 'October', 'November', 'December']")
+
+
+def _month_no(column):
+    return f"CAST(extract(month FROM {column}) AS integer)"
+
+
+def _month_name(column):
+    """'January' (Postgres to_char(column, 'FMMonth')), in SQL DuckDB runs too."""
+    return f"({_MONTHS})[{_month_no(column)}]"
+
+
+def _month_abbr(column):
+    """'Jan' (to_char(column, 'Mon'))."""
+    return f"substr({_month_name(column)}, 1, 3)"
+
+
+# Per-patient visit counts shared by the adherence views
+_PATIENT_VISITS = """
+    SELECT v.patientpk,
+           min(v.siteid) AS siteid,
+           count(*) AS total_visits,
+           count(*) FILTER (WHERE v.visitstatus = 'Completed') AS completed_visits,
+           count(*) FILTER (WHERE v.visitstatus = 'Missed') AS missed_visits,
+           count(*) FILTER (WHERE v.visitstatus = 'Rescheduled') AS rescheduled_visits,
+           (array_agg(v.visitstatus ORDER BY v.visitdate DESC, v.visitid DESC))[1] AS last_status,
+           max(v.visitdate) AS last_visit
+    FROM factvisits v
+    GROUP BY v.patientpk
+"""
+
+_PATIENT_ADHERENCE = f"""
+    SELECT pv.*,
+           round(100.0 * completed_visits / total_visits, 2) AS adherence_rate,
+           CASE WHEN 100.0 * completed_visits / total_visits >= 80 THEN 'High'
+                WHEN 100.0 * completed_visits / total_visits >= 50 THEN 'Medium'
+                ELSE 'Low' END AS adherence_category,
+           CASE WHEN last_status = 'Missed' THEN 'Dropout' ELSE 'Active' END AS status
+    FROM ({_PATIENT_VISITS}) pv
+"""
+
+_SITE_VISITS = """
+    SELECT s.s_sitename,
+           count(v.visitid) FILTER (WHERE v.visitstatus = 'Missed') AS missed_visits,
+           count(v.visitid) FILTER (WHERE v.visitstatus = 'Rescheduled') AS rescheduled_visits
+    FROM dimsite s LEFT JOIN factvisits v ON v.siteid = s.siteid
+    GROUP BY s.s_sitename
+"""
+
+_SITE_ENROLLMENT = """
+    SELECT s.s_sitename, count(e.patientpk) AS patients_enrolled
+    FROM dimsite s LEFT JOIN factenrollment e ON e.siteid = s.siteid
+    GROUP BY s.s_sitename
+"""
+
+_SITE_OPERATIONS = """
+    SELECT s.s_sitename,
+           (SELECT count(*) FROM factenrollment e WHERE e.siteid = s.siteid AND e.randomizedflag = 1) AS randomized,
+           (SELECT count(*) FROM factenrollment e WHERE e.siteid = s.siteid AND e.randomizedflag = 0) AS no_randomized,
+           (SELECT round(avg(v.medicationtakenpercent), 2) FROM factvisits v WHERE v.siteid = s.siteid)
+               AS avg_medication_take_percent,
+           (SELECT round(avg(q.datacompletenesspct), 2) FROM factdataquality q WHERE q.siteid = s.siteid)
+               AS avg_querycompleteness,
+           (SELECT round(avg(q.timelinessscore), 2) FROM factdataquality q WHERE q.siteid = s.siteid)
+               AS avg_timeliness
+    FROM dimsite s
+"""
+
+# view -> SELECT
+VIEW_SQL = {
+    # Executive summary
+    "v_exec_kpis": """
+        SELECT count(DISTINCT patientpk) AS total_unique_patients,
+               count(*) AS total_visits,
+               round(100.0 * count(*) FILTER (WHERE visitstatus = 'Completed') / nullif(count(*), 0), 2)
+                   AS visit_completion_pct,
+               count(*) FILTER (WHERE visitstatus = 'Missed') AS visit_missed
+        FROM factvisits
+    """,
+    "v_exec_enrollment_gauge": """
+        SELECT (SELECT count(*) FROM factenrollment) AS total_enrolled,
+               (SELECT sum(site_targetenrollment) FROM dimsite) AS total_target
+    """,
+    "v_exec_visitstatus_donut": """
+        SELECT count(*) FILTER (WHERE visitstatus = 'Completed') AS completed,
+               count(*) FILTER (WHERE visitstatus = 'Missed') AS missed,
+               count(*) FILTER (WHERE visitstatus = 'Rescheduled') AS rescheduled
+        FROM factvisits
+    """,
+    "v_exec_enrollment_trend": f"""
+        SELECT {_month_abbr("enrollmentdate")} AS month_name, count(*) AS monthly_enrollment
+        FROM factenrollment
+        WHERE enrollmentdate IS NOT NULL
+        GROUP BY 1 ORDER BY min({_month_no("enrollmentdate")})
+    """,
+
+    # Site analysis
+    "v_site_total_active": """
+        SELECT count(DISTINCT siteid) AS total_active_sites FROM factenrollment
+    """,
+    "v_site_avg_patients": f"""
+        SELECT round(avg(patients_enrolled), 2) AS avg_patients_per_site FROM ({_SITE_ENROLLMENT}) t
+    """,
+    "v_site_top_performer": f"""
+        SELECT s_sitename, patients_enrolled FROM ({_SITE_ENROLLMENT}) t
+        ORDER BY patients_enrolled DESC, s_sitename LIMIT 1
+    """,
+    "v_site_least_performer": f"""
+        SELECT s_sitename, patients_enrolled FROM ({_SITE_ENROLLMENT}) t
+        ORDER BY patients_enrolled ASC, s_sitename LIMIT 1
+    """,
+    "v_site_patients_bar": f"""
+        SELECT s_sitename, patients_enrolled FROM ({_SITE_ENROLLMENT}) t ORDER BY s_sitename
+    """,
+    "v_site_missed_visits": f"""
+        SELECT s_sitename, missed_visits FROM ({_SITE_VISITS}) t ORDER BY s_sitename
+    """,
+    "v_site_rescheduled_visits": f"""
+        SELECT s_sitename, rescheduled_visits FROM ({_SITE_VISITS}) t ORDER BY s_sitename
+    """,
+    "pa_site_gender_distribution": """
+        SELECT s.s_sitename, p.sex, count(*) AS patient_count
+        FROM dimpatient p JOIN dimsite s ON s.siteid = p.siteid
+        GROUP BY s.s_sitename, p.sex ORDER BY s.s_sitename, p.sex
+    """,
+    "v_pa_bucket_active_patients": f"""
+        SELECT p.agebucket AS age_bucket, count(*) AS active_patients
+        FROM dimpatient p JOIN ({_PATIENT_ADHERENCE}) a ON a.patientpk = p.patientpk
+        WHERE a.status = 'Active'
+        GROUP BY p.agebucket ORDER BY p.agebucket
+    """,
+
+    # Patient adherence
+    "v_pa_active_patient": f"""
+        SELECT count(*) AS "Total_Active_Patients" FROM ({_PATIENT_ADHERENCE}) a WHERE status = 'Active'
+    """,
+    "v_pa_dropout_rate": f"""
+        SELECT round(100.0 * count(*) FILTER (WHERE status = 'Dropout') / nullif(count(*), 0), 2) AS dropout_rate
+        FROM ({_PATIENT_ADHERENCE}) a
+    """,
+    "v_pa_adherence_rate": f"""
+        SELECT round(avg(adherence_rate), 2) AS adherence_rate FROM ({_PATIENT_ADHERENCE}) a
+    """,
+    "v_pa_pending_rate": """
+        SELECT round(100.0 * count(*) FILTER (WHERE visitstatus = 'Rescheduled') / nullif(count(*), 0), 2)
+                   AS pending_rate
+        FROM factvisits
+    """,
+    "v_pa_non_adherence_rate": """
+        SELECT round(100.0 * count(*) FILTER (WHERE visitstatus IN ('Missed', 'Rescheduled')) / nullif(count(*), 0), 2)
+                   AS non_adherence_rate
+        FROM factvisits
+    """,
+    "v_pa_adherence_category": f"""
+        SELECT adherence_category, count(*) AS patient_count
+        FROM ({_PATIENT_ADHERENCE}) a GROUP BY adherence_category ORDER BY adherence_category
+    """,
+    "v_pa_dropout_trend": f"""
+        SELECT {_month_abbr("last_visit")} AS month_name,
+               round(100.0 * count(*) FILTER (WHERE status = 'Dropout') / count(*), 2) AS dropout_percentage
+        FROM ({_PATIENT_ADHERENCE}) a
+        GROUP BY 1 ORDER BY min({_month_no("last_visit")})
+    """,
+    "v_pa_patient_details_table": f"""
+        SELECT a.patientpk, s.s_sitename, a.total_visits, a.completed_visits, a.missed_visits,
+               a.rescheduled_visits, a.adherence_rate, a.adherence_category, a.status
+        FROM ({_PATIENT_ADHERENCE}) a JOIN dimsite s ON s.siteid = a.siteid
+    """,
+    "v_pa_site_adherence_distribution": f"""
+        SELECT s.s_sitename, count(a.patientpk) AS patient_count
+        FROM dimsite s LEFT JOIN ({_PATIENT_ADHERENCE}) a
+               ON a.siteid = s.siteid AND a.adherence_category = 'High'
+        GROUP BY s.s_sitename ORDER BY s.s_sitename
+    """,
+
+    # Trial journey
+    "v_kpi1": """
+        SELECT (SELECT count(*) FROM factvisits) AS total_visits,
+               (SELECT count(*) FROM factscreeningenrollment WHERE screenresult = 'Passed') AS screening_passed,
+               (SELECT count(*) FROM factenrollment WHERE randomizedflag = 1) AS randomized,
+               (SELECT count(*) FROM factvisits WHERE coalesce(ae_reported, 'None') <> 'None') AS total_ae_reported,
+               (SELECT round(avg(medicationtakenpercent), 2) FROM factvisits) AS avg_medicationtakenpct
+    """,
+    "tj_screenresult": """
+        SELECT screenresult AS scr_screenresult, count(*) AS result_count
+        FROM factscreeningenrollment GROUP BY screenresult ORDER BY screenresult
+    """,
+    "tj_screenfailurreason": """
+        SELECT reasonforfailure AS scr_reasonforfailure, count(*) AS result_count
+        FROM factscreeningenrollment WHERE screenresult = 'Failed'
+        GROUP BY reasonforfailure ORDER BY reasonforfailure
+    """,
+    "tj_screensource": """
+        SELECT sourcecrf AS scr_sourcecrf, count(*) AS result_count
+        FROM factscreeningenrollment GROUP BY sourcecrf ORDER BY sourcecrf
+    """,
+    "tj_ediary_submission": """
+        SELECT s.s_sitename,
+               count(*) FILTER (WHERE v.ediarysubmitted = 'Y') AS submitted,
+               count(*) FILTER (WHERE v.ediarysubmitted <> 'Y') AS not_submitted
+        FROM factvisits v JOIN dimsite s ON s.siteid = v.siteid
+        GROUP BY s.s_sitename ORDER BY s.s_sitename
+    """,
+    "tj_weekly_site_visits": f"""
+        SELECT s.s_sitename, {_month_name("v.visitdate")} AS month_name, {_month_no("v.visitdate")} AS month_no,
+               {_month_name("v.visitdate")} AS month_label, count(*) AS total_visits
+        FROM factvisits v JOIN dimsite s ON s.siteid = v.siteid
+        GROUP BY 1, 2, 3, 4 ORDER BY 1, 3
+    """,
+    "tj_category_distribution_site": """
+        SELECT s.s_sitename, v.ae_reported AS category, count(*) AS count
+        FROM factvisits v JOIN dimsite s ON s.siteid = v.siteid
+        WHERE coalesce(v.ae_reported, 'None') <> 'None'
+        GROUP BY 1, 2 ORDER BY 1, 2
+    """,
+    "tj_ae_count": """
+        SELECT ae_reported AS category, count(*) AS count
+        FROM factvisits WHERE coalesce(ae_reported, 'None') <> 'None'
+        GROUP BY 1 ORDER BY 1
+    """,
+
+    # Operational metrics
+    "om_kpi2": """
+        SELECT sum(querycount) AS total_queries,
+               sum(querycount) - sum(queriesopen) AS closed_queries,
+               sum(queriesopen) AS open_queries,
+               round(avg(datacompletenesspct), 2) AS avg_query_completeness,
+               round(avg(timelinessscore), 2) AS avg_resolutontime
+        FROM factdataquality
+    """,
+    "om_querycompleteness": f"""
+        SELECT s_sitename, avg_querycompleteness FROM ({_SITE_OPERATIONS}) t ORDER BY s_sitename
+    """,
+    "om_medicationtakepercent": f"""
+        SELECT s_sitename, avg_medication_take_percent FROM ({_SITE_OPERATIONS}) t ORDER BY s_sitename
+    """,
+    "tj_timeliness": f"""
+        SELECT s_sitename, avg_timeliness FROM ({_SITE_OPERATIONS}) t ORDER BY s_sitename
+    """,
+    "tj_randomizedflag": f"""
+        SELECT s_sitename, randomized, no_randomized FROM ({_SITE_OPERATIONS}) t ORDER BY s_sitename
+    """,
+    "tj_table": f"""
+        SELECT * FROM ({_SITE_OPERATIONS}) t ORDER BY s_sitename
+    """,
+}
+
+# Rollup-backed equivalents of the views that are slices of the site x day
+# rollups (summaries.py). They cost sites x days rather than one pass over
+# the fact tables, filtered or not. Used only with ROLLUPS_ENABLED=1, and
+# each must return exactly the rows and columns of its view.
+_ROLLUP_VISITS = """
+    SELECT s.s_sitename,
+           coalesce(sum(r.visits) FILTER (WHERE r.visitstatus = 'Missed'), 0)::bigint AS missed_visits,
+           coalesce(sum(r.visits) FILTER (WHERE r.visitstatus = 'Rescheduled'), 0)::bigint AS rescheduled_visits
+    FROM dimsite s LEFT JOIN rollup_visits_site_day r ON r.siteid = s.siteid
+    GROUP BY s.s_sitename
+"""
+
+_ROLLUP_QUALITY = """
+    SELECT s.s_sitename,
+           round(sum(r.completeness_sum) / nullif(sum(r.completeness_n), 0), 2) AS avg_querycompleteness,
+           round(sum(r.timeliness_sum) / nullif(sum(r.timeliness_n), 0), 2) AS avg_timeliness
+    FROM dimsite s LEFT JOIN rollup_quality_site_day r ON r.siteid = s.siteid
+    GROUP BY s.s_sitename
+"""
+
+ROLLUP_SQL = {
+    "v_exec_visitstatus_donut": """
+        SELECT coalesce(sum(visits) FILTER (WHERE visitstatus = 'Completed'), 0)::bigint AS completed,
+               coalesce(sum(visits) FILTER (WHERE visitstatus = 'Missed'), 0)::bigint AS missed,
+               coalesce(sum(visits) FILTER (WHERE visitstatus = 'Rescheduled'), 0)::bigint AS rescheduled
+        FROM rollup_visits_site_day
+    """,
+    "v_site_missed_visits": f"""
+        SELECT s_sitename, missed_visits FROM ({_ROLLUP_VISITS}) t ORDER BY s_sitename
+    """,
+    "v_site_rescheduled_visits": f"""
+        SELECT s_sitename, rescheduled_visits FROM ({_ROLLUP_VISITS}) t ORDER BY s_sitename
+    """,
+    "tj_weekly_site_visits": f"""
+        SELECT s.s_sitename, {_month_name("r.day")} AS month_name, {_month_no("r.day")} AS month_no,
+               {_month_name("r.day")} AS month_label, sum(r.visits)::bigint AS total_visits
+        FROM rollup_visits_site_day r JOIN dimsite s ON s.siteid = r.siteid
+        GROUP BY 1, 2, 3, 4 ORDER BY 1, 3
+    """,
+    "tj_ediary_submission": """
+        SELECT s.s_sitename,
+               sum(r.ediary_submitted)::bigint AS submitted,
+               sum(r.ediary_not_submitted)::bigint AS not_submitted
+        FROM rollup_visits_site_day r JOIN dimsite s ON s.siteid = r.siteid
+        GROUP BY s.s_sitename ORDER BY s.s_sitename
+    """,
+    "om_medicationtakepercent": """
+        SELECT s.s_sitename,
+               round(sum(r.medication_taken_sum) / nullif(sum(r.medication_n), 0), 2) AS avg_medication_take_percent
+        FROM dimsite s LEFT JOIN rollup_visits_site_day r ON r.siteid = s.siteid
+        GROUP BY s.s_sitename ORDER BY s.s_sitename
+    """,
+    "om_querycompleteness": f"""
+        SELECT s_sitename, avg_querycompleteness FROM ({_ROLLUP_QUALITY}) t ORDER BY s_sitename
+    """,
+    "tj_timeliness": f"""
+        SELECT s_sitename, avg_timeliness FROM ({_ROLLUP_QUALITY}) t ORDER BY s_sitename
+    """,
+}
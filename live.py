@@ -0,0 +1,251 @@
+"""
+Server-push KPI updates (Server-Sent Events on /api/live).
+
+One Broadcaster per worker owns the live KPI sets in LIVE_TOPICS. It
+recomputes them once per data change and pushes only the cards that
+changed to every connected client, so database load no longer grows with
+the number of open dashboards.
+
+A change is noticed two ways:
+  - Postgres NOTIFY on ingest.NOTIFY_CHANNEL, sent by every full or delta
+    load when it commits (a listener thread holds one extra connection);
+  - the data version (versioning.py), checked every LIVE_POLL_SECONDS,
+    which also catches snapshot refreshes and the embedded engine.
+
+Nothing is computed while nobody is connected.
+"""
+import asyncio
+import os
+import select
+import threading
+import time
+
+from cache import result_cache
+from database import DB_MODE, fetch_many, get_connection
+from filters import view_query
+from ingest import NOTIFY_CHANNEL
+from responses import dumps
+import versioning
+
+LIVE_POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", "10"))
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "16"))
+
+# topic -> {card: view}. Each card is the first row of its view.
+LIVE_TOPICS = {
+    "exec": {
+        "kpis": "v_exec_kpis",
+        "enrollment_gauge": "v_exec_enrollment_gauge",
+        "visit_status": "v_exec_visitstatus_donut",
+    },
+    "siteanalysis": {
+        "total_active_sites": "v_site_total_active",
+        "avg_patients_per_site": "v_site_avg_patients",
+        "top_performer": "v_site_top_performer",
+        "least_performer": "v_site_least_performer",
+    },
+    "adherence": {
+        "active": "v_pa_Active_Patient",
+        "dropout_rate": "v_pa_dropout_rate",
+        "adherence_rate": "v_pa_adherence_rate",
+        "non_adherence_rate": "v_pa_non_adherence_rate",
+        "pending_rate": "v_pa_pending_rate",
+    },
+    "trialjourney": {
+        "kpis": "v_kpi1",
+    },
+    "operationalmetrics": {
+        "main_kpis": "om_kpi2",
+    },
+}
+
+
+def sse(event: str, data, event_id=None):
+    """One Server-Sent Events message."""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + dumps(data).decode("utf-8"))
+    return "\n".join(lines) + "\n\n"
+
+
+class _Listener(threading.Thread):
+    """LISTENs on NOTIFY_CHANNEL and calls on_notify(payload) for each notification."""
+
+    def __init__(self, on_notify):
+        super().__init__(name="live-listen", daemon=True)
+        self.on_notify = on_notify
+        self.stop = threading.Event()
+
+    def run(self):
+        backoff = 1
+        while not self.stop.is_set():
+            try:
+                conn = get_connection()
+            except Exception:
+                self.stop.wait(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = 1
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {NOTIFY_CHANNEL};")
+                while not self.stop.is_set():
+                    if select.select([conn], [], [], 5)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            self.on_notify(conn.notifies.pop(0).payload)
+            except Exception:
+                self.stop.wait(backoff)  # connection dropped: reconnect
+            finally:
+                conn.close()
+
+
+class Broadcaster:
+    def __init__(self, topics=LIVE_TOPICS):
+        self.topics = topics
+        self._subscribers = {}      # queue -> set of topics
+        self._state = {}            # topic -> {card: row}
+        self._version = None
+        self._changed = asyncio.Event()
+        self._compute_lock = asyncio.Lock()
+        self._task = None
+        self._listener = None
+        self.computations = 0
+
+    # --- lifecycle (startup / shutdown hooks) ---
+    async def start(self):
+        if self._task is not None:
+            return
+        loop = asyncio.get_running_loop()
+        if DB_MODE != "embedded":
+            self._listener = _Listener(lambda payload: loop.call_soon_threadsafe(self._notified))
+            self._listener.start()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.stop.set()
+            self._listener = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _notified(self):
+        result_cache.invalidate()   # don't wait for the version check to drop stale results
+        versioning.expire()
+        self._version = None        # force a recompute even if the version looks unchanged
+        self._changed.set()
+
+    # --- computing ---
+    async def _compute(self):
+        queries = {}
+        for topic, cards in self.topics.items():
+            for card, view in cards.items():
+                queries[f"{topic}.{card}"] = await view_query(view)
+        results, _ = await fetch_many(queries)
+        state = {topic: {} for topic in self.topics}
+        for name, rows in results.items():
+            topic, card = name.split(".", 1)
+            state[topic][card] = rows[0] if rows else None
+        self.computations += 1
+        return state
+
+    async def _refresh(self):
+        """Recompute if the data moved; returns {topic: {changed cards}} (empty if nothing changed)."""
+        async with self._compute_lock:
+            version = await versioning.current_version()
+            if version == self._version and self._state:
+                return {}
+            new_state = await self._compute()
+            diff = {}
+            for topic, cards in new_state.items():
+                old = self._state.get(topic, {})
+                changed = {card: row for card, row in cards.items() if old.get(card) != row}
+                if changed:
+                    diff[topic] = changed
+            self._state, self._version = new_state, version
+            return diff
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=LIVE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            if not self._subscribers:
+                continue
+            try:
+                diff = await self._refresh()
+            except Exception as e:
+                print(f"Warning: live KPI refresh failed: {e}")
+                continue
+            if diff:
+                self._publish(diff)
+
+    # --- fan-out ---
+    def _publish(self, diff):
+        for queue, topics in list(self._subscribers.items()):
+            update = {t: cards for t, cards in diff.items() if t in topics}
+            if not update:
+                continue
+            try:
+                queue.put_nowait(("update", update))
+            except asyncio.QueueFull:
+                # slow client: drop its backlog and resend everything it follows
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("snapshot", self.snapshot(topics)))
+
+    def snapshot(self, topics):
+        return {t: self._state.get(t, {}) for t in topics}
+
+    async def subscribe(self, topics):
+        """Register a client; returns (queue, initial snapshot)."""
+        if not self._state:
+            await self._refresh()
+        queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        self._subscribers[queue] = set(topics)
+        return queue, self.snapshot(topics)
+
+    def unsubscribe(self, queue):
+        self._subscribers.pop(queue, None)
+
+    @property
+    def version(self):
+        return self._version
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscribers),
+            "computations": self.computations,
+            "version": self._version,
+            "listening": self._listener is not None and self._listener.is_alive(),
+        }
+
+
+broadcaster = Broadcaster()
+
+
+async def event_stream(request, topics):
+    """SSE body for one client: a snapshot, then updates, with keep-alive comments."""
+    queue, initial = await broadcaster.subscribe(topics)
+    try:
+        yield sse("snapshot", initial, broadcaster.version)
+        while True:
+            if await request.is_disconnected():
+                break
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout=LIVE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield f": keep-alive {int(time.time())}\n\n"
+                continue
+            yield sse(event, data, broadcaster.version)
+    finally:
+        broadcaster.unsubscribe(queue)
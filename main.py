@@ -1,8 +1,34 @@
+import os
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import executive, siteanalysis, adherence, trialjourney, operationalmetrics
+from compression import CompressionMiddleware
+from responses import FastJSONResponse
+import static_export
+from static_export import StaticSnapshotMiddleware
+import versioning
+from versioning import ETagMiddleware
+from cache import result_cache
+import metrics
+from routers import executive, siteanalysis, adherence, trialjourney, operationalmetrics, admin, export, batch, alerts, live as live_router
+import database
+import snapshots
+import warmup
+from live import broadcaster
+
+app = FastAPI(title="Clinical Dashboard API", version="1.0.0", default_response_class=FastJSONResponse)
+
+# Pre-rendered payloads (static_export.py): /static/<version>/... and unfiltered
+# /api GETs while the export matches the data version. Innermost, so ETags,
+# CORS and metrics still apply and compression passes the precompressed files through.
+app.add_middleware(StaticSnapshotMiddleware)
 
-app = FastAPI(title="Clinical Dashboard API", version="1.0.0")
+# Response compression (br/gzip, negotiated); bodies under the threshold are sent as-is
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# ETag / If-None-Match on every /api GET, keyed on the data version
+app.add_middleware(ETagMiddleware)
 
 # CORS middleware - UPDATE THIS FOR PRODUCTION
 app.add_middleware(
@@ -11,14 +37,64 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Data-As-Of", "ETag"],
 )
 
+# Per-route latency histograms (outermost, so the timing covers every middleware above)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Include routers
 app.include_router(executive.router, prefix="/api", tags=["Executive Summary"])
 app.include_router(siteanalysis.router, prefix="/api", tags=["Site Analysis"])
 app.include_router(adherence.router, prefix="/api", tags=["Patient Adherence"])
 app.include_router(trialjourney.router, prefix="/api", tags=["Trial Journey"])
 app.include_router(operationalmetrics.router, prefix="/api", tags=["Operational Metrics"])
+app.include_router(export.router, prefix="/api", tags=["Data Export"])
+app.include_router(batch.router, prefix="/api", tags=["Batch"])
+app.include_router(alerts.router, prefix="/api", tags=["Alerts"])
+app.include_router(admin.router, prefix="/api", tags=["Admin"])
+app.include_router(live_router.router, prefix="/api", tags=["Live Updates"])
+
+# Shared connection pool lifecycle
+@app.on_event("startup")
+def open_db_pool():
+    if database.DB_MODE == "embedded":
+        import embedded
+        embedded.get_engine()  # load the CSVs before the first request
+        return
+    try:
+        database.get_pool().fill()
+    except Exception as e:
+        # keep serving; the pool retries on the first request
+        print(f"Warning: could not pre-open database connections: {e}")
+    snapshots.start_scheduler()
+
+@app.on_event("startup")
+async def open_async_db_pool():
+    # only opens anything when DB_MODE=async
+    await database.open_async_pool()
+
+@app.on_event("startup")
+async def start_live_updates():
+    await broadcaster.start()
+
+@app.on_event("startup")
+async def start_warmup():
+    # prepares and pre-runs the dashboard queries; /health is 503 until done
+    warmup.start()
+
+@app.on_event("shutdown")
+def close_db_pool():
+    snapshots.stop_scheduler()
+    database.close_pool()
+
+@app.on_event("shutdown")
+async def stop_live_updates():
+    await broadcaster.stop()
+
+@app.on_event("shutdown")
+async def close_async_db_pool():
+    await database.close_async_pool()
 
 @app.get("/")
 def read_root():
@@ -26,12 +102,41 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
+    if not warmup.state["ready"]:
+        return FastJSONResponse({"status": "warming", "worker_pid": os.getpid(), "warmup": warmup.state},
+                                status_code=503)
+    return {"status": "healthy", "worker_pid": os.getpid(), "warmup": warmup.state, "db_pool": database.pool_stats(),
+            "layers": active_layers()}
 
-# ADD THIS FOR RAILWAY DEPLOYMENT
-import os
+def active_layers():
+    """Which response-reuse layers are on (benchmarks/load_test.py reports these)."""
+    return {"result_cache": result_cache.enabled, "etags": versioning.ETAGS_ENABLED,
+            "static_serve": static_export.STATIC_SERVE}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus text format: request latency, query time, rows, serialization, pool wait."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
+def worker_count():
+    """WORKERS (or WEB_CONCURRENCY) workers, 1 by default; "auto" = one per CPU, or 1 in embedded mode."""
+    setting = os.environ.get("WORKERS") or os.environ.get("WEB_CONCURRENCY") or "1"
+    if setting != "auto":
+        return max(int(setting), 1)
+    if database.DB_MODE == "embedded":
+        return 1  # every worker would hold its own copy of the dataset
+    return os.cpu_count() or 1
+
+# ADD THIS FOR RAILWAY DEPLOYMENT
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False)
\ No newline at end of file
+    workers = worker_count()
+    if workers > 1:
+        # workers share computed view results through result_store.py
+        os.environ.setdefault("RESULT_STORE", "sqlite")
+        if os.environ["RESULT_STORE"] == "sqlite":
+            import result_store
+            result_store.SqliteStore().invalidate()  # drop results left by a previous run
+    print(f"Starting {workers} worker(s), result store: {os.environ.get('RESULT_STORE', 'none')}")
+    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False, workers=workers)
\ No newline at end of file
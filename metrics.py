@@ -0,0 +1,224 @@
+"""
+Request / query instrumentation, exposed in Prometheus text format at /metrics.
+
+    http_request_duration_seconds{method,route,status}  histogram, per route template
+    http_response_serialize_seconds{route}              histogram, JSON encoding time
+    db_query_duration_seconds{view,mode}                histogram, SQL execution (cache misses only)
+    db_query_rows{view}                                 histogram, rows returned
+    db_pool_acquire_wait_seconds                        histogram, wait for a pooled connection
+    result_cache_* / db_pool_*                          gauges copied from cache and pool stats
+
+Values are per worker process. With SLOW_QUERY_MS set, any query slower
+than that has its plan captured with EXPLAIN (ANALYZE, BUFFERS) in the
+background (at most once per view every SLOW_QUERY_EXPLAIN_INTERVAL
+seconds); the latest plans are listed at /api/admin/slow-queries.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+
+from cache import result_cache, view_name
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "False")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))  # 0 = slow-query log off
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "50"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed label set (thread-safe)."""
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+            items = [(labels, list(series)) for labels, series in items]
+        for labels, series in items:
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+request_latency = Histogram("http_request_duration_seconds", "HTTP request latency by route template.",
+                            ("method", "route", "status"))
+serialize_time = Histogram("http_response_serialize_seconds", "Time spent encoding JSON response bodies.",
+                           ("route",))
+query_time = Histogram("db_query_duration_seconds", "SQL execution time of cache misses, by view.",
+                       ("view", "mode"))
+query_rows = Histogram("db_query_rows", "Rows returned per executed query, by view.", ("view",), ROW_BUCKETS)
+acquire_wait = Histogram("db_pool_acquire_wait_seconds", "Time spent waiting for a pooled connection.")
+
+HISTOGRAMS = (request_latency, serialize_time, query_time, query_rows, acquire_wait)
+
+# the ASGI scope of the request being handled, so render() can label by route
+_current_scope = contextvars.ContextVar("metrics_scope", default=None)
+
+
+def query_label(sql: str):
+    """The view a query answers; the same label the result cache uses (cache.view_name)."""
+    return view_name(sql) or "other"
+
+
+def route_label(scope):
+    scope = scope or {}
+    path = getattr(scope.get("route"), "path", None)
+    if path is None:
+        # answered from the static export before reaching a route
+        return f"static:{scope['static_route']}" if "static_route" in scope else "unmatched"
+    # newer FastAPI keeps the include_router() prefix outside the route's own path
+    included = (scope.get("fastapi") or {}).get("included_router")
+    prefix = getattr(getattr(included, "include_context", None), "prefix", "") or ""
+    return prefix + path
+
+
+def current_route():
+    return route_label(_current_scope.get())
+
+
+# --- query timing (called from database.py) ---
+
+def record_query(sql, params, seconds, rows, mode):
+    if not METRICS_ENABLED:
+        return
+    view = query_label(sql)
+    query_time.observe(seconds, view, mode)
+    query_rows.observe(rows, view)
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS and mode != "embedded":
+        slow_queries.capture(view, sql, params, seconds * 1000)
+
+
+class SlowQueryLog:
+    """Recent slow queries with their EXPLAIN (ANALYZE, BUFFERS) plans."""
+
+    def __init__(self, size=SLOW_QUERY_LOG_SIZE, interval=SLOW_QUERY_EXPLAIN_INTERVAL):
+        self.entries = deque(maxlen=size)
+        self.interval = interval
+        self._last_explained = {}  # view -> monotonic time
+        self._lock = threading.Lock()
+
+    def capture(self, view, sql, params, ms):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_explained.get(view, -self.interval) < self.interval:
+                return
+            self._last_explained[view] = now
+        threading.Thread(target=self._explain, args=(view, sql, params, ms), daemon=True,
+                         name="slow-query-explain").start()
+
+    def _explain(self, view, sql, params, ms):
+        # its own connection: EXPLAIN ANALYZE re-runs the query and must not hold a pool slot
+        from database import get_connection
+
+        entry = {"view": view, "ms": round(ms, 1), "at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                 "sql": " ".join(sql.split())}
+        try:
+            conn = get_connection()
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql.strip().rstrip(";"), params or ())
+                    entry["plan"] = "\n".join(row[0] for row in cur.fetchall())
+            finally:
+                conn.close()
+        except Exception as e:
+            entry["error"] = str(e).splitlines()[0]
+        print(f"Slow query: {view} took {entry['ms']} ms")
+        with self._lock:
+            self.entries.appendleft(entry)
+
+    def recent(self):
+        with self._lock:
+            return list(self.entries)
+
+
+slow_queries = SlowQueryLog()
+
+
+# --- request timing ---
+
+class MetricsMiddleware:
+    """Times every HTTP request, labelled by its route template (e.g. /api/exec/kpis)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        token = _current_scope.set(scope)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_scope.reset(token)
+            # the router adds the matched route to the scope on the way in
+            request_latency.observe(time.perf_counter() - started, scope["method"], route_label(scope), status)
+
+
+def render():
+    """Prometheus text exposition of every metric."""
+    from database import pool_stats
+
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    cache_stats = result_cache.stats()
+    gauges = {f"result_cache_{k}": v for k, v in cache_stats.items()
+              if isinstance(v, (int, float)) and not isinstance(v, bool)}
+    for k, v in (cache_stats["shared"] or {}).items():
+        if isinstance(v, (int, float)):
+            gauges[f"result_store_{k}"] = v
+    pool = pool_stats()
+    for prefix, stats in (pool.items() if "sync" in pool else [("", pool)]):
+        for k, v in stats.items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                gauges[f"db_pool_{prefix + '_' if prefix else ''}{k}"] = v
+    for name, value in gauges.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {float(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,102 @@
+"""
+Project-wide JSON response path.
+
+FastJSONResponse encodes Decimal, date and datetime straight from the
+view rows (orjson when installed, stdlib json otherwise). FastJSONRoute
+hands endpoint return values to it directly, skipping FastAPI's
+jsonable_encoder pass over every row.
+"""
+import functools
+import inspect
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi import Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+import metrics
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        body = dumps(content)
+        metrics.serialize_time.observe(time.perf_counter() - started, metrics.current_route())
+        return body
+
+
+def _wrap_endpoint(endpoint, status_code):
+    """
+    Wrap an endpoint so plain return values become FastJSONResponse. The
+    wrapper borrows (or adds) the endpoint's `Response` parameter so headers
+    set on it, like Server-Timing, still reach the client.
+    """
+    signature = inspect.signature(endpoint)
+    response_param = next(
+        (name for name, p in signature.parameters.items() if p.annotation is Response), None
+    )
+    injected = response_param is None
+    if injected:
+        response_param = "_response"
+        signature = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter(response_param, inspect.Parameter.KEYWORD_ONLY, annotation=Response),
+        ])
+
+    def build(result, sub_response):
+        if isinstance(result, Response):
+            return result
+        response = FastJSONResponse(result, status_code=sub_response.status_code or status_code or 200)
+        response.headers.raw.extend(sub_response.headers.raw)
+        return response
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            sub_response = kwargs.pop(response_param) if injected else kwargs[response_param]
+            return build(await endpoint(*args, **kwargs), sub_response)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            sub_response = kwargs.pop(response_param) if injected else kwargs[response_param]
+            return build(endpoint(*args, **kwargs), sub_response)
+
+    wrapper.__signature__ = signature
+    return wrapper
+
+
+class FastJSONRoute(APIRoute):
+    """APIRoute whose endpoint results are rendered by FastJSONResponse."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        response_model = kwargs.get("response_model")
+        no_model = response_model is None or (
+            isinstance(response_model, DefaultPlaceholder)
+            and inspect.signature(endpoint).return_annotation is inspect.Signature.empty
+        )
+        if no_model:
+            endpoint = _wrap_endpoint(endpoint, kwargs.get("status_code"))
+        super().__init__(path, endpoint, **kwargs)
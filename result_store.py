@@ -0,0 +1,244 @@
+"""
+Result store shared by every worker process (second level behind cache.TTLCache).
+
+With several uvicorn workers each process has its own TTLCache, so the
+first request for a view in every worker would hit the database. The
+shared store sits behind it: a local miss looks here before running the
+query, and every computed result is written here for the other workers.
+
+    RESULT_STORE=redis   REDIS_URL (any Redis-compatible server; needs the redis package)
+    RESULT_STORE=sqlite  one SQLite file in shared memory (/dev/shm), for workers on one host
+    RESULT_STORE=none    per-process caching only (default for a single worker)
+
+When unset, redis is used if REDIS_URL is set; `python main.py` switches
+to sqlite itself when it starts more than one worker. Invalidation
+(admin endpoint, snapshot refresh, data version change) clears the
+matching entries from the store and bumps a generation counter kept in
+it. Every worker compares that counter with the one it last saw (at most
+every CACHE_SHARED_SYNC_SECONDS, see cache.py) and drops its own cache
+when it moved, so an invalidation in one worker reaches the others
+within that interval. Store errors never fail a request: the
+store is skipped for a while and queries go to the database.
+
+Values are stored as JSON, never pickled, so whoever can write to the
+store cannot make the workers run code. Decimals, dates and datetimes
+are tagged ({"$decimal": "86.10"}) and come back with their types.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import redis
+except ImportError:  # optional dependency, only needed for RESULT_STORE=redis
+    redis = None
+
+REDIS_URL = os.getenv("REDIS_URL")
+RESULT_STORE = os.getenv("RESULT_STORE", "redis" if REDIS_URL else "none").lower()
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "clinical_dashboard_results.sqlite"))
+RESULT_STORE_PREFIX = os.getenv("RESULT_STORE_PREFIX", "dash")
+RESULT_STORE_RETRY_SECONDS = 30
+
+
+def _digest(key):
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+_TAGS = {"$decimal": Decimal, "$datetime": datetime.fromisoformat, "$date": date.fromisoformat}
+
+
+def _tag(value):
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _untag(obj):
+    if len(obj) == 1:
+        (tag, text), = obj.items()
+        if tag in _TAGS:
+            return _TAGS[tag](text)
+    return obj
+
+
+def _encode(value) -> bytes:
+    return json.dumps(value, default=_tag, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _decode(blob):
+    return json.loads(blob, object_hook=_untag)
+
+
+class _Store:
+    """Common error handling: a failing store is skipped for RESULT_STORE_RETRY_SECONDS."""
+
+    def __init__(self):
+        self._down_until = 0.0
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _guard(self, fn, default=None):
+        if time.monotonic() < self._down_until:
+            return default
+        try:
+            if self._pid != os.getpid():  # opened lazily in each (forked) worker
+                self._open()
+                self._pid = os.getpid()
+            return fn()
+        except Exception as e:
+            self.errors += 1
+            self._down_until = time.monotonic() + RESULT_STORE_RETRY_SECONDS
+            print(f"Warning: shared result store unavailable ({e}); using per-worker cache only")
+            return default
+
+    def get(self, key):
+        """(True, value) on a hit, (False, None) otherwise."""
+        blob = self._guard(lambda: self._get(key[0], _digest(key)))
+        try:
+            found = (True, _decode(blob)) if blob is not None else (False, None)
+        except ValueError:  # not ours (e.g. written by an older version): a miss
+            found = (False, None)
+        if found[0]:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    def set(self, key, value, ttl):
+        try:
+            blob = _encode(value)
+        except (TypeError, ValueError):
+            return  # not JSON: kept in this worker's cache only
+        self._guard(lambda: self._set(key[0], _digest(key), blob, ttl))
+
+    def invalidate(self, views=None):
+        """Drop the matching entries and bump the generation; returns the new generation (None on error)."""
+        def invalidate():
+            self._invalidate(views)
+            return self._bump()
+        return self._guard(invalidate)
+
+    def generation(self):
+        """Invalidation counter shared by all workers (None while the store is unavailable)."""
+        return self._guard(self._generation)
+
+    def stats(self):
+        return {"backend": self.backend, "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+class SqliteStore(_Store):
+    backend = "sqlite"
+
+    def __init__(self, path=RESULT_STORE_PATH):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=OFF;")  # a cache: losing it on power loss is fine
+        conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                            key TEXT PRIMARY KEY, view TEXT NOT NULL, expires_at REAL NOT NULL, value BLOB NOT NULL);""")
+        conn.execute("CREATE INDEX IF NOT EXISTS results_view_idx ON results (view);")
+        conn.execute("CREATE INDEX IF NOT EXISTS results_expires_idx ON results (expires_at);")
+        conn.execute("CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY CHECK (id = 1), value INTEGER NOT NULL);")
+        conn.execute("INSERT OR IGNORE INTO generation (id, value) VALUES (1, 0);")
+        self._conn = conn
+
+    def _get(self, view, digest):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM results WHERE key = ? AND expires_at > ?;",
+                                     (digest, time.time())).fetchone()
+        return row[0] if row else None
+
+    def _set(self, view, digest, blob, ttl):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO results (key, view, expires_at, value) VALUES (?, ?, ?, ?);",
+                               (digest, view, now + ttl, blob))
+            self._conn.execute("DELETE FROM results WHERE expires_at <= ?;", (now,))
+
+    def _invalidate(self, views):
+        with self._lock:
+            if views:
+                wanted = [v.lower() for v in views]
+                self._conn.execute(f"DELETE FROM results WHERE view IN ({', '.join('?' * len(wanted))});", wanted)
+            else:
+                self._conn.execute("DELETE FROM results;")
+
+    def _bump(self):
+        with self._lock:
+            self._conn.execute("UPDATE generation SET value = value + 1 WHERE id = 1;")
+            return self._conn.execute("SELECT value FROM generation WHERE id = 1;").fetchone()[0]
+
+    def _generation(self):
+        with self._lock:
+            return self._conn.execute("SELECT value FROM generation WHERE id = 1;").fetchone()[0]
+
+
+class RedisStore(_Store):
+    backend = "redis"
+
+    def __init__(self, url=REDIS_URL, prefix=RESULT_STORE_PREFIX):
+        super().__init__()
+        if redis is None:
+            raise RuntimeError("RESULT_STORE=redis needs the redis package (pip install redis)")
+        self.url = url
+        self.prefix = prefix
+        self._client = None
+
+    def _open(self):
+        self._client = redis.Redis.from_url(self.url, socket_timeout=1, socket_connect_timeout=1)
+
+    def _name(self, view, digest):
+        return f"{self.prefix}:{view}:{digest}"
+
+    def _get(self, view, digest):
+        return self._client.get(self._name(view, digest))
+
+    def _set(self, view, digest, blob, ttl):
+        self._client.set(self._name(view, digest), blob, px=max(int(ttl * 1000), 1))
+
+    def _invalidate(self, views):
+        patterns = [f"{self.prefix}:{v.lower()}:*" for v in views] if views else [f"{self.prefix}:*"]
+        for pattern in patterns:
+            batch = []
+            for name in self._client.scan_iter(match=pattern, count=500):
+                batch.append(name)
+                if len(batch) >= 500:
+                    self._client.delete(*batch)
+                    batch = []
+            if batch:
+                self._client.delete(*batch)
+
+    def _generation_name(self):
+        return f"{self.prefix}.generation"  # outside the {prefix}:* entries a full invalidation deletes
+
+    def _bump(self):
+        return self._client.incr(self._generation_name())
+
+    def _generation(self):
+        return int(self._client.get(self._generation_name()) or 0)
+
+
+def make_store(kind=RESULT_STORE):
+    if kind == "redis":
+        return RedisStore()
+    if kind == "sqlite":
+        return SqliteStore()
+    return None
@@ -1,71 +1,68 @@
 # backend/routers/adherence.py
-from fastapi import APIRouter, HTTPException, Query
-from psycopg2.extras import RealDictCursor
-from database import get_connection
+import base64
+import json
+from datetime import date
+from decimal import Decimal
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from database import fetch_all, fetch_many, server_timing
+from filters import DashboardFilter, check_definition, view_query, with_clause
+from snapshots import snapshot_source
+from visit_windows import compliance_query
+from responses import FastJSONRoute
 
-router = APIRouter(prefix="/adherence", tags=["Patient Adherence"])
-
-def run_query(sql: str, params: tuple = None):
-    """Helper to run a SQL query and return list[dict]."""
-    conn = get_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(sql, params or ())
-            rows = cur.fetchall()
-            return rows
-    finally:
-        conn.close()
+router = APIRouter(prefix="/adherence", tags=["Patient Adherence"], route_class=FastJSONRoute)
 
 # 1) Active patients KPI
 @router.get("/active")
-def get_active_patients():
+async def get_active_patients(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_pa_Active_Patient;")
+        rows = await fetch_all(*await view_query("v_pa_Active_Patient", filters))
         return rows[0] if rows else {"Total_Active_Patients": 0}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 2) Dropout rate KPI
 @router.get("/dropout-rate")
-def get_dropout_rate():
+async def get_dropout_rate(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_pa_dropout_rate;")
+        rows = await fetch_all(*await view_query("v_pa_dropout_rate", filters))
         return rows[0] if rows else {"dropout_rate": 0.0}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 3) Adherence rate (avg across patients)
 @router.get("/adherence-rate")
-def get_adherence_rate():
+async def get_adherence_rate(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_pa_adherence_rate;")
+        rows = await fetch_all(*await view_query("v_pa_adherence_rate", filters))
         return rows[0] if rows else {"adherence_rate": 0.0}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 4) Pending (Rescheduled) rate
 @router.get("/pending-rate")
-def get_pending_rate():
+async def get_pending_rate(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_pa_pending_rate;")
+        rows = await fetch_all(*await view_query("v_pa_pending_rate", filters))
         return rows[0] if rows else {"pending_rate": 0.0}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 5) Non-adherence rate (Missed + Rescheduled)
 @router.get("/non-adherence-rate")
-def get_non_adherence_rate():
+async def get_non_adherence_rate(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_pa_non_adherence_rate;")
+        rows = await fetch_all(*await view_query("v_pa_non_adherence_rate", filters))
         return rows[0] if rows else {"non_adherence_rate": 0.0}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 6) Adherence categories (High/Medium/Low) - returns counts per category
 @router.get("/categories")
-def get_adherence_categories():
+async def get_adherence_categories(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_pa_adherence_category;")
+        rows = await fetch_all(*await view_query("v_pa_adherence_category", filters))
         # view returns rows: {adherence_category, patient_count}
         return rows
     except Exception as e:
@@ -73,55 +70,122 @@ def get_adherence_categories():
 
 # 7) Dropout trend (month_name, dropout_percentage)
 @router.get("/dropout-trend")
-def get_dropout_trend():
+async def get_dropout_trend(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_pa_dropout_trend ORDER BY month_name;")
+        prefix, params = with_clause("v_pa_dropout_trend", filters)
+        rows = await fetch_all(f"{prefix}SELECT * FROM v_pa_dropout_trend ORDER BY month_name;", params)
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 8) Patient detail table (paginated)
 
+def encode_cursor(row, direction: str):
+    """Opaque token pointing just after/before `row` in (adherence_rate DESC, patientpk) order."""
+    rate = row["adherence_rate"]
+    payload = {"r": None if rate is None else str(rate), "k": row["patientpk"], "d": direction}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def decode_cursor(token: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        rate = None if payload["r"] is None else Decimal(payload["r"])
+        if payload["d"] not in ("next", "prev"):
+            raise ValueError(payload["d"])
+        return rate, payload["k"], payload["d"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def seek_predicate(rate, pk, direction: str):
+    """WHERE clause for rows after (next) or before (prev) the cursor position."""
+    if direction == "next":
+        if rate is None:
+            return "adherence_rate IS NULL AND patientpk > %s", (pk,)
+        return ("(adherence_rate < %s OR (adherence_rate = %s AND patientpk > %s) OR adherence_rate IS NULL)",
+                (rate, rate, pk))
+    if rate is None:
+        return "(adherence_rate IS NOT NULL OR patientpk < %s)", (pk,)
+    return "(adherence_rate > %s OR (adherence_rate = %s AND patientpk < %s))", (rate, rate, pk)
+
 @router.get("/patient-details")
-def get_patient_details(page: int = Query(1, ge=1), page_size: int = Query(50, ge=1, le=1000)):
+async def get_patient_details(page: int = Query(1, ge=1), page_size: int = Query(50, ge=1, le=1000),
+                        cursor: Optional[str] = None, filters: DashboardFilter = Depends()):
     """
     Returns paginated patient adherence details.
     page (1-based), page_size (default 50).
+
+    Pass the returned next_cursor / prev_cursor as `cursor` to page by seek
+    on (adherence_rate, patientpk) instead of OFFSET, so deep pages cost the
+    same as the first one. `page` is kept for existing clients.
     """
     try:
-        offset = (page - 1) * page_size
-        sql = f"""
-            SELECT *
-            FROM v_pa_patient_details_table
-            ORDER BY adherence_rate DESC NULLS LAST
-            LIMIT %s OFFSET %s;
-        """
-        rows = run_query(sql, (page_size, offset))
-        # also return total count (use a separate lightweight query)
-        count_row = run_query("SELECT COUNT(*) AS total_rows FROM (SELECT patientpk FROM v_pa_patient_details_table) t;")
+        # filtered requests read the view definition over filtered base tables
+        prefix, filter_params = with_clause("v_pa_patient_details_table", filters)
+        if filters:
+            await check_definition("v_pa_patient_details_table")
+            relation, columns = "v_pa_patient_details_table", "*"
+        else:
+            relation, columns = await snapshot_source("v_pa_patient_details_table")
+        order_desc = "adherence_rate DESC NULLS LAST, patientpk ASC"
+        order_asc = "adherence_rate ASC NULLS FIRST, patientpk DESC"
+
+        if cursor:
+            rate, pk, direction = decode_cursor(cursor)
+            where, params = seek_predicate(rate, pk, direction)
+            order = order_desc if direction == "next" else order_asc
+            sql = f"{prefix}SELECT {columns} FROM {relation} WHERE {where} ORDER BY {order} LIMIT %s;"
+            rows = await fetch_all(sql, filter_params + params + (page_size + 1,))
+        else:
+            direction = "next"
+            offset = (page - 1) * page_size
+            sql = f"{prefix}SELECT {columns} FROM {relation} ORDER BY {order_desc} LIMIT %s OFFSET %s;"
+            rows = await fetch_all(sql, filter_params + (page_size + 1, offset))
+
+        has_more = len(rows) > page_size
+        rows = list(rows[:page_size])
+        if direction == "prev":
+            rows.reverse()
+        has_next = has_more if direction == "next" else True
+        has_prev = (bool(cursor) or page > 1) if direction == "next" else has_more
+
+        # total count is cached with the other view results instead of re-counted per page
+        count_row = await fetch_all(f"{prefix}SELECT COUNT(*) AS total_rows FROM {relation};", filter_params)
         total_rows = count_row[0]["total_rows"] if count_row else 0
         return {
             "page": page,
             "page_size": page_size,
             "total_rows": total_rows,
+            "next_cursor": encode_cursor(rows[-1], "next") if rows and has_next else None,
+            "prev_cursor": encode_cursor(rows[0], "prev") if rows and has_prev else None,
             "data": rows
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # 9) Combined KPIs endpoint (useful for single API call)
 @router.get("/kpis")
-def get_all_kpis():
+async def get_all_kpis(response: Response, filters: DashboardFilter = Depends()):
     """
     Returns a combined JSON with the main KPIs to populate the top scorecards.
     """
     try:
-        active = run_query("SELECT * FROM v_pa_Active_Patient;")
-        dropout = run_query("SELECT * FROM v_pa_dropout_rate;")
-        adherence = run_query("SELECT * FROM v_pa_adherence_rate;")
-        non_ad = run_query("SELECT * FROM v_pa_non_adherence_rate;")
-        pending = run_query("SELECT * FROM v_pa_pending_rate;")
+        results, timings = await fetch_many({
+            "active": await view_query("v_pa_Active_Patient", filters),
+            "dropout_rate": await view_query("v_pa_dropout_rate", filters),
+            "adherence_rate": await view_query("v_pa_adherence_rate", filters),
+            "non_adherence_rate": await view_query("v_pa_non_adherence_rate", filters),
+            "pending_rate": await view_query("v_pa_pending_rate", filters),
+        })
+        response.headers["Server-Timing"] = server_timing(timings)
+
+        active = results["active"]
+        dropout = results["dropout_rate"]
+        adherence = results["adherence_rate"]
+        non_ad = results["non_adherence_rate"]
+        pending = results["pending_rate"]
         return {
             "active": active[0] if active else {"Total_Active_Patients": 0},
             "dropout_rate": dropout[0] if dropout else {"dropout_rate": 0.0},
@@ -135,10 +199,28 @@ def get_all_kpis():
 
 # 10) Site Adherence Distribution
 @router.get("/site-adherence-distribution")
-def site_adherence_distribution():
+async def site_adherence_distribution(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_pa_site_adherence_distribution;")
+        rows = await fetch_all(*await view_query("v_pa_site_adherence_distribution", filters))
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# 11) Visit-window compliance (on-time / early / late / missing per site, patient or visit type)
+@router.get("/visit-windows")
+async def visit_window_compliance(
+    by: Literal["site", "patient", "visit_type", "total"] = "site",
+    as_of: Optional[date] = Query(None, description="Judge open windows at this date (default: latest visit)"),
+    filters: DashboardFilter = Depends(),
+):
+    """
+    Scheduled visits (DimVisitType windows from EnrollmentDate) matched to
+    the actual visits, with counts and rates of on-time, early, late and
+    missing visits. Filters select patients by enrollment.
+    """
+    try:
+        return await fetch_all(*await compliance_query(filters, by, as_of))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
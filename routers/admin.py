@@ -0,0 +1,52 @@
+# backend/routers/admin.py
+import os
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from cache import result_cache
+import metrics
+import snapshots
+from responses import FastJSONRoute
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """If ADMIN_TOKEN is set, admin calls must send it in X-Admin-Token."""
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)], route_class=FastJSONRoute)
+
+# 1) Result cache stats
+@router.get("/cache")
+def cache_stats():
+    return result_cache.stats()
+
+# 2) Invalidate cached view results (all, or only ?view=...&view=...)
+@router.post("/cache/invalidate")
+def invalidate_cache(view: List[str] = Query(None)):
+    dropped = result_cache.invalidate(view)
+    return {"invalidated": dropped, "views": view or "all"}
+
+# 3) Materialized snapshot status (age per view)
+@router.get("/snapshots")
+def snapshot_status():
+    try:
+        return snapshots.status_report()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 4) Refresh snapshots now (all, or only ?view=...&view=...)
+@router.post("/snapshots/refresh")
+def refresh_snapshots(view: List[str] = Query(None)):
+    try:
+        timings = snapshots.refresh_snapshots(view)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if timings is None:
+        raise HTTPException(status_code=409, detail="A snapshot refresh is already running")
+    return {"refreshed_ms": timings}
+
+# 5) Slow queries (SLOW_QUERY_MS) with their EXPLAIN (ANALYZE, BUFFERS) plans
+@router.get("/slow-queries")
+def slow_queries():
+    return {"threshold_ms": metrics.SLOW_QUERY_MS, "queries": metrics.slow_queries.recent()}
@@ -0,0 +1,61 @@
+# backend/routers/alerts.py
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from alerts import ALERT_MIN_HISTORY, ALERT_WINDOW_DAYS, RULES
+from database import DB_MODE, fetch_all
+from filters import DashboardFilter, predicates
+from responses import FastJSONRoute
+
+router = APIRouter(prefix="/alerts", tags=["Alerts"], route_class=FastJSONRoute)
+
+# 1) Fired alerts, newest first
+@router.get("")
+async def list_alerts(
+    rule: List[str] = Query(None, description="Only these rules (repeatable, see /api/alerts/rules)"),
+    severity: Optional[Literal["critical", "warning"]] = None,
+    limit: int = Query(200, ge=1, le=5000),
+    filters: DashboardFilter = Depends(),
+):
+    """
+    Site-days that break an alert rule, as evaluated by the loader on each
+    full or delta load. Accepts the usual dashboard filters (dates select
+    the alert day). Always empty in embedded mode, where no loader runs.
+    """
+    unknown = [r for r in rule or () if r not in RULES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown rule(s): {', '.join(unknown)}")
+    if DB_MODE == "embedded":
+        return []
+
+    where, params = predicates(filters, "a.siteid", "a.day")
+    clauses = [where[len(" WHERE "):]] if where else []
+    if rule:
+        clauses.append(f"a.rule IN ({', '.join(['%s'] * len(rule))})")
+        params += tuple(rule)
+    if severity:
+        clauses.append("a.severity = %s")
+        params += (severity,)
+    sql = f"""
+        SELECT a.rule, a.severity, a.siteid, d.s_sitename, a.day, a.measure, a.value, a.limit_value,
+               a.baseline_mean, a.baseline_stddev, a.zscore, a.raised_at, a.updated_at
+        FROM alerts a
+        LEFT JOIN dimsite d ON d.siteid = a.siteid
+        {"WHERE " + " AND ".join(clauses) if clauses else ""}
+        ORDER BY a.day DESC, a.severity, a.rule, a.siteid
+        LIMIT %s;
+    """
+    try:
+        return await fetch_all(sql, params + (limit,))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 2) Rule registry
+@router.get("/rules")
+def list_rules():
+    return {
+        "window_days": ALERT_WINDOW_DAYS,
+        "min_history": ALERT_MIN_HISTORY,
+        "rules": {rule: {"measure": measure, "kind": kind, "comparison": op, "limit": limit,
+                         "severity": severity, "min_value": minimum}
+                  for rule, (measure, kind, op, limit, severity, minimum) in RULES.items()},
+    }
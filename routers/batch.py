@@ -0,0 +1,36 @@
+# backend/routers/batch.py
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from batch import METRICS, fetch_metrics
+from filters import DashboardFilter, mark_as_of
+from responses import FastJSONRoute
+
+router = APIRouter(prefix="/batch", tags=["Batch"], route_class=FastJSONRoute)
+
+# 1) Many metrics in one round trip
+@router.get("")
+async def get_batch(
+    response: Response,
+    metric: List[str] = Query(..., description="Metric ids from /api/batch/metrics (repeatable)"),
+    filters: DashboardFilter = Depends(),
+):
+    """
+    {metric id: value} for every requested metric, read with one SQL
+    statement for all views not already cached. Accepts the usual
+    dashboard filters.
+    """
+    try:
+        results, stats = await fetch_metrics(metric, filters)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    response.headers["Server-Timing"] = (f"batch;dur={stats['ms']};desc=\"{stats['views']} views, "
+                                         f"{stats['statements']} statements\"")
+    await mark_as_of(response, filters, *{METRICS[m][0] for m in results})
+    return results
+
+# 2) Metric registry
+@router.get("/metrics")
+def list_metrics():
+    return {metric: {"view": view, "shape": shape} for metric, (view, shape, _) in METRICS.items()}
@@ -1,20 +1,23 @@
 # backend/routers/executive.py
-from fastapi import APIRouter
-from database import get_connection
+from fastapi import APIRouter, Depends, Response
+from database import fetch_all
+from filters import DashboardFilter, mark_as_of, view_query
+from responses import FastJSONRoute
 
-router = APIRouter(prefix="/exec", tags=["Executive Dashboard"])
+router = APIRouter(prefix="/exec", tags=["Executive Dashboard"], route_class=FastJSONRoute)
+
+async def first_row_values(view: str, response: Response, filters: DashboardFilter = None):
+    """First row of a view (served from its snapshot when available) as a positional list."""
+    rows = await fetch_all(*await view_query(view, filters))
+    await mark_as_of(response, filters, view)
+    return list(rows[0].values()) if rows else None
 
 # --- 1. Executive KPIs ---
 # --- Executive KPIs (Main 4 metrics) ---
 @router.get("/kpis")
-def get_exec_kpis():
+async def get_exec_kpis(response: Response, filters: DashboardFilter = Depends()):
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM public.v_exec_kpis;")
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
+        result = await first_row_values("public.v_exec_kpis", response, filters)
 
         if result is None:
             return {"error": "No data found in v_exec_kpis"}
@@ -22,7 +25,7 @@ def get_exec_kpis():
         return {
             "total_unique_patients": result[0],
             "total_visits": result[1],
-            "visit_completion_pct": float(result[2]) if result[2] is not None else 0,
+            "visit_completion_pct": result[2] if result[2] is not None else 0,
             "visit_missed": result[3]
         }
 
@@ -32,13 +35,8 @@ def get_exec_kpis():
 
 # --- 2. Enrollment Gauge ---
 @router.get("/enrollment-gauge")
-def get_exec_enrollment_gauge():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM v_exec_enrollment_gauge;")
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
+async def get_exec_enrollment_gauge(response: Response, filters: DashboardFilter = Depends()):
+    result = await first_row_values("v_exec_enrollment_gauge", response, filters)
     return {
         "total_enrolled": result[0],
         "total_target": result[1]
@@ -46,13 +44,8 @@ def get_exec_enrollment_gauge():
 
 # --- 3. Visit Status Donut ---
 @router.get("/visit-status")
-def get_exec_visit_status():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM v_exec_visitstatus_donut;")
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
+async def get_exec_visit_status(response: Response, filters: DashboardFilter = Depends()):
+    result = await first_row_values("v_exec_visitstatus_donut", response, filters)
     return {
         "completed": result[0],
         "missed": result[1],
@@ -61,11 +54,7 @@ def get_exec_visit_status():
 
 # --- 4. Enrollment Trend ---
 @router.get("/enrollment-trend")
-def get_exec_enrollment_trend():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT month_name, monthly_enrollment FROM v_exec_enrollment_trend;")
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [{"month": r[0], "enrollment": r[1]} for r in rows]
+async def get_exec_enrollment_trend(response: Response, filters: DashboardFilter = Depends()):
+    rows = await fetch_all(*await view_query("v_exec_enrollment_trend", filters, "month_name, monthly_enrollment"))
+    await mark_as_of(response, filters, "v_exec_enrollment_trend")
+    return [{"month": r["month_name"], "enrollment": r["monthly_enrollment"]} for r in rows]
@@ -0,0 +1,65 @@
+# backend/routers/export.py
+import csv
+import io
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from database import ExportsBusy, stream_query
+from filters import DashboardFilter, predicates, with_clause
+from responses import FastJSONRoute, dumps
+
+router = APIRouter(prefix="/export", tags=["Data Export"], route_class=FastJSONRoute)
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def encode_rows(chunks, fmt: str):
+    """Turn stream_query() output into NDJSON or CSV text, one batch at a time."""
+    try:
+        columns = next(chunks)
+        if fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(columns)
+            for batch in chunks:
+                writer.writerows(batch)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+            yield buf.getvalue()  # header only, when there were no rows
+        else:
+            for batch in chunks:
+                yield b"".join(dumps(dict(zip(columns, row))) + b"\n" for row in batch)
+    finally:
+        chunks.close()  # hand the connection back even if the client disconnects
+
+def export_response(sql: str, params: tuple, fmt: str, filename: str):
+    try:
+        chunks = stream_query(sql, params)
+    except ExportsBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return StreamingResponse(
+        encode_rows(chunks, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
+
+# 1) Patient adherence details (all rows of v_pa_patient_details_table)
+@router.get("/patient-details")
+def export_patient_details(format: Literal["ndjson", "csv"] = "ndjson", filters: DashboardFilter = Depends()):
+    """
+    Streams the full patient details table. Filtered, it is the same table
+    /api/adherence/patient-details pages through: the view's definition
+    over the visits of the selected sites / region / visit dates.
+    """
+    prefix, params = with_clause("v_pa_patient_details_table", filters)
+    sql = f"{prefix}SELECT * FROM v_pa_patient_details_table ORDER BY patientpk;"
+    return export_response(sql, params, format, "patient_details")
+
+# 2) Visit-level data (FactVisits)
+@router.get("/visits")
+def export_visits(format: Literal["ndjson", "csv"] = "ndjson", filters: DashboardFilter = Depends()):
+    """Streams FactVisits rows, optionally filtered by site, region and visit date."""
+    where, params = predicates(filters, "siteid", "visitdate")
+    sql = (f"SELECT visitid, patientpk, siteid, visitdate, visitstatus, ediarysubmitted, "
+           f"medicationtakenpercent, ae_reported FROM factvisits{where} ORDER BY visitid;")
+    return export_response(sql, params, format, "visits")
@@ -0,0 +1,41 @@
+# backend/routers/live.py
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from live import LIVE_TOPICS, broadcaster, event_stream
+
+router = APIRouter(prefix="/live", tags=["Live Updates"])
+
+# 1) Live KPI stream (Server-Sent Events)
+@router.get("")
+async def live_updates(
+    request: Request,
+    topic: Optional[List[str]] = Query(None, description=f"Topics to follow (repeatable): {', '.join(LIVE_TOPICS)}"),
+):
+    """
+    text/event-stream of KPI cards: an `event: snapshot` with every card of
+    the requested topics on connect, then `event: update` messages carrying
+    only the cards that changed. Every message's `id` is the data version.
+    """
+    topics = topic or list(LIVE_TOPICS)
+    unknown = [t for t in topics if t not in LIVE_TOPICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown topic(s): {', '.join(unknown)}")
+    try:
+        stream = event_stream(request, topics)
+        first = await stream.__anext__()  # fail with a 500 here rather than mid-stream
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def body():
+        yield first
+        async for message in stream:
+            yield message
+
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 2) Broadcaster status
+@router.get("/stats")
+def live_stats():
+    return broadcaster.stats()
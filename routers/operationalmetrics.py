@@ -1,26 +1,17 @@
 # backend/routers/operationalmetrics.py
-from fastapi import APIRouter, HTTPException
-from psycopg2.extras import RealDictCursor
-from database import get_connection
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from database import fetch_all, fetch_many, server_timing
+from columnar import columnar_response, negotiate
+from filters import DashboardFilter, view_query
+from responses import FastJSONRoute
 
-router = APIRouter(prefix="/operationalmetrics", tags=["Operational Metrics"])
-
-def run_query(sql: str, params: tuple = None):
-    """Helper to run a SQL query and return list[dict]."""
-    conn = get_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(sql, params or ())
-            rows = cur.fetchall()
-            return rows
-    finally:
-        conn.close()
+router = APIRouter(prefix="/operationalmetrics", tags=["Operational Metrics"], route_class=FastJSONRoute)
 
 # 1) Main KPIs for scorecards
 @router.get("/main_kpis")
-def main_kpis():
+async def main_kpis(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM om_kpi2;")
+        rows = await fetch_all(*await view_query("om_kpi2", filters))
         if not rows:
             return {
                 "total_queries": 0,
@@ -35,57 +26,57 @@ def main_kpis():
 
 # 2) Query Completeness by Site
 @router.get("/query_completeness")
-def query_completeness():
+async def query_completeness(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM om_querycompleteness;")
+        rows = await fetch_all(*await view_query("om_querycompleteness", filters))
         return rows  # list of { s_sitename, avg_querycompleteness }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 3) Medication Take Percent by Site
 @router.get("/medication_take_percent")
-def medication_take_percent():
+async def medication_take_percent(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM om_medicationtakepercent;")
+        rows = await fetch_all(*await view_query("om_medicationtakepercent", filters))
         return rows  # list of { s_sitename, avg_medication_take_percent }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 4) Timeliness by Site
 @router.get("/timeliness")
-def timeliness():
+async def timeliness(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM tj_timeliness;")
+        rows = await fetch_all(*await view_query("tj_timeliness", filters))
         return rows  # list of { s_sitename, avg_timeliness }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 5) Randomized Flag Statistics by Site
 @router.get("/randomized_stats")
-def randomized_stats():
+async def randomized_stats(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM tj_randomizedflag;")
+        rows = await fetch_all(*await view_query("tj_randomizedflag", filters))
         return rows  # list of { s_sitename, randomized, no_randomized }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 6) Comprehensive Table Data by Site
 @router.get("/comprehensive_table")
-def comprehensive_table():
+async def comprehensive_table(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM tj_table;")
+        rows = await fetch_all(*await view_query("tj_table", filters))
         return rows  # list of { s_sitename, randomized, no_randomized, avg_medication_take_percent, avg_querycompleteness, avg_timeliness }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 7) Combined KPIs endpoint (for top scorecards)
 @router.get("/kpis")
-def get_all_kpis():
+async def get_all_kpis(filters: DashboardFilter = Depends()):
     """
     Returns a combined JSON with the main KPIs to populate the top scorecards.
     """
     try:
-        main_kpis_data = run_query("SELECT * FROM om_kpi2;")
+        main_kpis_data = await fetch_all(*await view_query("om_kpi2", filters))
         
         if main_kpis_data:
             kpis = main_kpis_data[0]
@@ -109,46 +100,52 @@ def get_all_kpis():
 
 # 8) Combined Charts endpoint (for all chart data in one call)
 @router.get("/charts")
-def get_all_charts():
+async def get_all_charts(request: Request, response: Response, filters: DashboardFilter = Depends()):
     """
     Returns a combined JSON with all chart data for better performance.
+    Send Accept: application/x-columnar+json for column arrays per chart.
     """
     try:
-        query_completeness = run_query("SELECT * FROM om_querycompleteness;")
-        medication_take_percent = run_query("SELECT * FROM om_medicationtakepercent;")
-        timeliness = run_query("SELECT * FROM tj_timeliness;")
-        randomized_stats = run_query("SELECT * FROM tj_randomizedflag;")
-        
-        return {
-            "query_completeness": query_completeness,
-            "medication_take_percent": medication_take_percent,
-            "timeliness": timeliness,
-            "randomized_stats": randomized_stats
-        }
+        fmt = negotiate(request, response)
+        results, timings = await fetch_many({
+            "query_completeness": await view_query("om_querycompleteness", filters),
+            "medication_take_percent": await view_query("om_medicationtakepercent", filters),
+            "timeliness": await view_query("tj_timeliness", filters),
+            "randomized_stats": await view_query("tj_randomizedflag", filters),
+        }, columnar=fmt is not None)
+        response.headers["Server-Timing"] = server_timing(timings)
+        if fmt:
+            return columnar_response(results, fmt, response.headers)
+        return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 9) Complete Data endpoint (everything in one call)
 @router.get("/complete_data")
-def get_complete_data():
+async def get_complete_data(response: Response, filters: DashboardFilter = Depends()):
     """
     Returns all operational metrics data in a single API call.
+    The view queries run in parallel; per-view timings go in Server-Timing.
     """
     try:
-        main_kpis = run_query("SELECT * FROM om_kpi2;")
-        query_completeness = run_query("SELECT * FROM om_querycompleteness;")
-        medication_take_percent = run_query("SELECT * FROM om_medicationtakepercent;")
-        timeliness = run_query("SELECT * FROM tj_timeliness;")
-        randomized_stats = run_query("SELECT * FROM tj_randomizedflag;")
-        comprehensive_table = run_query("SELECT * FROM tj_table;")
-        
+        results, timings = await fetch_many({
+            "main_kpis": await view_query("om_kpi2", filters),
+            "query_completeness": await view_query("om_querycompleteness", filters),
+            "medication_take_percent": await view_query("om_medicationtakepercent", filters),
+            "timeliness": await view_query("tj_timeliness", filters),
+            "randomized_stats": await view_query("tj_randomizedflag", filters),
+            "comprehensive_table": await view_query("tj_table", filters),
+        })
+        response.headers["Server-Timing"] = server_timing(timings)
+
+        main_kpis = results["main_kpis"]
         return {
             "main_kpis": main_kpis[0] if main_kpis else {},
-            "query_completeness": query_completeness,
-            "medication_take_percent": medication_take_percent,
-            "timeliness": timeliness,
-            "randomized_stats": randomized_stats,
-            "comprehensive_table": comprehensive_table
+            "query_completeness": results["query_completeness"],
+            "medication_take_percent": results["medication_take_percent"],
+            "timeliness": results["timeliness"],
+            "randomized_stats": results["randomized_stats"],
+            "comprehensive_table": results["comprehensive_table"]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
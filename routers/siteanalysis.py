@@ -1,26 +1,18 @@
 # backend/routers/sitenalysis.py
-from fastapi import APIRouter, HTTPException
-from psycopg2.extras import RealDictCursor
-from database import get_connection
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from columnar import columnar_response, negotiate
+from database import fetch_all, fetch_many, server_timing
+from filters import DashboardFilter, mark_as_of, view_query
+from responses import FastJSONRoute
 
-router = APIRouter(prefix="/siteanalysis", tags=["Site Analysis"])
-
-def run_query(sql: str, params: tuple = None):
-    """Helper to run a SQL query and return list[dict]."""
-    conn = get_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(sql, params or ())
-            rows = cur.fetchall()
-            return rows
-    finally:
-        conn.close()
+router = APIRouter(prefix="/siteanalysis", tags=["Site Analysis"], route_class=FastJSONRoute)
 
 # 1) Total Active Sites
 @router.get("/total_active")
-def total_active_sites():
+async def total_active_sites(response: Response, filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_site_total_active;")
+        rows = await fetch_all(*await view_query("v_site_total_active", filters))
+        await mark_as_of(response, filters, "v_site_total_active")
         if not rows:
             return {"total_active_sites": 0}
         return rows[0]   # returns {"total_active_sites": N}
@@ -29,9 +21,10 @@ def total_active_sites():
 
 # 2) Avg Patients per Site
 @router.get("/avg_patients")
-def avg_patients_per_site():
+async def avg_patients_per_site(response: Response, filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_site_avg_patients;")
+        rows = await fetch_all(*await view_query("v_site_avg_patients", filters))
+        await mark_as_of(response, filters, "v_site_avg_patients")
         if not rows:
             return {"avg_patients_per_site": 0}
         # view returns one row — return the value with a clear key
@@ -42,9 +35,10 @@ def avg_patients_per_site():
 
 # 3) Top Performer
 @router.get("/top_performer")
-def top_performer():
+async def top_performer(response: Response, filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_site_top_performer;")
+        rows = await fetch_all(*await view_query("v_site_top_performer", filters))
+        await mark_as_of(response, filters, "v_site_top_performer")
         if not rows:
             return {}
         return rows[0]
@@ -53,9 +47,10 @@ def top_performer():
 
 # 4) Least Performer
 @router.get("/least_performer")
-def least_performer():
+async def least_performer(response: Response, filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_site_least_performer;")
+        rows = await fetch_all(*await view_query("v_site_least_performer", filters))
+        await mark_as_of(response, filters, "v_site_least_performer")
         if not rows:
             return {}
         return rows[0]
@@ -64,70 +59,85 @@ def least_performer():
 
 # 5) Patients per Site (bar chart)
 @router.get("/patients_bar")
-def patients_bar():
+async def patients_bar(response: Response, filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_site_patients_bar;")
+        rows = await fetch_all(*await view_query("v_site_patients_bar", filters))
+        await mark_as_of(response, filters, "v_site_patients_bar")
         return rows  # list of { s_sitename, patients_enrolled }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 6) Missed visits by site (heatmap/bubble)
 @router.get("/missed_visits")
-def missed_visits():
+async def missed_visits(response: Response, filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_site_missed_visits;")
+        rows = await fetch_all(*await view_query("v_site_missed_visits", filters))
+        await mark_as_of(response, filters, "v_site_missed_visits")
         return rows  # list of { s_sitename, missed_visits }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 7) Rescheduled visits by site (line / trend)
 @router.get("/rescheduled_visits")
-def rescheduled_visits():
+async def rescheduled_visits(response: Response, filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_site_Rescheduled_visits;")
+        rows = await fetch_all(*await view_query("v_site_Rescheduled_visits", filters))
+        await mark_as_of(response, filters, "v_site_Rescheduled_visits")
         return rows  # list of { s_sitename, rescheduled_visits }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 8) Gender Distribution by Site
 @router.get("/gender_distribution")
-def gender_distribution():
+async def gender_distribution(response: Response, filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM pa_site_gender_distribution;")
+        rows = await fetch_all(*await view_query("pa_site_gender_distribution", filters))
+        await mark_as_of(response, filters, "pa_site_gender_distribution")
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 9) Age Distribution (Active Patients by Bucket)
 @router.get("/age_distribution")
-def age_distribution():
+async def age_distribution(response: Response, filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_pa_bucket_active_patients;")
+        rows = await fetch_all(*await view_query("v_pa_bucket_active_patients", filters))
+        await mark_as_of(response, filters, "v_pa_bucket_active_patients")
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 10) Site Adherence Distribution
 @router.get("/adherence_distribution")
-def adherence_distribution():
+async def adherence_distribution(response: Response, filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_pa_site_adherence_distribution;")
+        rows = await fetch_all(*await view_query("v_pa_site_adherence_distribution", filters))
+        await mark_as_of(response, filters, "v_pa_site_adherence_distribution")
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 11) Combined KPIs endpoint (useful for single API call for top scorecards)
 @router.get("/kpis")
-def get_all_kpis():
+async def get_all_kpis(response: Response, filters: DashboardFilter = Depends()):
     """
     Returns a combined JSON with the main KPIs to populate the top scorecards.
     """
     try:
-        total_active = run_query("SELECT * FROM v_site_total_active;")
-        avg_patients = run_query("SELECT * FROM v_site_avg_patients;")
-        top_performer = run_query("SELECT * FROM v_site_top_performer;")
-        least_performer = run_query("SELECT * FROM v_site_least_performer;")
-        
+        results, timings = await fetch_many({
+            "total_active_sites": await view_query("v_site_total_active", filters),
+            "avg_patients_per_site": await view_query("v_site_avg_patients", filters),
+            "top_performer": await view_query("v_site_top_performer", filters),
+            "least_performer": await view_query("v_site_least_performer", filters),
+        })
+        response.headers["Server-Timing"] = server_timing(timings)
+        await mark_as_of(response, filters, "v_site_total_active", "v_site_avg_patients",
+                   "v_site_top_performer", "v_site_least_performer")
+
+        total_active = results["total_active_sites"]
+        avg_patients = results["avg_patients_per_site"]
+        top_performer = results["top_performer"]
+        least_performer = results["least_performer"]
         return {
             "total_active_sites": total_active[0] if total_active else {"total_active_sites": 0},
             "avg_patients_per_site": avg_patients[0] if avg_patients else {"avg_patients_per_site": 0},
@@ -139,25 +149,27 @@ def get_all_kpis():
 
 # 12) Combined Charts endpoint (for second and third row charts)
 @router.get("/charts")
-def get_all_charts():
+async def get_all_charts(request: Request, response: Response, filters: DashboardFilter = Depends()):
     """
     Returns a combined JSON with all chart data for better performance.
+    The view queries run in parallel; per-view timings go in Server-Timing.
+    Send Accept: application/x-columnar+json for column arrays per chart.
     """
     try:
-        patients_bar = run_query("SELECT * FROM v_site_patients_bar;")
-        missed_visits = run_query("SELECT * FROM v_site_missed_visits;")
-        rescheduled_visits = run_query("SELECT * FROM v_site_Rescheduled_visits;")
-        gender_distribution = run_query("SELECT * FROM pa_site_gender_distribution;")
-        age_distribution = run_query("SELECT * FROM v_pa_bucket_active_patients;")
-        adherence_distribution = run_query("SELECT * FROM v_pa_site_adherence_distribution;")
-        
-        return {
-            "patients_bar": patients_bar,
-            "missed_visits": missed_visits,
-            "rescheduled_visits": rescheduled_visits,
-            "gender_distribution": gender_distribution,
-            "age_distribution": age_distribution,
-            "adherence_distribution": adherence_distribution
-        }
+        fmt = negotiate(request, response)
+        results, timings = await fetch_many({
+            "patients_bar": await view_query("v_site_patients_bar", filters),
+            "missed_visits": await view_query("v_site_missed_visits", filters),
+            "rescheduled_visits": await view_query("v_site_Rescheduled_visits", filters),
+            "gender_distribution": await view_query("pa_site_gender_distribution", filters),
+            "age_distribution": await view_query("v_pa_bucket_active_patients", filters),
+            "adherence_distribution": await view_query("v_pa_site_adherence_distribution", filters),
+        }, columnar=fmt is not None)
+        response.headers["Server-Timing"] = server_timing(timings)
+        await mark_as_of(response, filters, "v_site_patients_bar", "v_site_missed_visits", "v_site_Rescheduled_visits",
+                   "pa_site_gender_distribution", "v_pa_bucket_active_patients", "v_pa_site_adherence_distribution")
+        if fmt:
+            return columnar_response(results, fmt, response.headers)
+        return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,26 +1,19 @@
 # backend/routers/trialjourney.py
-from fastapi import APIRouter, HTTPException
-from psycopg2.extras import RealDictCursor
-from database import get_connection
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from database import fetch_all, fetch_many, fetch_columns, server_timing
+from columnar import columnar_response, negotiate
+from filters import DashboardFilter, view_query
+from funnel import funnel_query
+from responses import FastJSONRoute
 
-router = APIRouter()
-
-def run_query(sql: str, params: tuple = None):
-    """Helper to run a SQL query and return list[dict]."""
-    conn = get_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(sql, params or ())
-            rows = cur.fetchall()
-            return rows
-    finally:
-        conn.close()
+router = APIRouter(route_class=FastJSONRoute)
 
 # 1) Main KPIs for Trial Journey
 @router.get("/trialjourney/kpis")
-def trial_journey_kpis():
+async def trial_journey_kpis(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM v_kpi1;")
+        rows = await fetch_all(*await view_query("v_kpi1", filters))
         if not rows:
             return {
                 "total_visits": 0,
@@ -35,92 +28,109 @@ def trial_journey_kpis():
 
 # 2) Screening Results Distribution
 @router.get("/trialjourney/screening_results")
-def screening_results():
+async def screening_results(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM tj_screenresult;")
+        rows = await fetch_all(*await view_query("tj_screenresult", filters))
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 3) Screening Failure Reasons
 @router.get("/trialjourney/screening_failure_reasons")
-def screening_failure_reasons():
+async def screening_failure_reasons(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM tj_screenfailurreason;")
+        rows = await fetch_all(*await view_query("tj_screenfailurreason", filters))
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 4) Screening Sources
 @router.get("/trialjourney/screening_sources")
-def screening_sources():
+async def screening_sources(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM tj_screensource;")
+        rows = await fetch_all(*await view_query("tj_screensource", filters))
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 5) eDiary Submission by Site
 @router.get("/trialjourney/ediary_submission")
-def ediary_submission():
+async def ediary_submission(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM tj_ediary_submission;")
+        rows = await fetch_all(*await view_query("tj_ediary_submission", filters))
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 6) Weekly Site Visits
 @router.get("/trialjourney/weekly_visits")
-def weekly_visits():
+async def weekly_visits(request: Request, response: Response, filters: DashboardFilter = Depends()):
+    """Also available column-oriented (Accept: application/x-columnar+json or Arrow IPC)."""
     try:
-        rows = run_query("SELECT * FROM tj_weekly_site_visits;")
+        fmt = negotiate(request, response)
+        if fmt:
+            return columnar_response(await fetch_columns(*await view_query("tj_weekly_site_visits", filters)), fmt,
+                                     response.headers)
+        rows = await fetch_all(*await view_query("tj_weekly_site_visits", filters))
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 7) AE Category Distribution by Site
 @router.get("/trialjourney/ae_category_distribution")
-def ae_category_distribution():
+async def ae_category_distribution(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM tj_category_distribution_site;")
+        rows = await fetch_all(*await view_query("tj_category_distribution_site", filters))
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 8) AE Count Summary
 @router.get("/trialjourney/ae_count_summary")
-def ae_count_summary():
+async def ae_count_summary(filters: DashboardFilter = Depends()):
     try:
-        rows = run_query("SELECT * FROM tj_ae_count;")
+        rows = await fetch_all(*await view_query("tj_ae_count", filters))
         return rows
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 9) Combined endpoint for all Trial Journey data
 @router.get("/trialjourney/dashboard_data")
-def get_all_trial_journey_data():
+async def get_all_trial_journey_data(response: Response, filters: DashboardFilter = Depends()):
     """
     Returns combined JSON with all Trial Journey data for dashboard performance.
+    The view queries run in parallel; per-view timings go in Server-Timing.
     """
     try:
-        kpis = run_query("SELECT * FROM v_kpi1;")
-        screen_results = run_query("SELECT * FROM tj_screenresult;")
-        failure_reasons = run_query("SELECT * FROM tj_screenfailurreason;")
-        screen_sources = run_query("SELECT * FROM tj_screensource;")
-        ediary_submission = run_query("SELECT * FROM tj_ediary_submission;")
-        weekly_visits = run_query("SELECT * FROM tj_weekly_site_visits;")
-        ae_distribution = run_query("SELECT * FROM tj_category_distribution_site;")
-        ae_count = run_query("SELECT * FROM tj_ae_count;")
-        
-        return {
-            "kpis": kpis[0] if kpis else {},
-            "screening_results": screen_results,
-            "screening_failure_reasons": failure_reasons,
-            "screening_sources": screen_sources,
-            "ediary_submission": ediary_submission,
-            "weekly_visits": weekly_visits,
-            "ae_category_distribution": ae_distribution,
-            "ae_count_summary": ae_count
-        }
+        results, timings = await fetch_many({
+            "kpis": await view_query("v_kpi1", filters),
+            "screening_results": await view_query("tj_screenresult", filters),
+            "screening_failure_reasons": await view_query("tj_screenfailurreason", filters),
+            "screening_sources": await view_query("tj_screensource", filters),
+            "ediary_submission": await view_query("tj_ediary_submission", filters),
+            "weekly_visits": await view_query("tj_weekly_site_visits", filters),
+            "ae_category_distribution": await view_query("tj_category_distribution_site", filters),
+            "ae_count_summary": await view_query("tj_ae_count", filters),
+        })
+        response.headers["Server-Timing"] = server_timing(timings)
+
+        kpis = results["kpis"]
+        results["kpis"] = kpis[0] if kpis else {}
+        return results
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+# 10) Recruitment funnel (screened -> eligible -> enrolled -> randomized -> first completed visit)
+@router.get("/trialjourney/funnel")
+async def recruitment_funnel(
+    by: Literal["site_month", "site", "month", "total"] = "site_month",
+    filters: DashboardFilter = Depends(),
+):
+    """
+    Stage counts, stage-to-stage conversion (%) and median days between
+    stages, per site and/or screening cohort month. date_from / date_to
+    select cohorts by screening date.
+    """
+    try:
+        return await fetch_all(*funnel_query(filters, by))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
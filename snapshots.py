@@ -0,0 +1,305 @@
+"""
+Materialized snapshots of the heavy dashboard views.
+
+Each view in SNAPSHOT_VIEWS gets a materialized copy named snap_<view>
+with an extra snapshot_row column (the live view's row order) and a unique
+index on it, so it can be refreshed CONCURRENTLY without blocking readers.
+snapshot_status records every snapshot's columns and last refresh time;
+routers read through snapshot_sql() and report the age with mark_as_of().
+
+    python snapshots.py --create     # create missing snapshots
+    python snapshots.py --refresh    # refresh all (or --view NAME ...)
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from cache import result_cache
+from database import DB_MODE, connection, fetch_all, run_query
+
+# the embedded engine computes views in-process; there is nothing to snapshot
+SNAPSHOTS_ENABLED = (os.getenv("SNAPSHOTS_ENABLED", "1") not in ("0", "false", "False")
+                     and DB_MODE != "embedded")
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "0"))  # 0 = on demand only
+SNAPSHOT_REFRESH_PARALLELISM = int(os.getenv("SNAPSHOT_REFRESH_PARALLELISM", "4"))
+SNAPSHOT_LOCK_KEY = 72_410_001  # pg advisory lock so only one worker refreshes at a time
+
+# Views behind the executive and site-analysis pages
+SNAPSHOT_VIEWS = [
+    "v_exec_kpis",
+    "v_exec_enrollment_gauge",
+    "v_exec_visitstatus_donut",
+    "v_exec_enrollment_trend",
+    "v_site_total_active",
+    "v_site_avg_patients",
+    "v_site_top_performer",
+    "v_site_least_performer",
+    "v_site_patients_bar",
+    "v_site_missed_visits",
+    "v_site_rescheduled_visits",
+    "pa_site_gender_distribution",
+    "v_pa_bucket_active_patients",
+    "v_pa_site_adherence_distribution",
+    # patient detail table (keyset-paginated on the index below)
+    "v_pa_patient_details_table",
+]
+
+# Extra indexes on a view's snapshot, beyond the snapshot_row key
+SNAPSHOT_INDEXES = {
+    "v_pa_patient_details_table": ["adherence_rate DESC NULLS LAST, patientpk"],
+}
+
+STATUS_DDL = """
+    CREATE TABLE IF NOT EXISTS snapshot_status (
+        view_name     text PRIMARY KEY,
+        snapshot_name text NOT NULL,
+        columns       text[] NOT NULL,
+        refreshed_at  timestamptz NOT NULL,
+        refresh_ms    numeric
+    );
+"""
+
+
+def _normalize(view: str):
+    view = view.lower()
+    return view[len("public."):] if view.startswith("public.") else view
+
+
+def snapshot_name(view: str):
+    return "snap_" + _normalize(view)
+
+
+def _quote(ident: str):
+    return '"' + ident.replace('"', '""') + '"'
+
+
+# --- Read side ---
+_missing_until = 0.0
+
+
+async def statuses():
+    """view_name -> status row for every existing snapshot ({} if none yet)."""
+    global _missing_until
+    if not SNAPSHOTS_ENABLED or time.monotonic() < _missing_until:
+        return {}
+    try:
+        rows = await fetch_all("SELECT view_name, snapshot_name, columns, refreshed_at FROM snapshot_status;")
+    except Exception:
+        # no status table yet: serve live views and don't re-check on every request
+        _missing_until = time.monotonic() + 60
+        return {}
+    return {r["view_name"]: r for r in rows}
+
+
+async def snapshot_source(view: str, columns: str = "*"):
+    """
+    (relation, select_list) to read `view` from: its snapshot when one exists,
+    else the live view. `*` is expanded so snapshot_row never leaks out.
+    """
+    status = (await statuses()).get(_normalize(view))
+    if status is None:
+        return view, columns
+    select_list = columns if columns != "*" else ", ".join(_quote(c) for c in status["columns"])
+    return status["snapshot_name"], select_list
+
+
+async def snapshot_sql(view: str, columns: str = "*"):
+    """
+    SQL that reads `view` from its snapshot when one exists, else from the
+    live view. `columns` narrows the select list the same way in both cases.
+    """
+    relation, select_list = await snapshot_source(view, columns)
+    if relation == view:
+        return f"SELECT {select_list} FROM {view};"
+    return f"SELECT {select_list} FROM {relation} ORDER BY snapshot_row;"
+
+
+async def as_of(*views):
+    """Oldest refresh time among the given views' snapshots, or None if any is live."""
+    current = await statuses()
+    times = []
+    for view in views:
+        status = current.get(_normalize(view))
+        if status is None:
+            return None
+        times.append(status["refreshed_at"])
+    return min(times) if times else None
+
+
+async def mark_as_of(response, *views):
+    """Report the snapshot age of the data behind a response."""
+    ts = await as_of(*views)
+    if ts is not None:
+        response.headers["X-Data-As-Of"] = ts.isoformat()
+
+
+# --- Write side ---
+@contextmanager
+def _refresh_lock(wait=False):
+    """
+    Hold the SNAPSHOT_LOCK_KEY advisory lock for the block. Yields False,
+    without waiting, when another session holds it (unless wait).
+    """
+    with connection() as lock_conn:
+        with lock_conn.cursor() as cur:
+            if wait:
+                cur.execute("SELECT pg_advisory_lock(%s);", (SNAPSHOT_LOCK_KEY,))
+                locked = True
+            else:
+                cur.execute("SELECT pg_try_advisory_lock(%s);", (SNAPSHOT_LOCK_KEY,))
+                locked = cur.fetchone()[0]
+        try:
+            yield locked
+        finally:
+            if locked:
+                with lock_conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s);", (SNAPSHOT_LOCK_KEY,))
+
+
+def create_snapshots(views=None):
+    """Create any missing snapshots (and the status table), under the refresh lock."""
+    with _refresh_lock(wait=True):
+        return _create_snapshots(views)
+
+
+def _create_snapshots(views):
+    created = []
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(STATUS_DDL)
+            for view in views or SNAPSHOT_VIEWS:
+                name = snapshot_name(view)
+                cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (name,))
+                if cur.fetchone()[0]:
+                    continue
+                started = time.perf_counter()
+                cur.execute(
+                    f"CREATE MATERIALIZED VIEW {name} AS "
+                    f"SELECT row_number() OVER () AS snapshot_row, v.* FROM {_normalize(view)} v WITH DATA;"
+                )
+                cur.execute(f"CREATE UNIQUE INDEX {name}_row_idx ON {name} (snapshot_row);")
+                for i, index_columns in enumerate(SNAPSHOT_INDEXES.get(_normalize(view), []), 1):
+                    cur.execute(f"CREATE INDEX {name}_idx{i} ON {name} ({index_columns});")
+                _record(cur, view, name, (time.perf_counter() - started) * 1000)
+                created.append(_normalize(view))
+    _invalidate(created)
+    return created
+
+
+def _record(cur, view, name, refresh_ms):
+    cur.execute(
+        "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND attnum > 0 "
+        "AND NOT attisdropped AND attname <> 'snapshot_row' ORDER BY attnum;",
+        (name,),
+    )
+    columns = [r[0] for r in cur.fetchall()]
+    cur.execute(
+        """
+        INSERT INTO snapshot_status (view_name, snapshot_name, columns, refreshed_at, refresh_ms)
+        VALUES (%s, %s, %s, now(), %s)
+        ON CONFLICT (view_name) DO UPDATE
+        SET snapshot_name = EXCLUDED.snapshot_name, columns = EXCLUDED.columns,
+            refreshed_at = EXCLUDED.refreshed_at, refresh_ms = EXCLUDED.refresh_ms;
+        """,
+        (_normalize(view), name, columns, round(refresh_ms, 1)),
+    )
+
+
+def _refresh_one(view):
+    name = snapshot_name(view)
+    started = time.perf_counter()
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name};")
+            refresh_ms = (time.perf_counter() - started) * 1000
+            _record(cur, view, name, refresh_ms)
+    return _normalize(view), round(refresh_ms, 1)
+
+
+def refresh_snapshots(views=None):
+    """
+    Refresh snapshots in parallel. Returns {view: refresh_ms}, or None when
+    another worker already holds the refresh lock ({} in embedded mode).
+    """
+    if DB_MODE == "embedded":
+        return {}
+    wanted = [_normalize(v) for v in (views or SNAPSHOT_VIEWS)]
+    # the lock covers creation too: two sessions must not both CREATE the same snapshot
+    with _refresh_lock() as locked:
+        if not locked:
+            return None
+        with connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(STATUS_DDL)
+                cur.execute("SELECT view_name FROM snapshot_status;")
+                existing = {r[0] for r in cur.fetchall()}
+        missing = [v for v in wanted if v not in existing]
+        if missing:
+            _create_snapshots(missing)
+        with ThreadPoolExecutor(max_workers=SNAPSHOT_REFRESH_PARALLELISM) as executor:
+            timings = dict(executor.map(_refresh_one, [v for v in wanted if v not in missing]))
+
+    _invalidate(wanted)
+    timings.update({v: None for v in missing})
+    return timings
+
+
+def _invalidate(views):
+    global _missing_until
+    _missing_until = 0.0
+    result_cache.invalidate(["snapshot_status"] + [snapshot_name(v) for v in views] + list(views))
+
+
+def status_report():
+    """Snapshot status with ages in seconds, for the admin endpoint."""
+    if DB_MODE == "embedded":
+        return {"enabled": False, "refresh_seconds": SNAPSHOT_REFRESH_SECONDS, "snapshots": []}
+    rows = run_query(
+        "SELECT view_name, snapshot_name, refreshed_at, refresh_ms, "
+        "EXTRACT(EPOCH FROM now() - refreshed_at) AS age_seconds FROM snapshot_status ORDER BY view_name;",
+        cached=False,
+    )
+    return {"enabled": SNAPSHOTS_ENABLED, "refresh_seconds": SNAPSHOT_REFRESH_SECONDS, "snapshots": rows}
+
+
+# --- Scheduled refresh ---
+_stop = threading.Event()
+_thread = None
+
+
+def _refresh_loop(interval):
+    while not _stop.wait(interval):
+        try:
+            refresh_snapshots()
+        except Exception as e:
+            print(f"Warning: snapshot refresh failed: {e}")
+
+
+def start_scheduler(interval=SNAPSHOT_REFRESH_SECONDS):
+    global _thread
+    if interval <= 0 or _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_refresh_loop, args=(interval,), name="snapshot-refresh", daemon=True)
+    _thread.start()
+
+
+def stop_scheduler():
+    global _thread
+    _stop.set()
+    _thread = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage materialized dashboard snapshots")
+    parser.add_argument("--create", action="store_true", help="create missing snapshots")
+    parser.add_argument("--refresh", action="store_true", help="refresh snapshots")
+    parser.add_argument("--view", action="append", help="limit to this view (repeatable)")
+    args = parser.parse_args()
+    if args.create:
+        print("created:", create_snapshots(args.view) or "nothing")
+    if args.refresh:
+        print("refreshed (ms):", refresh_snapshots(args.view))
@@ -0,0 +1,307 @@
+"""
+Static snapshot export: every study-wide dashboard payload pre-rendered
+once per data version and served as immutable files.
+
+    python static_export.py                  # export to STATIC_EXPORT_DIR
+    python static_export.py --force --keep 5
+    python ingest.py ...                     # loads re-export when an export exists
+
+Every GET endpoint of the app without path parameters (exports, live
+streams and admin routes excluded) is called once in-process, without
+filters. Each JSON body is written precompressed under a directory named
+after the data version (versioning.current_version):
+
+    <dir>/<version>/api/exec/kpis.json   (+ .json.gz, + .json.br when brotli is installed)
+    <dir>/<version>/manifest.json
+    <dir>/current.json                   {"version": ...}, replaced atomically last
+
+A version directory never changes once written, so the API serves it
+under /static/<version>/... with Cache-Control: immutable, and any static
+file server or CDN can serve the same tree. StaticSnapshotMiddleware also
+answers unfiltered /api GETs from the current export while its version
+is the live data version, so between loads those requests do no database
+work. After a load moves the version the files are ignored until the
+next export, so stale payloads are never served. ingest.py re-exports
+after every committed load when an export exists (opt out with
+--no-export-static; --export-static exports even without one); a load
+made any other way needs this script.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import time
+
+from columnar import ARROW_STREAM, COLUMNAR_JSON
+from compression import accepted_encodings
+from versioning import UNVERSIONED_PREFIXES, current_version, expire
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+STATIC_EXPORT_DIR = os.getenv("STATIC_EXPORT_DIR", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "static_snapshots"))
+STATIC_EXPORT_KEEP = int(os.getenv("STATIC_EXPORT_KEEP", "3"))
+STATIC_SERVE = os.getenv("STATIC_SERVE", "1") not in ("0", "false", "False")
+STATIC_CHECK_SECONDS = 5
+STATIC_URL_PREFIX = "/static/"
+
+SKIP_PREFIXES = ("/api/export",) + UNVERSIONED_PREFIXES
+# response headers replayed when a payload is served from the export
+KEPT_HEADERS = ("x-data-as-of",)
+IMMUTABLE = b"public, max-age=31536000, immutable"
+# ASGI scope flag on the exporter's own requests: they must hit the handlers, not an older export
+EXPORT_SCOPE_KEY = "static_export"
+
+
+def export_paths(app):
+    """GET paths to pre-render: /api routes without path parameters, minus SKIP_PREFIXES."""
+    # the OpenAPI schema has the full paths (routes keep include_router prefixes apart)
+    return sorted(path for path, ops in app.openapi()["paths"].items()
+                  if "get" in ops and path.startswith("/api") and "{" not in path
+                  and not path.startswith(SKIP_PREFIXES))
+
+
+def file_name(path):
+    """/api/exec/kpis -> api/exec/kpis.json"""
+    return path.strip("/") + ".json"
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _write_payload(directory, name, body):
+    target = os.path.join(directory, name)
+    _write(target, body)
+    encodings = ["identity"]
+    _write(target + ".gz", gzip.compress(body, 9, mtime=0))
+    encodings.append("gzip")
+    if brotli is not None:
+        _write(target + ".br", brotli.compress(body, quality=11))
+        encodings.append("br")
+    return encodings
+
+
+async def _render(client, paths, directory):
+    manifest, skipped = {}, {}
+    for path in paths:
+        response = await client.get(path, headers={"accept": "application/json"})
+        if response.status_code != 200 or not response.headers.get("content-type", "").startswith("application/json"):
+            skipped[path] = response.status_code
+            continue
+        name = file_name(path)
+        encodings = _write_payload(directory, name, response.content)
+        headers = {h: response.headers[h] for h in KEPT_HEADERS if h in response.headers}
+        if "Accept" in (v.strip() for v in response.headers.get("vary", "").split(",")):
+            headers["vary"] = "Accept"  # a negotiated route (columnar.negotiate); the outer layers add the rest
+        manifest[path] = {"file": name, "bytes": len(response.content), "encodings": encodings, "headers": headers}
+    return manifest, skipped
+
+
+def exported(out_dir=STATIC_EXPORT_DIR):
+    """Whether out_dir holds an export (its current.json), i.e. one that loads should keep current."""
+    return os.path.isfile(os.path.join(out_dir, "current.json"))
+
+
+def _prune(out_dir, keep, current):
+    versions = sorted((e for e in os.scandir(out_dir) if e.is_dir() and not e.name.startswith(".")),
+                      key=lambda e: e.stat().st_mtime, reverse=True)
+    removed = []
+    for entry in versions[keep:]:
+        if entry.name != current:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed.append(entry.name)
+    return removed
+
+
+async def export(out_dir=STATIC_EXPORT_DIR, force=False, keep=STATIC_EXPORT_KEEP, attempts=3):
+    """
+    Render every payload for the current data version into out_dir.
+    Returns a report; skips the work when that version is already exported.
+    """
+    import httpx
+    from main import app
+
+    async def exporter(scope, receive, send):
+        scope[EXPORT_SCOPE_KEY] = True
+        await app(scope, receive, send)
+
+    os.makedirs(out_dir, exist_ok=True)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=exporter), base_url="http://export", timeout=120)
+    lifespan = app.router.lifespan_context(app)
+    await lifespan.__aenter__()
+    try:
+        paths = export_paths(app)
+        for _ in range(attempts):
+            expire()
+            version = await current_version()
+            target = os.path.join(out_dir, version)
+            if os.path.isdir(target) and not force:
+                _point_to(out_dir, version)
+                return {"version": version, "exported": False, "reason": "already exported"}
+
+            started = time.perf_counter()
+            staging = os.path.join(out_dir, f".{version}.{os.getpid()}")
+            shutil.rmtree(staging, ignore_errors=True)
+            manifest, skipped = await _render(client, paths, staging)
+
+            expire()
+            if await current_version() != version:
+                shutil.rmtree(staging, ignore_errors=True)  # a load landed mid-export: render again
+                continue
+            _write(os.path.join(staging, "manifest.json"), json.dumps(
+                {"version": version, "created_at": time.time(), "paths": manifest}, indent=1).encode())
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(staging, target)
+            _point_to(out_dir, version)
+            return {"version": version, "exported": True, "payloads": len(manifest), "skipped": skipped,
+                    "bytes": sum(m["bytes"] for m in manifest.values()),
+                    "seconds": round(time.perf_counter() - started, 2),
+                    "pruned": _prune(out_dir, keep, version)}
+        raise RuntimeError(f"data kept changing during the export ({attempts} attempts)")
+    finally:
+        await client.aclose()
+        await lifespan.__aexit__(None, None, None)
+
+
+def _point_to(out_dir, version):
+    tmp = os.path.join(out_dir, f".current.{os.getpid()}")
+    _write(tmp, json.dumps({"version": version}).encode())
+    os.replace(tmp, os.path.join(out_dir, "current.json"))
+
+
+class StaticSnapshotMiddleware:
+    """
+    Serves /static/<version>/... (immutable) and unfiltered /api GETs from
+    the current export when it matches the live data version. Everything
+    else, and every miss, goes to the app.
+    """
+
+    def __init__(self, app, directory=STATIC_EXPORT_DIR):
+        self.app = app
+        self.directory = directory
+        self._manifest = None
+        self._checked_at = 0.0
+        self._bodies = {}
+
+    def _current(self):
+        """(version, manifest paths) of the current export, re-read every STATIC_CHECK_SECONDS."""
+        if time.monotonic() - self._checked_at >= STATIC_CHECK_SECONDS:
+            self._checked_at = time.monotonic()
+            try:
+                with open(os.path.join(self.directory, "current.json"), "rb") as f:
+                    version = json.loads(f.read())["version"]
+                if self._manifest is None or self._manifest["version"] != version:
+                    with open(os.path.join(self.directory, version, "manifest.json"), "rb") as f:
+                        self._manifest = json.loads(f.read())
+                    self._bodies = {}
+            except (OSError, ValueError, KeyError):
+                self._manifest = None
+                self._bodies = {}
+        return self._manifest
+
+    def _body(self, path):
+        if path not in self._bodies:
+            with open(path, "rb") as f:
+                self._bodies[path] = f.read()
+        return self._bodies[path]
+
+    async def _send(self, send, method, body, headers):
+        headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body if method == "GET" else b""})
+
+    async def __call__(self, scope, receive, send):
+        if (not STATIC_SERVE or scope.get(EXPORT_SCOPE_KEY) or scope["type"] != "http"
+                or scope["method"] not in ("GET", "HEAD")):
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        if path.startswith(STATIC_URL_PREFIX):
+            await self._serve_file(scope, send, path[len(STATIC_URL_PREFIX):])
+            return
+        if scope.get("query_string") or not path.startswith("/api"):
+            await self.app(scope, receive, send)
+            return
+
+        manifest = self._current()
+        entry = manifest and manifest["paths"].get(path)
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        accept = headers.get("accept", "")
+        if not entry or ARROW_STREAM in accept or COLUMNAR_JSON in accept:
+            await self.app(scope, receive, send)
+            return
+        try:
+            live = await current_version()
+        except Exception:
+            live = None
+        if live != manifest["version"]:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = _pick(headers.get("accept-encoding", ""), entry["encodings"])
+        suffix = {"identity": "", "gzip": ".gz", "br": ".br"}[encoding]
+        try:
+            body = self._body(os.path.join(self.directory, manifest["version"], entry["file"] + suffix))
+        except OSError:
+            await self.app(scope, receive, send)
+            return
+        scope["static_route"] = path
+        kept = dict(entry["headers"])
+        vary = ", ".join(filter(None, [kept.pop("vary", ""), "Accept-Encoding"]))
+        out = [(b"content-type", b"application/json"), (b"vary", vary.encode("latin-1")),
+               (b"x-static-snapshot", manifest["version"].encode())]
+        out += [(k.encode(), v.encode("latin-1")) for k, v in kept.items()]
+        if encoding != "identity":
+            out.append((b"content-encoding", encoding.encode()))
+        await self._send(send, scope["method"], body, out)
+
+    async def _serve_file(self, scope, send, relative):
+        root = os.path.realpath(self.directory)
+        target = os.path.realpath(os.path.join(root, relative))
+        if not target.startswith(root + os.sep) or not os.path.isfile(target):
+            await send({"type": "http.response.start", "status": 404,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": b'{"detail":"Not Found"}'})
+            return
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        out = [(b"content-type", b"application/json" if target.endswith(".json") else b"application/octet-stream"),
+               (b"vary", b"Accept-Encoding")]
+        if os.path.basename(target) == "current.json":
+            out.append((b"cache-control", b"no-cache"))  # the only mutable file
+        else:
+            out.append((b"cache-control", IMMUTABLE))
+            available = [e for e, suffix in (("br", ".br"), ("gzip", ".gz")) if os.path.isfile(target + suffix)]
+            encoding = _pick(headers.get("accept-encoding", ""), available)
+            if encoding != "identity":
+                target += {"br": ".br", "gzip": ".gz"}[encoding]
+                out.append((b"content-encoding", encoding.encode()))
+        with open(target, "rb") as f:
+            body = f.read()
+        await self._send(send, scope["method"], body, out)
+
+
+def _pick(accept_encoding, available):
+    accepted = accepted_encodings(accept_encoding)
+    candidates = [e for e in ("br", "gzip") if e in accepted and e in available]
+    return max(candidates, key=lambda e: accepted[e], default="identity")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render every dashboard payload to static files")
+    parser.add_argument("--out", default=STATIC_EXPORT_DIR, help="export directory")
+    parser.add_argument("--force", action="store_true", help="re-render even if this version is exported")
+    parser.add_argument("--keep", type=int, default=STATIC_EXPORT_KEEP, help="version directories to keep")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(export(args.out, args.force, args.keep)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
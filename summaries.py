@@ -0,0 +1,211 @@
+"""
+Summary tables kept up to date by the loader.
+
+    agg_visits_site_month    <- factvisits       (visit counts by status, eDiary, AEs, medication)
+    agg_quality_site_month   <- factdataquality  (query counts, completeness, timeliness)
+    rollup_visits_site_day   <- factvisits       (site x day x visit status)
+    rollup_quality_site_day  <- factdataquality  (site x day)
+
+Every measure is an additive sum, so a delta batch is applied by adding
+the contributions of the incoming rows and subtracting those of the rows
+they replace. Only the groups the batch touches are written, whatever the
+size of the history. Averages are derived at read time
+(e.g. medication_taken_sum / medication_n).
+
+The site x day rollups back the query layer in kpis.ROLLUP_SQL. Backfill
+them on an existing database with:
+
+    python summaries.py --rebuild
+"""
+import argparse
+
+# fact table -> [(summary table, group key, DDL, contribution SELECT)]
+# The SELECT reads from {source} and scales every measure by {sign}.
+SUMMARIES = {
+    "factvisits": [(
+        "agg_visits_site_month",
+        ("siteid", "month"),
+        """
+            siteid               text NOT NULL,
+            month                date NOT NULL,
+            total_visits         bigint NOT NULL,
+            completed            bigint NOT NULL,
+            missed               bigint NOT NULL,
+            rescheduled          bigint NOT NULL,
+            ediary_submitted     bigint NOT NULL,
+            ae_reported          bigint NOT NULL,
+            medication_taken_sum numeric NOT NULL,
+            PRIMARY KEY (siteid, month)
+        """,
+        """
+            SELECT siteid,
+                   date_trunc('month', visitdate)::date AS month,
+                   {sign} AS total_visits,
+                   {sign} * (visitstatus = 'Completed')::int AS completed,
+                   {sign} * (visitstatus = 'Missed')::int AS missed,
+                   {sign} * (visitstatus = 'Rescheduled')::int AS rescheduled,
+                   {sign} * (ediarysubmitted = 'Y')::int AS ediary_submitted,
+                   {sign} * (coalesce(ae_reported, 'None') <> 'None')::int AS ae_reported,
+                   {sign} * coalesce(medicationtakenpercent, 0) AS medication_taken_sum
+            FROM {source}
+            WHERE siteid IS NOT NULL AND visitdate IS NOT NULL
+        """,
+    ), (
+        "rollup_visits_site_day",
+        ("siteid", "day", "visitstatus"),
+        """
+            siteid               text NOT NULL,
+            day                  date NOT NULL,
+            visitstatus          text NOT NULL,
+            visits               bigint NOT NULL,
+            ediary_submitted     bigint NOT NULL,
+            ediary_not_submitted bigint NOT NULL,
+            ae_reported          bigint NOT NULL,
+            medication_taken_sum numeric NOT NULL,
+            medication_n         bigint NOT NULL,
+            PRIMARY KEY (siteid, day, visitstatus)
+        """,
+        """
+            SELECT siteid,
+                   visitdate AS day,
+                   coalesce(visitstatus, 'Unknown') AS visitstatus,
+                   {sign} AS visits,
+                   {sign} * (ediarysubmitted = 'Y')::int AS ediary_submitted,
+                   {sign} * (ediarysubmitted <> 'Y')::int AS ediary_not_submitted,
+                   {sign} * (coalesce(ae_reported, 'None') <> 'None')::int AS ae_reported,
+                   {sign} * coalesce(medicationtakenpercent, 0) AS medication_taken_sum,
+                   {sign} * (medicationtakenpercent IS NOT NULL)::int AS medication_n
+            FROM {source}
+            WHERE siteid IS NOT NULL AND visitdate IS NOT NULL
+        """,
+    )],
+    "factdataquality": [(
+        "agg_quality_site_month",
+        ("siteid", "month"),
+        """
+            siteid               text NOT NULL,
+            month                date NOT NULL,
+            days                 bigint NOT NULL,
+            query_count          bigint NOT NULL,
+            queries_open         bigint NOT NULL,
+            completeness_sum     numeric NOT NULL,
+            timeliness_sum       numeric NOT NULL,
+            PRIMARY KEY (siteid, month)
+        """,
+        """
+            SELECT siteid,
+                   date_trunc('month', date)::date AS month,
+                   {sign} AS days,
+                   {sign} * coalesce(querycount, 0) AS query_count,
+                   {sign} * coalesce(queriesopen, 0) AS queries_open,
+                   {sign} * coalesce(datacompletenesspct, 0) AS completeness_sum,
+                   {sign} * coalesce(timelinessscore, 0) AS timeliness_sum
+            FROM {source}
+            WHERE siteid IS NOT NULL AND date IS NOT NULL
+        """,
+    ), (
+        "rollup_quality_site_day",
+        ("siteid", "day"),
+        """
+            siteid               text NOT NULL,
+            day                  date NOT NULL,
+            records              bigint NOT NULL,
+            query_count          bigint NOT NULL,
+            queries_open         bigint NOT NULL,
+            completeness_sum     numeric NOT NULL,
+            completeness_n       bigint NOT NULL,
+            timeliness_sum       numeric NOT NULL,
+            timeliness_n         bigint NOT NULL,
+            PRIMARY KEY (siteid, day)
+        """,
+        """
+            SELECT siteid,
+                   date AS day,
+                   {sign} AS records,
+                   {sign} * coalesce(querycount, 0) AS query_count,
+                   {sign} * coalesce(queriesopen, 0) AS queries_open,
+                   {sign} * coalesce(datacompletenesspct, 0) AS completeness_sum,
+                   {sign} * (datacompletenesspct IS NOT NULL)::int AS completeness_n,
+                   {sign} * coalesce(timelinessscore, 0) AS timeliness_sum,
+                   {sign} * (timelinessscore IS NOT NULL)::int AS timeliness_n
+            FROM {source}
+            WHERE siteid IS NOT NULL AND date IS NOT NULL
+        """,
+    )],
+}
+
+
+def _measures(ddl: str, key):
+    names = [line.split()[0] for line in ddl.strip().splitlines() if line.strip() and not line.strip().startswith("PRIMARY")]
+    return [n for n in names if n not in key]
+
+
+def ensure_summaries(cur):
+    for specs in SUMMARIES.values():
+        for table, _, ddl, _ in specs:
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {table} ({ddl});")
+
+
+def rebuild(cur, fact_tables):
+    """Recompute the summaries of the given fact tables from scratch (full loads)."""
+    for fact in fact_tables:
+        for table, key, ddl, select in SUMMARIES.get(fact, ()):
+            measures = _measures(ddl, key)
+            sums = ", ".join(f"sum({m})" for m in measures)
+            cur.execute(f"TRUNCATE {table};")
+            cur.execute(f"""
+                INSERT INTO {table} ({', '.join(key)}, {', '.join(measures)})
+                SELECT {', '.join(key)}, {sums}
+                FROM ({select.format(source=fact, sign=1)}) c
+                GROUP BY {', '.join(key)};
+            """)
+
+
+def apply_delta(cur, fact, removed: str, added: str):
+    """
+    Fold a delta into the summaries of `fact`: subtract the rows in the
+    relation `removed` (the versions being replaced), add those in `added`.
+    Returns the number of summary groups touched.
+    """
+    touched = 0
+    for table, key, ddl, select in SUMMARIES.get(fact, ()):
+        measures = _measures(ddl, key)
+        sums = ", ".join(f"sum({m})" for m in measures)
+        updates = ", ".join(f"{m} = {table}.{m} + EXCLUDED.{m}" for m in measures)
+        cur.execute(f"""
+            INSERT INTO {table} ({', '.join(key)}, {', '.join(measures)})
+            SELECT {', '.join(key)}, {sums}
+            FROM ({select.format(source=removed, sign=-1)}
+                  UNION ALL
+                  {select.format(source=added, sign=1)}) c
+            GROUP BY {', '.join(key)}
+            ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}
+            RETURNING {', '.join(key)}, {measures[0]};
+        """)
+        groups = cur.fetchall()
+        touched += len(groups)
+        # a group whose rows all moved elsewhere nets out to zero: drop it by
+        # key, so the delete costs what the delta touched, not the table size
+        emptied = tuple(g[:-1] for g in groups if g[-1] == 0)
+        if emptied:
+            cur.execute(f"DELETE FROM {table} WHERE ({', '.join(key)}) IN %s;", (emptied,))
+    return touched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the summary / rollup tables")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every summary from the fact tables")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        from database import get_connection
+
+        conn = get_connection()
+        try:
+            with conn.cursor() as cur:
+                ensure_summaries(cur)
+                rebuild(cur, list(SUMMARIES))
+            conn.commit()
+        finally:
+            conn.close()
+        print("rebuilt", ", ".join(t for specs in SUMMARIES.values() for t, *_ in specs))
@@ -0,0 +1,79 @@
+import pytest
+
+ALERT_COLUMNS = "rule, siteid, day, value, baseline_mean, baseline_stddev, zscore"
+
+
+@pytest.fixture
+def cur():
+    pytest.importorskip("psycopg2")
+    from database import get_connection
+
+    try:
+        conn = get_connection()
+    except Exception as e:
+        pytest.skip(f"no Postgres to evaluate on ({str(e).splitlines()[0]})")
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('rollup_visits_site_day') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            pytest.skip("no rollups in this database")
+        yield cur
+    conn.rollback()  # nothing a test does is kept
+    conn.close()
+
+
+def _alerts(cur):
+    cur.execute(f"SELECT {ALERT_COLUMNS} FROM alerts ORDER BY rule, siteid, day;")
+    return cur.fetchall()
+
+
+def _delta(cur, sql):
+    import ingest
+
+    cur.execute("CREATE TEMP TABLE factvisits_staging (LIKE factvisits INCLUDING DEFAULTS) ON COMMIT DROP;")
+    cur.execute(f"INSERT INTO factvisits_staging {sql};")
+    ingest.merge_delta(cur, "factvisits")
+
+
+def test_every_day_of_the_series_is_evaluated(cur):
+    import alerts
+
+    alerts.ensure_alerts(cur)
+    report = alerts.evaluate(cur, full=True)
+
+    cur.execute("""
+        SELECT count(DISTINCT siteid), sum(last_day - first_day + 1)
+        FROM (SELECT siteid, min(day) AS first_day,
+                     (SELECT max(day) FROM rollup_visits_site_day) AS last_day
+              FROM rollup_visits_site_day GROUP BY siteid) t;
+    """)
+    sites, days = cur.fetchone()
+    assert report["sites"] >= sites and report["days"] >= days
+    cur.execute("SELECT count(*) FROM rollup_visits_site_day GROUP BY siteid, day;")
+    assert report["days"] > len(cur.fetchall())  # days without visits are in it
+
+
+@pytest.mark.parametrize("delta", [
+    # a few visits of one site-day turn into misses
+    """SELECT visitid, patientpk, siteid, visitdate, 'Missed', ediarysubmitted, medicationtakenpercent,
+              ae_reported
+       FROM factvisits WHERE siteid = 'S002' AND visitdate = (SELECT max(visitdate) - 40 FROM factvisits)""",
+    # misses at one site after the last day: every other site gets days without visits
+    """SELECT 'DELTA' || g, 1, 'S001', (SELECT max(visitdate) FROM factvisits) + 1 + g / 5, 'Missed', 'N', 0,
+              'None'
+       FROM generate_series(0, 24) g""",
+    # a site's history starts earlier
+    """SELECT 'EARLY', 1, 'S003', (SELECT min(visitdate) - 60 FROM factvisits WHERE siteid = 'S003'),
+              'Missed', 'N', 0, 'None'""",
+])
+def test_delta_evaluation_matches_a_full_one(cur, delta):
+    import alerts
+
+    alerts.ensure_alerts(cur)
+    alerts.evaluate(cur, full=True)
+    _delta(cur, delta)
+    report = alerts.evaluate(cur)
+    incremental = _alerts(cur)
+
+    full = alerts.evaluate(cur, full=True)
+    assert _alerts(cur) == incremental
+    assert report["days"] < full["days"]
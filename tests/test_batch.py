@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+import batch
+from cache import TTLCache
+
+
+@pytest.fixture
+def statements(monkeypatch):
+    """Fake database: records the views each statement reads and returns one row per view."""
+    runs = []
+
+    def combined_sql(queries):
+        return tuple(queries), ()
+
+    async def fetch_all(sql, params=None, cached=True):
+        runs.append(list(sql))
+        await asyncio.sleep(0.01)
+        return [{"metric": view, "data": json.dumps([{"view": view}])} for view in sql]
+
+    monkeypatch.setattr(batch, "combined_sql", combined_sql)
+    monkeypatch.setattr(batch.database, "fetch_all", fetch_all)
+    return runs
+
+
+def test_misses_registered_together_share_one_statement(statements):
+    b = batch._Batch()
+
+    async def main():
+        return await asyncio.gather(b.load("v_a", "", ()), b.load("v_b", "", ()))
+
+    assert asyncio.run(main()) == [[{"view": "v_a"}], [{"view": "v_b"}]]
+    assert statements == [["v_a", "v_b"]] and b.statements == 1
+
+
+def test_miss_registered_after_the_statement_started_gets_its_own_run(statements):
+    b = batch._Batch()
+
+    async def main():
+        first = asyncio.ensure_future(b.load("v_a", "", ()))
+        await asyncio.sleep(0.005)  # the first run is in flight now
+        late = [asyncio.ensure_future(b.load(v, "", ())) for v in ("v_b", "v_c")]
+        return await asyncio.gather(first, *late)
+
+    assert asyncio.run(main()) == [[{"view": "v_a"}], [{"view": "v_b"}], [{"view": "v_c"}]]
+    assert statements == [["v_a"], ["v_b", "v_c"]]
+
+
+def test_fetch_metrics_reads_each_view_once(statements, monkeypatch):
+    async def view_query(view, filters=None, columns="*"):
+        return f"SELECT * FROM {view};", None
+
+    monkeypatch.setattr(batch, "view_query", view_query)
+    monkeypatch.setattr(batch, "result_cache", TTLCache(ttl=60, max_entries=64))
+    ids = ["exec.kpis", "siteanalysis.patients_bar", "siteanalysis.top_performer", "exec.kpis"]
+
+    results, stats = asyncio.run(batch.fetch_metrics(ids))
+    assert results["exec.kpis"] == {"view": "v_exec_kpis"}
+    assert results["siteanalysis.patients_bar"] == [{"view": "v_site_patients_bar"}]
+    assert stats["views"] == 3 and stats["statements"] == 1
+
+    # all cached now: no statement at all
+    _, stats = asyncio.run(batch.fetch_metrics(ids))
+    assert stats["statements"] == 0
+
+
+def test_patient_detail_table_is_not_a_batch_metric():
+    # it is only ever read a page at a time; a batch would aggregate the whole table
+    with pytest.raises(HTTPException) as raised:
+        batch.resolve_ids(["adherence.patient_details"])
+    assert raised.value.status_code == 400
+    assert all(view != "v_pa_patient_details_table" for view, _, _ in batch.METRICS.values())
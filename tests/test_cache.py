@@ -0,0 +1,138 @@
+import asyncio
+import threading
+
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    from conftest import Clock
+
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    c = TTLCache(ttl=10, max_entries=8)
+    calls = []
+    load = lambda: calls.append(1) or len(calls)
+
+    assert c.get_or_load("k", load) == 1
+    clock.advance(9.9)
+    assert c.get_or_load("k", load) == 1
+    clock.advance(0.2)
+    assert c.get_or_load("k", load) == 2
+    assert (c.hits, c.misses) == (1, 2)
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    c = TTLCache(ttl=60, max_entries=2)
+    c.get_or_load("a", lambda: "a")
+    c.get_or_load("b", lambda: "b")
+    c.get_or_load("a", lambda: "stale")       # hit: "a" is now the most recent
+    c.get_or_load("c", lambda: "c")           # evicts "b"
+
+    assert c.evictions == 1
+    assert c.get_or_load("a", lambda: "reloaded") == "a"
+    assert c.get_or_load("b", lambda: "reloaded") == "reloaded"
+
+
+def test_invalidate_by_view():
+    c = TTLCache(ttl=60, max_entries=8)
+    key_a = c.make_key(cache.ViewSQL("WITH x AS (SELECT 1) SELECT * FROM x", "v_a"), (1,))
+    key_b = c.make_key("SELECT * FROM v_b")
+    c.get_or_load(key_a, lambda: 1)
+    c.get_or_load(key_b, lambda: 2)
+
+    assert key_a[0] == "v_a" and key_b[0] == "v_b"
+    assert c.invalidate(["V_A"]) == 1
+    assert c.stats()["views"] == ["v_b"]
+
+
+def test_concurrent_misses_load_once():
+    c = TTLCache(ttl=60, max_entries=8)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(c.get_or_load("k", loader)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(c.get_or_load("k", loader))) for _ in range(4)]
+    for t in followers:
+        t.start()
+    while c.stats()["coalesced"] < 4:
+        threading.Event().wait(0.001)
+    release.set()
+    for t in [leader, *followers]:
+        t.join(5)
+
+    assert results == ["value"] * 5
+    assert len(calls) == 1
+    assert (c.misses, c.coalesced) == (1, 4)
+
+
+def test_failed_load_reaches_waiters_and_is_not_cached():
+    c = TTLCache(ttl=60, max_entries=8)
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def failing():
+            await gate.wait()
+            raise RuntimeError("boom")
+
+        tasks = [asyncio.create_task(c.get_or_load_async("k", failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    outcome = asyncio.run(main())
+    assert [type(e) for e in outcome] == [RuntimeError] * 3
+    assert c.coalesced == 2
+    assert c.stats()["entries"] == 0
+
+
+def test_async_concurrent_misses_load_once():
+    c = TTLCache(ttl=60, max_entries=8)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"rows": 1}
+
+    async def main():
+        return await asyncio.gather(*(c.get_or_load_async("k", loader) for _ in range(5)))
+
+    assert asyncio.run(main()) == [{"rows": 1}] * 5
+    assert len(calls) == 1
+
+
+def test_invalidation_in_one_worker_reaches_the_others(clock, tmp_path):
+    from result_store import SqliteStore
+
+    path = str(tmp_path / "results.sqlite")
+    worker_a = TTLCache(ttl=60, max_entries=8, shared=SqliteStore(path=path))
+    worker_b = TTLCache(ttl=60, max_entries=8, shared=SqliteStore(path=path))
+    key = ("v_exec_kpis", "SELECT * FROM v_exec_kpis;", ())
+
+    assert worker_a.get_or_load(key, lambda: "old") == "old"
+    assert worker_b.get_or_load(key, lambda: "unused") == "old"   # from the shared store
+    worker_b.invalidate(["v_exec_kpis"])
+
+    # within the sync interval worker A still answers from its own cache
+    assert worker_a.get_or_load(key, lambda: "new") == "old"
+    clock.advance(cache.CACHE_SHARED_SYNC_SECONDS + 0.1)
+    assert worker_a.get_or_load(key, lambda: "new") == "new"
+    assert worker_b.get_or_load(key, lambda: "unused") == "new"
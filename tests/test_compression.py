@@ -0,0 +1,43 @@
+import pytest
+
+import compression
+from compression import accepted_encodings, choose_encoding
+
+
+@pytest.fixture
+def no_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", object())
+
+
+def test_accepted_encodings_parses_q_values():
+    assert accepted_encodings("gzip;q=0.5, br, identity;q=0, deflate;q=bad") == {"gzip": 0.5, "br": 1.0}
+    assert accepted_encodings("") == {}
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", "gzip"),
+    ("gzip, deflate, br", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("GZIP;Q=0", None),
+    ("br;q=0.5, gzip;q=1.0", "gzip"),
+    ("br;q=0.8, gzip;q=0.8", "br"),
+    ("identity", None),
+    ("", None),
+])
+def test_choose_encoding_with_brotli(with_brotli, header, expected):
+    assert choose_encoding(header) == expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, br", "gzip"),
+    ("br", None),
+    ("br, gzip;q=0", None),
+])
+def test_choose_encoding_without_brotli(no_brotli, header, expected):
+    assert choose_encoding(header) == expected
@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+import duckdb
+import pytest
+from fastapi import HTTPException
+
+from routers.adherence import decode_cursor, encode_cursor, seek_predicate
+
+ORDER_DESC = "adherence_rate DESC NULLS LAST, patientpk ASC"
+ORDER_ASC = "adherence_rate ASC NULLS FIRST, patientpk DESC"
+
+ROWS = [
+    ("P01", Decimal("95.50")), ("P02", Decimal("87.25")), ("P03", Decimal("87.25")),
+    ("P04", None), ("P05", Decimal("100.00")), ("P06", Decimal("0.00")),
+    ("P07", None), ("P08", Decimal("87.25")), ("P09", Decimal("42.10")), ("P10", Decimal("95.50")),
+]
+
+
+def test_cursor_round_trip():
+    row = {"adherence_rate": Decimal("87.25"), "patientpk": "P02"}
+    assert decode_cursor(encode_cursor(row, "next")) == (Decimal("87.25"), "P02", "next")
+    assert decode_cursor(encode_cursor(row, "prev")) == (Decimal("87.25"), "P02", "prev")
+
+
+def test_cursor_keeps_decimal_exact():
+    rate, _, _ = decode_cursor(encode_cursor({"adherence_rate": Decimal("33.333333333333333333"),
+                                              "patientpk": "P01"}, "next"))
+    assert isinstance(rate, Decimal)
+    assert rate == Decimal("33.333333333333333333")
+
+
+def test_cursor_null_rate():
+    token = encode_cursor({"adherence_rate": None, "patientpk": "P04"}, "next")
+    assert decode_cursor(token) == (None, "P04", "next")
+    assert "=" not in token
+
+
+@pytest.mark.parametrize("token", ["", "not-base64!", "eyJyIjogMX0", "eyJyIjogIjEiLCAiayI6ICJQMSIsICJkIjogInVwIn0"])
+def test_invalid_cursor_is_400(token):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(token)
+    assert e.value.status_code == 400
+
+
+def test_seek_predicate_null_directions():
+    assert seek_predicate(None, "P04", "next") == ("adherence_rate IS NULL AND patientpk > %s", ("P04",))
+    assert seek_predicate(None, "P04", "prev") == ("(adherence_rate IS NOT NULL OR patientpk < %s)", ("P04",))
+
+
+@pytest.fixture
+def patients():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE t (patientpk text, adherence_rate decimal(5, 2));")
+    con.executemany("INSERT INTO t VALUES (?, ?);", ROWS)
+    yield con
+    con.close()
+
+
+def _page(con, cursor_row, direction, size):
+    where, params = seek_predicate(cursor_row[1], cursor_row[0], direction)
+    order = ORDER_DESC if direction == "next" else ORDER_ASC
+    where = where.replace("%s", "?")  # DuckDB placeholders
+    rows = con.execute(f"SELECT patientpk, adherence_rate FROM t WHERE {where} ORDER BY {order} LIMIT ?;",
+                       [*params, size]).fetchall()
+    return rows if direction == "next" else rows[::-1]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4])
+def test_keyset_pages_match_offset_order(patients, size):
+    expected = patients.execute(f"SELECT patientpk, adherence_rate FROM t ORDER BY {ORDER_DESC};").fetchall()
+
+    # forwards from the first page, across the ties and into the NULLs
+    pages = [expected[:size]]
+    while True:
+        page = _page(patients, pages[-1][-1], "next", size)
+        if not page:
+            break
+        pages.append(page)
+    assert [row for page in pages for row in page] == expected
+
+    # and back again from the last page
+    back = [pages[-1]]
+    while True:
+        page = _page(patients, back[-1][0], "prev", size)
+        if not page:
+            break
+        back.append(page)
+    assert [row for page in reversed(back) for row in page] == expected
@@ -0,0 +1,199 @@
+import pytest
+
+import database
+from database import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.conn.checks += 1
+        if self.conn.broken:
+            raise database.psycopg2.OperationalError("server closed the connection")
+
+
+class FakeConnection:
+    def __init__(self, name):
+        self.name = name
+        self.closed = 0
+        self.broken = False
+        self.checks = 0
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    from conftest import Clock
+
+    clock = Clock()
+    monkeypatch.setattr(database.time, "monotonic", clock)
+    return clock
+
+
+def make_pool(**kwargs):
+    opened = []
+
+    def connect():
+        opened.append(FakeConnection(f"c{len(opened) + 1}"))
+        return opened[-1]
+
+    settings = dict(min_size=0, max_size=2, acquire_timeout=0.05, max_lifetime=60, health_check_after=10)
+    settings.update(kwargs)
+    return ConnectionPool(connect=connect, **settings), opened
+
+
+def test_idle_connection_is_reused(clock):
+    pool, opened = make_pool()
+    conn = pool.acquire()
+    pool.release(conn)
+    clock.advance(1)
+
+    assert pool.acquire() is conn
+    assert len(opened) == 1 and conn.checks == 0 and conn.autocommit
+
+
+def test_connection_past_max_lifetime_is_recycled(clock):
+    pool, opened = make_pool(max_lifetime=60, health_check_after=1000)
+    first = pool.acquire()
+    pool.release(first)
+    clock.advance(61)
+
+    second = pool.acquire()
+    assert second is not first and first.closed
+    assert pool.stats()["recycled_total"] == 1
+    assert pool.stats()["size"] == 1
+
+
+def test_expired_connection_is_closed_on_release(clock):
+    pool, _ = make_pool(max_lifetime=60)
+    conn = pool.acquire()
+    clock.advance(61)
+    pool.release(conn)
+
+    assert conn.closed
+    assert pool.stats()["idle"] == 0 and pool.stats()["recycled_total"] == 1
+
+
+def test_idle_connection_is_health_checked(clock):
+    pool, opened = make_pool(health_check_after=10)
+    conn = pool.acquire()
+    pool.release(conn)
+    clock.advance(11)
+
+    assert pool.acquire() is conn
+    assert conn.checks == 1
+
+
+def test_failed_health_check_replaces_the_connection(clock):
+    pool, opened = make_pool(health_check_after=10)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.broken = True
+    clock.advance(11)
+
+    replacement = pool.acquire()
+    assert replacement is not conn and conn.closed and len(opened) == 2
+    stats = pool.stats()
+    assert stats["failed_health_checks_total"] == 1
+    assert (stats["size"], stats["in_use"]) == (1, 1)
+
+
+def test_acquire_times_out_when_the_pool_is_exhausted():
+    pool, _ = make_pool(max_size=1, acquire_timeout=0.05)
+    pool.acquire()
+
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()["timeouts_total"] == 1
+
+
+def test_discarded_connection_frees_its_slot():
+    pool, opened = make_pool(max_size=1)
+    conn = pool.acquire()
+    pool.release(conn, discard=True)
+
+    assert conn.closed
+    assert pool.acquire() is opened[1]
+
+
+def test_closeall_closes_idle_connections():
+    pool, opened = make_pool()
+    a, b = pool.acquire(), pool.acquire()
+    pool.release(a)
+    pool.closeall()
+
+    assert a.closed and not b.closed
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    pool.release(b)
+    assert b.closed
+
+
+class FakeStreamConnection(FakeConnection):
+    def cursor(self, name=None):
+        return FakeStreamCursor(self)
+
+
+class FakeStreamCursor(FakeCursor):
+    description = [type("Column", (), {"name": "visitid"})]
+
+    def execute(self, sql, params):
+        self.rows = [("V1",), ("V2",), ("V3",)]
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+@pytest.fixture
+def exports(monkeypatch):
+    opened = []
+
+    def connect():
+        opened.append(FakeStreamConnection(f"e{len(opened) + 1}"))
+        return opened[-1]
+
+    monkeypatch.setattr(database, "DB_MODE", "sync")
+    monkeypatch.setattr(database, "get_connection", connect)
+    monkeypatch.setattr(database, "get_pool", lambda: pytest.fail("exports must not borrow pooled connections"))
+    monkeypatch.setattr(database, "_export_slots", database.threading.BoundedSemaphore(1))
+    monkeypatch.setattr(database, "POOL_ACQUIRE_TIMEOUT", 0.01)
+    return opened
+
+
+def test_export_streams_on_its_own_connection(exports):
+    assert list(database.stream_query("SELECT visitid FROM factvisits", batch_size=2)) == [
+        ["visitid"], [("V1",), ("V2",)], [("V3",)]]
+    assert len(exports) == 1 and exports[0].closed
+
+
+def test_concurrent_exports_are_capped(exports):
+    first = database.stream_query("SELECT 1")
+    next(first)
+    with pytest.raises(database.ExportsBusy):
+        database.stream_query("SELECT 1")
+
+    first.close()
+    assert exports[0].closed
+    database.stream_query("SELECT 1").close()
+
+
+def test_unstarted_export_frees_its_slot(exports):
+    stream = database.stream_query("SELECT 1")
+    del stream  # e.g. the client went away before the body was sent
+
+    database.stream_query("SELECT 1").close()
@@ -0,0 +1,63 @@
+import pickle
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+from result_store import SqliteStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SqliteStore(path=str(tmp_path / "results.sqlite"))
+
+
+def test_values_round_trip_with_their_types(store):
+    rows = [{"siteid": "S001", "rate": Decimal("86.10"), "day": date(2025, 3, 1),
+             "refreshed_at": datetime(2025, 3, 2, 4, 5, 6, tzinfo=timezone.utc), "n": 3, "x": None}]
+    store.set(("view", "sql", ()), rows, ttl=60)
+
+    assert store.get(("view", "sql", ())) == (True, rows)
+    found = store.get(("view", "sql", ()))[1][0]
+    assert type(found["rate"]) is Decimal and type(found["day"]) is date
+    assert store.get(("view", "sql", (1,))) == (False, None)
+
+
+def test_values_are_stored_as_json(store):
+    store.set(("view", "sql", ()), {"a": [1, 2]}, ttl=60)
+    blob = store._conn.execute("SELECT value FROM results;").fetchone()[0]
+    assert bytes(blob) == b'{"a":[1,2]}'
+
+
+def test_pickled_entries_are_misses_not_loaded(store):
+    class Boom:
+        def __reduce__(self):
+            return (exec, ("raise SystemExit('unpickled')",))
+
+    store.set(("view", "sql", ()), [], ttl=60)
+    store._conn.execute("UPDATE results SET value = ?;", (pickle.dumps(Boom()),))
+
+    assert store.get(("view", "sql", ())) == (False, None)
+    assert store.errors == 0
+
+
+def test_values_that_are_not_json_stay_local(store):
+    store.set(("view", "sql", ()), {"a": object()}, ttl=60)
+
+    assert store.get(("view", "sql", ())) == (False, None)
+    assert store.errors == 0
+
+
+def test_expiry_is_indexed(store):
+    store.get(("view", "sql", ()))
+    indexes = {r[1] for r in store._conn.execute("PRAGMA index_list(results);")}
+    assert "results_expires_idx" in indexes
+
+
+def test_invalidation_bumps_the_shared_generation(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    one, other = SqliteStore(path=path), SqliteStore(path=path)
+    before = other.generation()
+
+    assert one.invalidate(["view"]) == before + 1
+    assert other.generation() == before + 1
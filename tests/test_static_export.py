@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import pytest
+
+import static_export
+from static_export import EXPORT_SCOPE_KEY, StaticSnapshotMiddleware
+
+
+@pytest.fixture
+def middleware(tmp_path, monkeypatch):
+    version = tmp_path / "v1"
+    (version / "api" / "exec").mkdir(parents=True)
+    (version / "api" / "exec" / "kpis.json").write_bytes(b'{"from":"export"}')
+    (version / "manifest.json").write_text(json.dumps({"version": "v1", "paths": {
+        "/api/exec/kpis": {"file": "api/exec/kpis.json", "bytes": 17, "encodings": ["identity"], "headers": {}},
+        "/api/siteanalysis/charts": {"file": "api/exec/kpis.json", "bytes": 17, "encodings": ["identity"],
+                                     "headers": {"vary": "Accept"}}}}))
+    (tmp_path / "current.json").write_text('{"version": "v1"}')
+
+    async def current_version():
+        return "v1"
+
+    monkeypatch.setattr(static_export, "current_version", current_version)
+    monkeypatch.setattr(static_export, "STATIC_SERVE", True)
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b'{"from":"app"}'})
+
+    return StaticSnapshotMiddleware(app, directory=str(tmp_path))
+
+
+def _get(middleware, sent=None, **scope):
+    sent = [] if sent is None else sent
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/api/exec/kpis", "query_string": b"", "headers": [], **scope}
+    asyncio.run(middleware(scope, None, send))
+    return b"".join(m.get("body", b"") for m in sent)
+
+
+def test_unfiltered_gets_are_served_from_the_export(middleware):
+    assert _get(middleware) == b'{"from":"export"}'
+    assert _get(middleware, query_string=b"site_id=S001") == b'{"from":"app"}'
+
+
+def test_the_exporters_requests_reach_the_handlers(middleware):
+    assert _get(middleware, **{EXPORT_SCOPE_KEY: True}) == b'{"from":"app"}'
+    assert _get(middleware) == b'{"from":"export"}'  # other requests meanwhile are unaffected
+
+
+def test_negotiated_routes_keep_vary_accept(middleware):
+    sent = []
+    _get(middleware, sent, path="/api/siteanalysis/charts")
+    assert dict(sent[0]["headers"])[b"vary"] == b"Accept, Accept-Encoding"
+
+    sent = []
+    _get(middleware, sent)
+    assert dict(sent[0]["headers"])[b"vary"] == b"Accept-Encoding"
+
+
+def test_loads_refresh_an_existing_export_only(monkeypatch):
+    import ingest
+
+    exports = []
+
+    async def export():
+        exports.append(1)
+        return {"exported": True}
+
+    static_export_exists = [False]
+    monkeypatch.setattr(static_export, "export", export)
+    monkeypatch.setattr(static_export, "exported", lambda: static_export_exists[0])
+
+    assert ingest.refresh_static_export(log=lambda *_: None) is None  # nothing exported yet
+    assert ingest.refresh_static_export(always=True, log=lambda *_: None) == {"exported": True}
+    static_export_exists[0] = True
+    assert ingest.refresh_static_export(log=lambda *_: None) == {"exported": True}
+    assert len(exports) == 2
+
+
+def test_an_export_exists_once_current_json_is_written(tmp_path):
+    assert not static_export.exported(str(tmp_path))
+    (tmp_path / "current.json").write_text('{"version": "v1"}')
+    assert static_export.exported(str(tmp_path))
+
+
+def test_failed_refresh_is_reported_not_raised(tmp_path, monkeypatch):
+    import ingest
+
+    async def export():
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(static_export, "export", export)
+    report = ingest.refresh_static_export(always=True, log=lambda *_: None)
+    assert report == {"error": "RuntimeError: boom"}
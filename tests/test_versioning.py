@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+import versioning
+
+
+@pytest.fixture
+def database(monkeypatch):
+    state = {"generations": True, "generation": "18@2026-10-18 10:11:16+00", "snapshots": None,
+             "counters": [{"relname": "factvisits", "n_tup_ins": 5000, "n_tup_upd": 0, "n_tup_del": 0}]}
+
+    async def fetch_all(sql, params=None, cached=True):
+        if sql is versioning.MARKER_TABLES_SQL:
+            return [{"generations": state["generations"], "snapshots": True}]
+        if sql is versioning.VERSION_SQL:
+            return state["counters"]
+        assert versioning.SNAPSHOTS_SQL in sql
+        return [{"generation": state["generation"], "snapshots": state["snapshots"]}]
+
+    monkeypatch.setattr(versioning, "DB_MODE", "sync")
+    monkeypatch.setattr(versioning, "fetch_all", fetch_all)
+    monkeypatch.setattr(versioning, "_version", None)
+    return state
+
+
+def version():
+    versioning.expire()
+    return asyncio.run(versioning.current_version())
+
+
+def test_version_follows_the_load_generation_not_the_counters(database):
+    first = version()
+    database["counters"][0]["n_tup_ins"] = 0  # pg_stat_reset
+    assert version() == first
+
+    database["generation"] = "19@2026-10-18 11:00:00+00"
+    assert version() != first
+
+
+def test_snapshot_refresh_moves_the_version(database):
+    first = version()
+    database["snapshots"] = "v_exec_kpis@2026-10-18 11:05:00+00"
+    assert version() != first
+
+
+def test_counters_are_the_fallback_without_generations(database):
+    database["generation"] = None
+    first = version()
+    database["counters"][0]["n_tup_ins"] += 1
+    assert version() != first
+
+    database["generations"] = False  # no data_load_generation table at all
+    assert version() == version()
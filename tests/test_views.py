@@ -0,0 +1,175 @@
+"""
+kpis.VIEW_SQL against what the dashboard reads: column names and labels
+on the embedded engine, and row-for-row against the live Postgres views
+when a database is reachable (DB_HOST / DB_NAME / DB_USER as for the app).
+"""
+from datetime import date
+
+import pytest
+
+from embedded import _normalized
+from kpis import ROLLUP_SQL, VIEW_SQL
+
+# columns the routers and the frontend read, by view
+FRONTEND_COLUMNS = {
+    "v_exec_kpis": ["total_unique_patients", "total_visits", "visit_completion_pct", "visit_missed"],
+    "v_exec_enrollment_gauge": ["total_enrolled", "total_target"],
+    "v_exec_visitstatus_donut": ["completed", "missed", "rescheduled"],
+    "v_exec_enrollment_trend": ["month_name", "monthly_enrollment"],
+    "v_pa_dropout_trend": ["month_name", "dropout_percentage"],
+    "v_pa_active_patient": ["Total_Active_Patients"],
+    "v_kpi1": ["total_visits", "screening_passed", "randomized", "total_ae_reported", "avg_medicationtakenpct"],
+    "tj_screenresult": ["scr_screenresult", "result_count"],
+    "tj_screenfailurreason": ["scr_reasonforfailure", "result_count"],
+    "tj_screensource": ["scr_sourcecrf", "result_count"],
+    "tj_weekly_site_visits": ["s_sitename", "month_name", "month_no", "month_label", "total_visits"],
+    "tj_category_distribution_site": ["s_sitename", "category", "count"],
+    "tj_ae_count": ["category", "count"],
+    "tj_ediary_submission": ["s_sitename", "submitted", "not_submitted"],
+    "om_kpi2": ["total_queries", "closed_queries", "open_queries", "avg_query_completeness", "avg_resolutontime"],
+    "tj_table": ["s_sitename", "randomized", "no_randomized", "avg_medication_take_percent",
+                 "avg_querycompleteness", "avg_timeliness"],
+}
+
+MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+
+
+@pytest.fixture(scope="module")
+def engine():
+    import embedded
+
+    return embedded.build_engine()
+
+
+def rows(con, sql, params=()):
+    cur = con.cursor()
+    cur.execute(sql.replace("%s", "?"), list(params))
+    columns = [d[0] for d in cur.description]
+    return [dict(zip(columns, r)) for r in cur.fetchall()]
+
+
+@pytest.mark.parametrize("view", sorted(FRONTEND_COLUMNS))
+def test_view_columns(engine, view):
+    assert list(rows(engine, f"SELECT * FROM {view} LIMIT 1;")[0]) == FRONTEND_COLUMNS[view]
+
+
+def test_month_labels(engine):
+    trend = rows(engine, "SELECT * FROM v_exec_enrollment_trend;")
+    assert [r["month_name"] for r in trend] == [m[:3] for m in MONTHS[:len(trend)]]
+    for r in rows(engine, "SELECT * FROM tj_weekly_site_visits;"):
+        assert r["month_name"] == r["month_label"] == MONTHS[r["month_no"] - 1]
+    for r in rows(engine, "SELECT * FROM v_pa_dropout_trend;"):
+        assert r["month_name"] in [m[:3] for m in MONTHS]
+
+
+class _Filters:
+    site_id, region, date_from, date_to = ["S001", "S003"], None, date(2025, 2, 1), date(2025, 6, 30)
+
+    def __bool__(self):
+        return True
+
+
+SITE_AND_DATES = _Filters()
+
+
+def test_filtered_definition_keeps_the_view_columns(engine):
+    from filters import with_clause
+
+    for view in FRONTEND_COLUMNS:
+        prefix, params = with_clause(view, SITE_AND_DATES)
+        filtered = rows(engine, f"{prefix}SELECT * FROM {view};", params)
+        live = rows(engine, f"SELECT * FROM {view} LIMIT 1;")
+        assert not filtered or list(filtered[0]) == list(live[0]), view
+
+
+@pytest.fixture(scope="module")
+def postgres():
+    psycopg2 = pytest.importorskip("psycopg2")
+    from database import get_connection
+
+    try:
+        conn = get_connection()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"no Postgres to compare with ({str(e).splitlines()[0]})")
+    conn.autocommit = True
+    yield conn
+    conn.close()
+
+
+def pg_rows(conn, sql):
+    from psycopg2.extras import RealDictCursor
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(sql)
+        return [dict(r) for r in cur.fetchall()]
+
+
+@pytest.mark.parametrize("view", sorted(VIEW_SQL))
+def test_definition_matches_live_view(postgres, view):
+    """The SQL filtered requests run must give the live view's columns and rows."""
+    try:
+        expected = pg_rows(postgres, f"SELECT * FROM public.{view};")
+    except Exception as e:
+        pytest.skip(f"{view} not in this database ({str(e).splitlines()[0]})")
+    actual = pg_rows(postgres, f"SELECT * FROM ({VIEW_SQL[view]}) t;")
+    assert [list(r) for r in actual[:1]] == [list(r) for r in expected[:1]]
+    assert _normalized(actual) == _normalized(expected)
+
+
+def _ordered(result):
+    return [list(r) for r in result[:1]], _normalized(result)
+
+
+@pytest.mark.parametrize("view", sorted(ROLLUP_SQL))
+def test_rollup_matches_view(engine, view):
+    assert _ordered(rows(engine, f"SELECT * FROM ({ROLLUP_SQL[view]}) t;")) == \
+        _ordered(rows(engine, f"SELECT * FROM {view};"))
+
+
+@pytest.mark.parametrize("view", sorted(ROLLUP_SQL))
+def test_filtered_rollup_matches_filtered_view(engine, view):
+    from filters import with_clause
+
+    prefix, params = with_clause(view, SITE_AND_DATES)
+    rollup_prefix, rollup_params = with_clause(view, SITE_AND_DATES, rollup=True)
+    assert _ordered(rows(engine, f"{rollup_prefix}SELECT * FROM {view};", rollup_params)) == \
+        _ordered(rows(engine, f"{prefix}SELECT * FROM {view};", params))
+
+
+def test_rollups_are_opt_in(monkeypatch):
+    import asyncio
+
+    import filters
+
+    async def no_database(*args, **kwargs):
+        raise AssertionError("rollups_ready() queried the database with rollups disabled")
+
+    monkeypatch.setattr(filters, "ROLLUPS_ENABLED", False)
+    monkeypatch.setattr(filters, "fetch_all", no_database)
+    assert asyncio.run(filters.rollups_ready()) is False
+
+
+def test_filtered_definition_must_match_the_live_views_columns(monkeypatch):
+    import asyncio
+
+    from fastapi import HTTPException
+
+    import filters
+
+    live = {"columns": ["total_enrolled", "total_target"], "data": [[], []]}
+
+    async def fetch_columns(sql, params=None):
+        return live if sql == "SELECT * FROM v_exec_enrollment_gauge LIMIT 0;" else {
+            "columns": ["total_enrolled", "target"], "data": [[], []]}
+
+    monkeypatch.setattr(filters, "DB_MODE", "sync")
+    monkeypatch.setattr(filters, "fetch_columns", fetch_columns)
+    monkeypatch.setattr(filters, "_matching_definitions", set())
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(filters.check_definition("v_exec_enrollment_gauge"))
+    assert e.value.status_code == 500 and "target" in e.value.detail
+
+    live["columns"] = ["total_enrolled", "target"]
+    asyncio.run(filters.check_definition("v_exec_enrollment_gauge"))
+    assert "v_exec_enrollment_gauge" in filters._matching_definitions
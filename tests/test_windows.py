@@ -0,0 +1,102 @@
+import asyncio
+from datetime import date
+
+import duckdb
+import pytest
+
+import visit_windows
+from visit_windows import compliance_query, parse_window
+
+
+@pytest.mark.parametrize("text, expected_days, window", [
+    ("Day 0 to 30", 0, (0, 30)),
+    ("Day 0-30", None, (0, 30)),
+    ("Day 0", 0, (0, 0)),
+    ("Day 28±3", 28, (25, 31)),
+    ("Day 28 +/- 3", 28, (25, 31)),
+    ("Day 90�7", 90, (83, 97)),          # ± decoded badly from the CSV
+    ("Final visit ±14 days", 180, (166, 194)),
+    ("Final visit", 180, (180, 180)),
+    ("", None, (0, 0)),
+    (None, 56, (56, 56)),
+])
+def test_parse_window(text, expected_days, window):
+    assert parse_window(text, expected_days) == window
+
+
+WINDOWS = [("VT01", "Screening", 0, 30), ("VT02", "Baseline", 0, 0),
+           ("VT03", "Week 4", 25, 31), ("VT04", "Month 3", 83, 97)]
+
+# patient -> [(day after enrollment, status)]
+VISITS = {
+    1: [(0, "Completed"), (28, "Completed"), (60, "Completed")],  # day 60: nearest is month 3, early
+    2: [(10, "Completed"), (28, "Missed")],
+    3: [(90, "Completed")],                                      # skipped everything before month 3
+    4: [(5, "Completed"), (40, "Rescheduled")],                  # day 40: late week 4; month 3 still open
+}
+
+
+@pytest.fixture
+def compliance(monkeypatch):
+    con = duckdb.connect()
+    con.execute("CREATE TABLE dimsite (siteid text, s_sitename text);")
+    con.execute("CREATE TABLE factenrollment (patientpk integer, siteid text, enrollmentdate date);")
+    con.execute("CREATE TABLE factvisits (visitid integer, patientpk integer, visitdate date, visitstatus text);")
+    con.execute("INSERT INTO dimsite VALUES ('S001', 'Site 1');")
+    con.execute("CREATE TABLE dimvisittype AS SELECT * FROM (VALUES "
+                + ", ".join(f"('{t}', '{n}')" for t, n, _, _ in WINDOWS) + ") t (visittypeid, visitname);")
+    visit_id = 0
+    for patient, visits in VISITS.items():
+        con.execute("INSERT INTO factenrollment VALUES (?, 'S001', DATE '2025-01-01');", [patient])
+        for day, status in visits:
+            visit_id += 1
+            con.execute("INSERT INTO factvisits VALUES (?, ?, DATE '2025-01-01' + ?, ?);",
+                        [visit_id, patient, day, status])
+
+    async def windows():
+        return WINDOWS
+
+    monkeypatch.setattr(visit_windows, "visit_windows", windows)
+
+    def run(by, as_of):
+        sql, params = asyncio.run(compliance_query(None, by, as_of))
+        cur = con.execute(sql.replace("%s", "?"), list(params))
+        names = [d[0] for d in cur.description]
+        return [dict(zip(names, row)) for row in cur.fetchall()]
+
+    return run
+
+
+def test_visits_are_matched_to_the_window_they_fall_in(compliance):
+    rows = {r["patientpk"]: r for r in compliance("patient", date(2025, 3, 20))}  # day 78
+
+    counts = lambda p: tuple(rows[p][k] for k in ("on_time", "early", "late", "missing", "upcoming"))
+    assert counts(1) == (3, 1, 0, 0, 0)
+    assert counts(2) == (1, 0, 0, 2, 1)
+    assert counts(3) == (0, 0, 0, 3, 1)  # day 90 is after as_of
+    assert counts(4) == (1, 0, 1, 1, 1)
+
+
+def test_skipped_visits_do_not_shift_later_windows(compliance):
+    rows = {r["patientpk"]: r for r in compliance("patient", date(2025, 6, 1))}
+
+    assert (rows[3]["on_time"], rows[3]["missing"]) == (1, 3)
+    assert (rows[1]["on_time"], rows[1]["early"], rows[1]["missing"]) == (3, 1, 0)
+
+
+def test_alert_rules_watch_known_measures():
+    from alerts import RULES, SITE_DAY_MEASURES
+
+    for rule, (measure, kind, op, limit, severity, minimum) in RULES.items():
+        assert measure in SITE_DAY_MEASURES, rule
+        assert kind in ("threshold", "zscore") and op in (">", ">=", "<", "<=")
+        assert severity in ("critical", "warning")
+
+
+def test_alert_rule_conditions():
+    from alerts import ALERT_MIN_HISTORY, _rule_sql
+
+    spike = _rule_sql("missed_visits_spike", "missed_visits", "zscore", ">=", 3, "warning", 2)
+    assert f"z.history >= {ALERT_MIN_HISTORY} AND z.zscore >= 3 AND z.value >= 2" in spike
+    high = _rule_sql("open_queries_high", "open_queries", "threshold", ">", 8, "critical", None)
+    assert "z.value > 8" in high and "history" not in high
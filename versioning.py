@@ -0,0 +1,156 @@
+"""
+Data-version marker and ETag / conditional GET support.
+
+The data version is a hash of the latest load generation (ingest.py
+bumps data_load_generation in every full or delta load's transaction)
+and the refresh times in snapshot_status. Both are transactional, so a
+committed load or snapshot refresh moves the version at once and a
+version never comes back. Databases never loaded by ingest.py fall back
+to Postgres' per-table modification counters (pg_stat_user_tables),
+which are reported late and reset by pg_stat_reset or a crash. The
+version is re-checked at most every DATA_VERSION_CHECK_SECONDS. When it
+moves, the result cache is dropped.
+
+ETagMiddleware tags every GET under /api with a strong ETag derived from
+the version and the request. A matching If-None-Match gets a 304 without
+touching the handler, so no query runs and nothing is serialized.
+ETAGS_ENABLED=0 turns it off (benchmarks/load_test.py does, to measure
+the handlers).
+"""
+import asyncio
+import hashlib
+import os
+import time
+
+from cache import result_cache
+from database import DB_MODE, fetch_all
+
+DATA_VERSION_CHECK_SECONDS = float(os.getenv("DATA_VERSION_CHECK_SECONDS", "5"))
+ETAGS_ENABLED = os.getenv("ETAGS_ENABLED", "1") not in ("0", "false", "False")
+
+VERSIONED_TABLES = (
+    "dimpatient", "dimsite", "dimvisittype",
+    "factvisits", "factenrollment", "factscreeningenrollment", "factdataquality",
+    "data_load_generation", "snapshot_status", "alerts",
+)
+
+MARKER_TABLES_SQL = """
+    SELECT to_regclass('public.data_load_generation') IS NOT NULL AS generations,
+           to_regclass('public.snapshot_status') IS NOT NULL AS snapshots;
+"""
+
+GENERATION_SQL = """
+    SELECT (SELECT generation || '@' || loaded_at FROM data_load_generation
+            ORDER BY generation DESC LIMIT 1) AS generation,
+           {snapshots} AS snapshots;
+"""
+SNAPSHOTS_SQL = "(SELECT string_agg(view_name || '@' || refreshed_at, ',' ORDER BY view_name) FROM snapshot_status)"
+
+# fallback when no load generation is recorded
+VERSION_SQL = """
+    SELECT relname, n_tup_ins, n_tup_upd, n_tup_del
+    FROM pg_stat_user_tables
+    WHERE schemaname = 'public' AND relname = ANY(%s)
+    ORDER BY relname;
+"""
+
+# paths that must always run (admin actions, live streams)
+UNVERSIONED_PREFIXES = ("/api/admin", "/api/live")
+
+_version = None
+_checked_at = 0.0
+_lock = None
+
+
+async def current_version():
+    """Short hex token that changes whenever the dashboard data may have changed."""
+    global _version, _checked_at, _lock
+    if _version is not None and time.monotonic() - _checked_at < DATA_VERSION_CHECK_SECONDS:
+        return _version
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        if _version is not None and time.monotonic() - _checked_at < DATA_VERSION_CHECK_SECONDS:
+            return _version
+        if DB_MODE == "embedded":
+            import embedded
+            _version, _checked_at = embedded.version(), time.monotonic()
+            return _version
+        version = hashlib.sha1((await _marker()).encode()).hexdigest()[:16]
+        if _version is not None and version != _version:
+            result_cache.invalidate()
+        _version, _checked_at = version, time.monotonic()
+        return _version
+
+
+async def _marker():
+    tables = (await fetch_all(MARKER_TABLES_SQL, cached=False))[0]
+    if tables["generations"]:
+        sql = GENERATION_SQL.format(snapshots=SNAPSHOTS_SQL if tables["snapshots"] else "NULL")
+        row = (await fetch_all(sql, cached=False))[0]
+        if row["generation"] is not None:
+            return f"generation:{row['generation']}|snapshots:{row['snapshots'] or ''}"
+    rows = await fetch_all(VERSION_SQL, (list(VERSIONED_TABLES),), cached=False)
+    return "counters:" + "|".join(
+        f"{r['relname']}:{r['n_tup_ins']}:{r['n_tup_upd']}:{r['n_tup_del']}" for r in rows
+    )
+
+
+def expire():
+    """Re-check the version on the next call (e.g. a load just announced itself)."""
+    global _checked_at
+    _checked_at = 0.0
+
+
+def make_etag(version: str, scope, headers: dict):
+    """Strong ETag for one representation: data version + URL + negotiated headers."""
+    h = hashlib.sha1()
+    for part in (scope["path"], scope.get("query_string", b"").decode("latin-1"),
+                 headers.get("accept", ""), headers.get("accept-encoding", "")):
+        h.update(part.encode("latin-1", "replace"))
+        h.update(b"\0")
+    return f'"{version}-{h.hexdigest()[:16]}"'
+
+
+def _matches(if_none_match: str, etag: str):
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+class ETagMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (not ETAGS_ENABLED or scope["type"] != "http" or scope["method"] not in ("GET", "HEAD")
+                or not scope["path"].startswith("/api") or scope["path"].startswith(UNVERSIONED_PREFIXES)):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            version = await current_version()
+        except Exception:
+            # no version marker available: serve normally, just without an ETag
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        etag = make_etag(version, scope, headers)
+        if _matches(headers.get("if-none-match", ""), etag):
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [(b"etag", etag.encode()), (b"cache-control", b"no-cache")],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                extra = [(b"etag", etag.encode()), (b"cache-control", b"no-cache")]
+                message = {**message, "headers": list(message["headers"]) + extra}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
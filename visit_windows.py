@@ -0,0 +1,175 @@
+"""
+Visit-window compliance: were protocol visits done inside their windows?
+
+Every enrolled patient is expected to have one visit of each type in
+DimVisitType, in VisitTypeID order (screening, baseline, week 4, ...).
+The window text gives the allowed days after EnrollmentDate:
+
+    "Day 0 to 30"           -> day 0 .. 30
+    "Day 0"                 -> day 0
+    "Day 28±3"              -> day 25 .. 31
+    "Final visit ±14 days"  -> ExpectedWindowDays ± 14
+
+FactVisits has no visit type, so visits are matched to windows by their
+day after enrollment: a visit belongs to every window that contains that
+day (a day-0 visit can be both screening and baseline). A done visit
+outside every window goes to the nearest window (the earlier one on a
+tie), where it counts as early or late. Extra or skipped visits
+therefore never shift the other visits' windows. Each scheduled visit is
+
+    on_time          a visit was done inside its window
+    early / late     none inside, the nearest out-of-window visit was
+                     before / after it
+    missing          no visit was done in or near the window and either
+                     one was recorded as Missed in it or it has closed
+    upcoming         no visit yet and the window is still open
+                     (not counted in the rates)
+
+Visits and closed windows are judged at `as_of`, by default the latest
+visit date in the data. Rates are shares of the due (non-upcoming) visits. The SQL runs
+unchanged on Postgres and on the embedded engine. Filters select
+patients by enrollment site / region / enrollment date.
+"""
+import re
+
+from fastapi import HTTPException
+
+from database import fetch_all
+from filters import predicates
+
+# grouping -> (select list, GROUP BY / ORDER BY list)
+GROUPINGS = {
+    "site": ("m.siteid, d.s_sitename", "m.siteid, d.s_sitename"),
+    "patient": ("m.patientpk, m.siteid", "m.patientpk, m.siteid"),
+    "visit_type": ("m.slot, m.visittypeid, m.visitname", "m.slot, m.visittypeid, m.visitname"),
+    "total": ("'all' AS scope", None),
+}
+
+_RANGE = re.compile(r"day\s*(\d+)\s*(?:to|-)\s*(\d+)", re.I)
+_TOLERANCE = re.compile(r"(?:day\s*(\d+))?\s*(?:±|\+/-|\ufffd)\s*(\d+)", re.I)  # \ufffd: ± decoded badly
+_DAY = re.compile(r"day\s*(\d+)", re.I)
+
+
+def parse_window(text, expected_days):
+    """(first day, last day) after enrollment allowed by a DimVisitType window."""
+    text = text or ""
+    m = _RANGE.search(text)
+    if m:
+        return int(m.group(1)), int(m.group(2))
+    m = _TOLERANCE.search(text)
+    if m:
+        day = int(m.group(1)) if m.group(1) else int(expected_days or 0)
+        return day - int(m.group(2)), day + int(m.group(2))
+    m = _DAY.search(text)
+    day = int(m.group(1)) if m else int(expected_days or 0)
+    return day, day
+
+
+COMPLIANCE_SQL = """
+WITH windows (visittypeid, first_day, last_day) AS (
+    VALUES {windows}
+),
+schedule_types AS (
+    SELECT t.visittypeid, t.visitname, w.first_day, w.last_day,
+           row_number() OVER (ORDER BY t.visittypeid) AS slot
+    FROM dimvisittype t
+    JOIN windows w ON w.visittypeid = t.visittypeid
+),
+schedule AS (
+    SELECT e.patientpk, e.siteid, e.enrollmentdate, t.*
+    FROM factenrollment e
+    CROSS JOIN schedule_types t{enrollment_where}
+),
+as_of AS (
+    SELECT coalesce(CAST(%s AS date), max(visitdate)) AS as_of FROM factvisits
+),
+visits AS (
+    SELECT v.patientpk, v.visitid, v.visitstatus, v.visitdate - e.enrollmentdate AS day
+    FROM factvisits v
+    JOIN factenrollment e ON e.patientpk = v.patientpk
+    JOIN as_of a ON v.visitdate <= a.as_of
+),
+in_window AS (
+    SELECT s.patientpk, s.slot,
+           count(*) FILTER (WHERE v.visitstatus <> 'Missed') AS done,
+           count(*) FILTER (WHERE v.visitstatus = 'Missed') AS missed
+    FROM schedule s
+    JOIN visits v ON v.patientpk = s.patientpk AND v.day BETWEEN s.first_day AND s.last_day
+    GROUP BY s.patientpk, s.slot
+),
+outside AS (
+    SELECT v.patientpk, v.visitid, t.slot,
+           CASE WHEN v.day < t.first_day THEN 'early' ELSE 'late' END AS timing,
+           greatest(t.first_day - v.day, v.day - t.last_day) AS distance
+    FROM visits v
+    CROSS JOIN schedule_types t
+    WHERE v.visitstatus <> 'Missed'
+      AND NOT EXISTS (SELECT 1 FROM schedule_types w WHERE v.day BETWEEN w.first_day AND w.last_day)
+),
+nearest AS (
+    SELECT o.*, row_number() OVER (PARTITION BY patientpk, visitid ORDER BY distance, slot) AS rank
+    FROM outside o
+),
+off_window AS (
+    SELECT patientpk, slot, timing,
+           row_number() OVER (PARTITION BY patientpk, slot ORDER BY distance, visitid) AS rank
+    FROM nearest
+    WHERE rank = 1
+),
+matched AS (
+    SELECT s.*,
+           CASE WHEN w.done > 0 THEN 'on_time'
+                WHEN o.timing IS NOT NULL THEN o.timing
+                WHEN w.missed > 0 OR a.as_of - s.enrollmentdate > s.last_day THEN 'missing'
+                ELSE 'upcoming' END AS compliance
+    FROM schedule s
+    CROSS JOIN as_of a
+    LEFT JOIN in_window w ON w.patientpk = s.patientpk AND w.slot = s.slot
+    LEFT JOIN off_window o ON o.patientpk = s.patientpk AND o.slot = s.slot AND o.rank = 1
+),
+counts AS (
+    SELECT {select},
+           count(*) FILTER (WHERE m.compliance <> 'upcoming') AS due,
+           count(*) FILTER (WHERE m.compliance = 'on_time') AS on_time,
+           count(*) FILTER (WHERE m.compliance = 'early') AS early,
+           count(*) FILTER (WHERE m.compliance = 'late') AS late,
+           count(*) FILTER (WHERE m.compliance = 'missing') AS missing,
+           count(*) FILTER (WHERE m.compliance = 'upcoming') AS upcoming
+    FROM matched m
+    LEFT JOIN dimsite d ON d.siteid = m.siteid
+    {group_by}
+)
+SELECT *,
+       round(100.0 * on_time / nullif(due, 0), 2) AS on_time_pct,
+       round(100.0 * early / nullif(due, 0), 2) AS early_pct,
+       round(100.0 * late / nullif(due, 0), 2) AS late_pct,
+       round(100.0 * missing / nullif(due, 0), 2) AS missing_pct
+FROM counts
+{order_by};
+"""
+
+
+async def visit_windows():
+    """[(visittypeid, visitname, first day, last day)] in schedule order."""
+    rows = await fetch_all('SELECT visittypeid, visitname, "window", expectedwindowdays '
+                           'FROM dimvisittype ORDER BY visittypeid;')
+    return [(r["visittypeid"], r["visitname"], *parse_window(r["window"], r["expectedwindowdays"]))
+            for r in rows]
+
+
+async def compliance_query(filters=None, by: str = "site", as_of=None):
+    """(sql, params) for visit-window compliance grouped by `by` (a GROUPINGS key)."""
+    select, keys = GROUPINGS[by]
+    windows = await visit_windows()
+    if not windows:
+        raise HTTPException(status_code=500, detail="DimVisitType has no visit windows")
+    where, params = ("", ()) if not filters else predicates(filters, "e.siteid", "e.enrollmentdate")
+    sql = COMPLIANCE_SQL.format(
+        windows=", ".join("(CAST(%s AS text), CAST(%s AS integer), CAST(%s AS integer))" for _ in windows),
+        select=select,
+        enrollment_where=where,
+        group_by=f"GROUP BY {keys}" if keys else "",
+        order_by=f"ORDER BY {', '.join(k.split('.')[-1] for k in keys.split(', '))}" if keys else "",
+    )
+    window_params = tuple(v for visittypeid, _, first, last in windows for v in (visittypeid, first, last))
+    return sql, window_params + params + (as_of,)
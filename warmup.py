@@ -0,0 +1,68 @@
+"""
+Startup warm-up: the first dashboard load after a rollout should be as
+fast as the hundredth.
+
+Runs in the background after startup and, until it finishes, /health
+answers 503 so the platform keeps routing traffic to the old instance:
+
+  1. PREPAREs the unfiltered query of every registered metric
+     (batch.METRICS covers every view the routers read, except the
+     paged patient detail table) on each pooled
+     connection, so no request pays for parsing and planning;
+  2. executes the hot set (WARMUP_VIEWS, default: all of them) once,
+     which pulls the pages of the heavy views into shared buffers and
+     fills the result cache / shared result store.
+
+WARMUP_ENABLED=0 skips it (ready immediately). A failure is logged and
+the instance reports ready anyway; the queries then just run cold.
+"""
+import asyncio
+import os
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+import database
+from batch import METRICS
+from filters import view_query
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") not in ("0", "false", "False")
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "120"))
+WARMUP_VIEWS = [v.strip().lower() for v in os.getenv("WARMUP_VIEWS", "").split(",") if v.strip()]
+
+state = {"ready": not WARMUP_ENABLED, "started_at": None, "seconds": None,
+         "prepared": 0, "warmed": 0, "error": None}
+_task = None
+
+
+def registry_queries():
+    """Distinct views behind the metric registry."""
+    return list(dict.fromkeys(view for view, _, _ in METRICS.values()))
+
+
+async def _warm_up():
+    views = registry_queries()
+    queries = {view: await view_query(view) for view in views}
+    state["prepared"] = await run_in_threadpool(database.prepare_on_idle_connections, list(queries.values()))
+    hot = {view: q for view, q in queries.items() if not WARMUP_VIEWS or view in WARMUP_VIEWS}
+    results, _ = await database.fetch_many(hot)
+    state["warmed"] = len(results)
+
+
+async def run():
+    started = time.monotonic()
+    state["started_at"] = time.time()
+    try:
+        await asyncio.wait_for(_warm_up(), WARMUP_TIMEOUT)
+    except Exception as e:
+        state["error"] = f"{type(e).__name__}: {e}"
+        print(f"Warning: warm-up failed, serving cold: {state['error']}")
+    state["seconds"] = round(time.monotonic() - started, 3)
+    state["ready"] = True
+
+
+def start():
+    """Start the warm-up in the background (startup hook)."""
+    global _task
+    if WARMUP_ENABLED and _task is None:
+        _task = asyncio.create_task(run())